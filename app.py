@@ -1,29 +1,47 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, flash
-import time, os, copy
+import time, os, copy, hashlib, json, threading
+from collections import OrderedDict
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from werkzeug.utils import secure_filename
-from elo import get_expected, get_k_for_robot, DEFAULT_RATING, DEFAULT_K, KO_WEIGHT
+from elo import match_ratings, replay_db, what_if, DEFAULT_RATING, DEFAULT_K, KO_WEIGHT, RESULTS
 from storage import (
-    load_db,
-    save_db,
+    view_db,
+    compact_journals,
     DB_FILES,
-    load_all,
+    view_all,
     load_schedule,
-    save_schedule,
     export_stats_csv,
+    STAT_KEYS,
+    blank_robot_stats,
+    robot_stats_record,
     load_judging_state,
-    save_judging_state,
-    update_judging_state,
+    document_versions,
+    transaction,
+    wait_for_change,
+    iter_judging_archive,
+    judging_archive_version,
+    load_snapshot,
+    save_snapshot,
+)
+from schedule_engine import (
+    DEFAULT_OBJECTIVE_WEIGHTS,
+    generate,
+    next_cards,
+    objective_weights,
+    repair as repair_schedule,
+    score_schedule,
+    STRATEGIES as SCHEDULE_STRATEGIES,
 )
-from schedule_engine import generate
 from judging import (
     CATEGORY_SPECS,
     CATEGORY_KEYS,
     JUDGE_COUNT,
     ensure_state_for_schedule,
     build_state_payload,
+    build_state_delta,
     create_judge_record,
+    history_page,
     matches_card,
     normalize_match,
 )
@@ -35,11 +53,27 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY","devkey")
+# In journal storage mode, fold any pending journal records into the snapshots at startup.
+compact_journals()
 
 WEIGHT_CLASSES = list(DB_FILES.keys())
-VALID_RESULTS = {"Red wins JD", "Red wins KO", "White wins JD", "White wins KO", "Draw"}
+VALID_RESULTS = set(RESULTS)
 JUDGE_IDS = list(range(1, JUDGE_COUNT + 1))
 JUDGE_LABELS = {i: f"Judge {i}" for i in JUDGE_IDS}
+HISTORY_PAGE_SIZE = 25  # results per page on the judge page and /api/judge/history
+# Live connections (SSE streams) each hold a gthread thread; cap them per worker so ordinary
+# requests always have threads left. Clients that get a 503 fall back to polling.
+LIVE_CONNECTIONS_MAX = int(os.environ.get("LIVE_CONNECTIONS_MAX", "8"))
+_live_slots = threading.BoundedSemaphore(LIVE_CONNECTIONS_MAX)
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_MAX_SECONDS = 300
+LONG_POLL_MAX_SECONDS = 25
+# Greedy schedule search: SCHEDULE_WORKERS > 1 fans restarts out over a process pool. The
+# organiser may cap the search in seconds; keep it well under gunicorn's 120s request timeout.
+SCHEDULE_WORKERS = max(1, int(os.environ.get("SCHEDULE_WORKERS", "1")))
+SCHEDULE_SEARCH_MAX_SECONDS = 60
+SCHEDULE_LOOKAHEAD_DEFAULT = 6
+SCHEDULE_LOOKAHEAD_MAX = 30
 
 @app.template_filter('datetimefromts')
 def datetimefromts(ts):
@@ -59,39 +93,114 @@ def inject_globals():
     return {"WEIGHT_CLASSES": WEIGHT_CLASSES, "TOP_MATCH": top}
 
 def robot_stats(db, name):
-    info = db.get("robots", {}).get(name, {})
-    wins=losses=draws=ko_wins=ko_losses=0
-    for m in info.get("matches", []):
-        res = m.get("result","")
-        if res=="Draw": draws+=1; continue
-        robot_is_red = (m.get("red_corner")==name)
-        red_win = res.startswith("Red wins")
-        is_ko = "KO" in res
-        won = (red_win and robot_is_red) or ((not red_win) and (not robot_is_red))
-        if won: wins+=1; ko_wins+= int(is_ko)
-        else: losses+=1; ko_losses+= int(is_ko)
-    return {"wins":wins,"losses":losses,"draws":draws,"ko_wins":ko_wins,"ko_losses":ko_losses}
+    stats = robot_stats_record(db.get("robots", {}).get(name, {}), name)
+    return {k: stats.get(k, 0) for k in STAT_KEYS}
 
 
 def get_synced_judging_state():
     schedule_data = load_schedule()
     schedule_list = schedule_data.get("list", []) if isinstance(schedule_data, dict) else []
-    state = load_judging_state()
-    state, changed = ensure_state_for_schedule(state, schedule_list)
+    state, changed = ensure_state_for_schedule(load_judging_state(), schedule_list)
     if changed:
-        save_judging_state(state)
+        # Out of sync: redo it under the locks so the write cannot race a judge submission.
+        with transaction(schedule=True, judging=True) as txn:
+            state = sync_judging_with_schedule(txn)
+            schedule_data = txn.schedule()
+        schedule_list = schedule_data.get("list", []) if isinstance(schedule_data, dict) else []
     return state, schedule_data, schedule_list
 
 
-def sync_judging_with_schedule(schedule_data):
-    state = load_judging_state()
+def wait_for_judging_version(since, timeout):
+    """Return the synced judging state once its version exceeds ``since`` or ``timeout`` elapses."""
+    deadline = time.monotonic() + timeout
+    state, _, _ = get_synced_judging_state()
+    versions = document_versions()
+    while int((state.get("_meta") or {}).get("version", 0)) <= since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        current = wait_for_change(versions, remaining)
+        if current == versions:
+            break
+        state, _, _ = get_synced_judging_state()
+        versions = document_versions()
+    return state
+
+
+def top_up_schedule(schedule_data, db_by_class=None):
+    """Refill a lookahead schedule to its queue length from live ratings and tonight's fights.
+
+    Pass ``db_by_class`` when the caller holds Elo changes that are not committed yet.
+    """
+    lookahead = schedule_data.get("lookahead") if isinstance(schedule_data, dict) else None
+    if not lookahead:
+        return schedule_data
+    schedule_list = schedule_data.setdefault("list", [])
+    missing = int(lookahead) - len(schedule_list)
+    if missing > 0:
+        schedule_list.extend(next_cards(schedule_list, missing, since=schedule_data.get("since"), db_by_class=db_by_class or view_all()))
+    return schedule_data
+
+
+def sync_judging_with_schedule(txn):
+    """Point the transaction's judging state at its schedule's top card (both must be claimed)."""
+    schedule_data = txn.schedule()
     schedule_list = schedule_data.get("list", []) if isinstance(schedule_data, dict) else []
-    state, changed = ensure_state_for_schedule(state, schedule_list)
+    state, changed = ensure_state_for_schedule(txn.judging(), schedule_list)
     if changed:
-        save_judging_state(state)
+        txn.save_judging(state)
     return state
 
 
+_WHAT_IF_CACHE = OrderedDict()
+_WHAT_IF_LOCK = threading.Lock()
+WHAT_IF_CACHE_SIZE = 8
+
+
+def schedule_what_if():
+    """What every result of every scheduled card would do to the ratings, as one batch.
+
+    Computed once per (Elo DB versions, schedule version) and shared by the public schedule,
+    the overlay and /api/schedule/what_if. Cards naming an unknown robot get ``None``.
+    """
+    elo_token, schedule_token, _ = document_versions()
+    key = (elo_token, schedule_token)
+    with _WHAT_IF_LOCK:
+        cached = _WHAT_IF_CACHE.get(key)
+        if cached is not None:
+            _WHAT_IF_CACHE.move_to_end(key)
+            return cached
+    cards = []
+    all_dbs = view_all()
+    for card in load_schedule().get("list", []):
+        db = all_dbs.get(card.get("weight_class")) if isinstance(card, dict) else None
+        robots = (db or {}).get("robots", {})
+        red, white = (card.get("red"), card.get("white")) if isinstance(card, dict) else (None, None)
+        if red not in robots or white not in robots:
+            cards.append(None)
+            continue
+        k_base, ko_w = get_settings(db)
+        rr, rw = robots[red], robots[white]
+        cards.append({
+            "weight_class": card.get("weight_class"), "red": red, "white": white,
+            **what_if(rr.get("rating", DEFAULT_RATING), rw.get("rating", DEFAULT_RATING),
+                      len(rr.get("matches", [])), len(rw.get("matches", [])), k_base, ko_w),
+        })
+    with _WHAT_IF_LOCK:
+        _WHAT_IF_CACHE[key] = cards
+        while len(_WHAT_IF_CACHE) > WHAT_IF_CACHE_SIZE:
+            _WHAT_IF_CACHE.popitem(last=False)
+    return cards
+
+
+def what_if_for(weight_class, red, white):
+    """The cached what-if entry for a scheduled pairing, or None when it is not on the card."""
+    for entry in schedule_what_if():
+        if entry and (entry["weight_class"], entry["red"], entry["white"]) == (weight_class, red, white):
+            return entry
+    return None
+
+
 def robot_display(weight_class, name):
     stats_template = {"wins": 0, "losses": 0, "draws": 0, "ko_wins": 0, "ko_losses": 0}
     base_payload = {
@@ -105,7 +214,7 @@ def robot_display(weight_class, name):
     if not weight_class or not name or weight_class not in WEIGHT_CLASSES:
         return dict(base_payload)
     try:
-        db = load_db(weight_class)
+        db = view_db(weight_class)
     except KeyError:
         return dict(base_payload)
     robots = db.get("robots", {}) or {}
@@ -130,7 +239,10 @@ def robot_display(weight_class, name):
     }
 
 
-def finalize_current_match(state, schedule_data):
+def finalize_current_match(txn):
+    """Move the judged current match into history and pop its card, writing each document once."""
+    state = txn.judging()
+    schedule_data = txn.schedule()
     current = state.get("current")
     if not current:
         return state, schedule_data
@@ -142,7 +254,7 @@ def finalize_current_match(state, schedule_data):
     state.setdefault("history", [])
     state["history"].insert(0, history_entry)
     state["current"] = None
-    save_judging_state(state)
+    txn.save_judging(state)
 
     schedule_list = schedule_data.get("list", []) if isinstance(schedule_data, dict) else []
     if schedule_list:
@@ -153,22 +265,20 @@ def finalize_current_match(state, schedule_data):
                 if matches_card(history_entry, card):
                     schedule_list.pop(idx)
                     break
-    save_schedule(schedule_data)
-
-    state, changed = ensure_state_for_schedule(state, schedule_list)
-    if changed:
-        save_judging_state(state)
-    return state, schedule_data
+    top_up_schedule(schedule_data)
+    txn.save_schedule(schedule_data)
+    return sync_judging_with_schedule(txn), schedule_data
 
 @app.route("/")
 def index():
     wc = request.args.get("wc", WEIGHT_CLASSES[0])
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc)
+    db = view_db(wc)
     robots = sorted(db.get("robots", {}).items(), key=lambda x: x[1].get("rating", DEFAULT_RATING), reverse=True)
     k, ko = get_settings(db)
     status = "Ready"
-    return render_template("index.html", wc=wc, robots=robots, k=k, ko=ko, status=status)
+    return render_template("index.html", wc=wc, robots=robots, k=k, ko=ko, status=status,
+                           schedule_weights=objective_weights(db))
 
 @app.post("/submit_match")
 def submit_match():
@@ -179,7 +289,14 @@ def submit_match():
     if wc not in WEIGHT_CLASSES or not red or not white or result not in VALID_RESULTS or red == white:
         flash("Bad match input", "error")
         return redirect(url_for("index", wc=wc or WEIGHT_CLASSES[0]))
-    db = load_db(wc)
+    pop_from_schedule = request.form.get("popFromSchedule") == "1"
+    with transaction([wc], schedule=pop_from_schedule, judging=pop_from_schedule) as txn:
+        response = _submit_match_in(txn, wc, red, white, result, pop_from_schedule)
+    return response
+
+
+def _submit_match_in(txn, wc, red, white, result, pop_from_schedule):
+    db = txn.db(wc)
     robots = db.setdefault("robots", {})
     # Allow case-insensitive robot name input
     if red not in robots or white not in robots:
@@ -192,28 +309,16 @@ def submit_match():
         flash("Robot not found", "error"); return redirect(url_for("index", wc=wc))
     rr = robots[red]; rw = robots[white]
     old_r = rr.get("rating", DEFAULT_RATING); old_w = rw.get("rating", DEFAULT_RATING)
-    e_r = get_expected(old_r, old_w); e_w = 1 - e_r
     k_base, ko_w = get_settings(db)
-    if result == "Red wins JD": s_r,s_w,w_r,w_w=1,0,1,1
-    elif result == "Red wins KO": s_r,s_w,w_r,w_w=1,0,ko_w,1
-    elif result == "White wins JD": s_r,s_w,w_r,w_w=0,1,1,1
-    elif result == "White wins KO": s_r,s_w,w_r,w_w=0,1,1,ko_w
-    else: s_r,s_w,w_r,w_w=0.5,0.5,1,1
-    k_r = get_k_for_robot(len(rr.get("matches", [])), k_base)
-    k_w = get_k_for_robot(len(rw.get("matches", [])), k_base)
-    new_r = round(old_r + k_r * ((s_r * w_r) - e_r))
-    new_w = round(old_w + k_w * ((s_w * w_w) - e_w))
+    new_r, new_w = match_ratings(old_r, old_w, result, len(rr.get("matches", [])), len(rw.get("matches", [])), k_base, ko_w)
     mid = db.get("next_match_id", 1); ts = int(time.time())
     entry = {"match_id": mid,"timestamp": ts,"red_corner": red,"white_corner": white,"result": result,
              "old_rating_red": old_r,"old_rating_white": old_w,"new_rating_red": new_r,"new_rating_white": new_w,
              "change_red": new_r-old_r,"change_white": new_w-old_w}
-    db.setdefault("history", []).append(entry); db["next_match_id"]=mid+1
-    rr["rating"]=new_r; rw["rating"]=new_w
-    rr.setdefault("matches", []).append(entry); rw.setdefault("matches", []).append(entry)
-    save_db(wc, db)
+    txn.commit_db_change(wc, {"op": "match", "entry": entry})
 
-    if request.form.get("popFromSchedule") == "1":
-        sched = load_schedule(); L = sched.get("list", [])
+    if pop_from_schedule:
+        sched = txn.schedule(); L = sched.get("list", [])
         # pop match case/whitespace-insensitively so minor mismatches don't block
         wc_norm = (wc or "").strip().lower()
         red_norm = (red or "").strip().lower()
@@ -224,8 +329,9 @@ def submit_match():
                 m.get("white","").strip().lower() == white_norm):
                 L.pop(i)
                 break
-        save_schedule(sched)
-        sync_judging_with_schedule(sched)
+        top_up_schedule(sched, {**view_all(), wc: db})
+        txn.save_schedule(sched)
+        sync_judging_with_schedule(txn)
         return redirect(url_for("schedule"))
     return redirect(url_for("index", wc=wc))
 
@@ -233,29 +339,27 @@ def submit_match():
 def undo():
     wc = request.form.get("wc")
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc); hist = db.get("history", [])
-    if not hist: flash("No matches to undo","info"); return redirect(url_for("index", wc=wc))
-    last = hist.pop(); red,white = last["red_corner"], last["white_corner"]
-    robots = db.get("robots", {})
-    if red in robots:
-        r = robots[red]; r["rating"]= last["old_rating_red"]
-        r["matches"]=[m for m in r.get("matches",[]) if m.get("match_id")!= last["match_id"]]
-    if white in robots:
-        w = robots[white]; w["rating"]= last["old_rating_white"]
-        w["matches"]=[m for m in w.get("matches",[]) if m.get("match_id")!= last["match_id"]]
-    save_db(wc, db); return redirect(url_for("index", wc=wc))
+    with transaction([wc], schedule=True, judging=True) as txn:
+        db = txn.db(wc); hist = db.get("history", [])
+        if not hist: flash("No matches to undo","info"); return redirect(url_for("index", wc=wc))
+        txn.commit_db_change(wc, {"op": "undo", "match_id": hist[-1].get("match_id")})
+        refresh_schedule(txn, {**view_all(), wc: db})
+    return redirect(url_for("index", wc=wc))
 
 @app.post("/reset_all")
 def reset_all():
     wc = request.form.get("wc")
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc)
-    robots = db.get("robots", {})
-    for r in robots.values():
-        r["rating"]=DEFAULT_RATING
-        r["matches"]=[]
-    db["history"]=[]; db["next_match_id"]=1
-    save_db(wc, db); flash("All Elo reset for " + wc, "info")
+    with transaction([wc]) as txn:
+        db = txn.db(wc)
+        robots = db.get("robots", {})
+        for r in robots.values():
+            r["rating"]=DEFAULT_RATING
+            r["matches"]=[]
+            r["stats"]=blank_robot_stats()
+        db["history"]=[]; db["ko_results"]=[]; db["next_match_id"]=1
+        txn.save_db(wc)
+    flash("All Elo reset for " + wc, "info")
     return redirect(url_for("index", wc=wc))
 
 @app.post("/robot/presence")
@@ -267,13 +371,31 @@ def robot_presence():
     if wc not in WEIGHT_CLASSES:
         return redirect(url_for("index", wc=WEIGHT_CLASSES[0]))
 
-    db = load_db(wc)
-    robots = db.get("robots", {}) or {}
-    if name and name in robots:
-        robots[name]["present"] = present
-        save_db(wc, db)
+    with transaction([wc], schedule=True, judging=True) as txn:
+        db = txn.db(wc)
+        robots = db.get("robots", {}) or {}
+        if name and name in robots and bool(robots[name].get("present")) != present:
+            txn.commit_db_change(wc, {"op": "presence", "robot": name, "present": present})
+            refresh_schedule(txn, {**view_all(), wc: db}, changed=[(wc, name)])
     return redirect(url_for("index", wc=wc))
 
+
+def refresh_schedule(txn, db_by_class, changed=()):
+    """Bring the running order in line with an Elo change without regenerating it.
+
+    Cards are patched for the ``(weight_class, robot)`` pairs in ``changed`` that arrived or left
+    (see schedule_engine.repair), then a lookahead queue is topped up. The schedule is saved and
+    judging re-synced only if something moved; the transaction must claim both.
+    """
+    schedule_data = txn.schedule()
+    schedule_list = schedule_data.get("list", []) if isinstance(schedule_data, dict) else []
+    updated = repair_schedule(schedule_list, changed, db_by_class=db_by_class) if schedule_list and changed else list(schedule_list)
+    updated = top_up_schedule(dict(schedule_data, list=updated), db_by_class)["list"]
+    if updated != schedule_list:
+        schedule_data["list"] = updated
+        txn.save_schedule(schedule_data)
+        sync_judging_with_schedule(txn)
+
 def save_upload(file):
     # Return a relative URL under /static/uploads or None
     if not file or file.filename == "":
@@ -297,11 +419,13 @@ def robot_add():
     except Exception: rating = DEFAULT_RATING
     img_url = save_upload(request.files.get("image"))
     if not name or wc not in WEIGHT_CLASSES: flash("Bad input","error"); return redirect(url_for("index", wc=wc or WEIGHT_CLASSES[0]))
-    db = load_db(wc)
-    if name in db.get("robots", {}): flash("Robot exists","error"); return redirect(url_for("index", wc=wc))
-    db["robots"][name]={"rating":rating,"matches":[],"driver_name":driver,"team_name":team,"weight_class":wc,"present":False}
-    if img_url: db["robots"][name]["image"]=img_url
-    save_db(wc, db); return redirect(url_for("index", wc=wc))
+    with transaction([wc]) as txn:
+        db = txn.db(wc)
+        if name in db.get("robots", {}): flash("Robot exists","error"); return redirect(url_for("index", wc=wc))
+        db["robots"][name]={"rating":rating,"matches":[],"stats":blank_robot_stats(),"driver_name":driver,"team_name":team,"weight_class":wc,"present":False}
+        if img_url: db["robots"][name]["image"]=img_url
+        txn.save_db(wc)
+    return redirect(url_for("index", wc=wc))
 
 @app.post("/robot/edit")
 def robot_edit():
@@ -310,32 +434,40 @@ def robot_edit():
     try: rating = int(request.form.get("rating"))
     except Exception: rating = None
     img_url = save_upload(request.files.get("image"))
-    if wc not in WEIGHT_CLASSES or old=="" or old not in load_db(wc).get("robots", {}): flash("Robot not found","error"); return redirect(url_for("index", wc=wc or WEIGHT_CLASSES[0]))
-    db = load_db(wc)
-    if new and new!=old and new in db.get("robots", {}): flash("Name already exists","error"); return redirect(url_for("index", wc=wc))
-    if new and new!=old:
-        db["robots"][new] = db["robots"].pop(old)
-        for m in db.get("history", []):
-            if m.get("red_corner")==old: m["red_corner"]=new
-            if m.get("white_corner")==old: m["white_corner"]=new
-        target=new
-    else: target=old
-    r = db["robots"][target]
-    if rating is not None: r["rating"]=rating
-    if driver: r["driver_name"]=driver
-    if team: r["team_name"]=team
-    if img_url: r["image"]=img_url
-    save_db(wc, db); return redirect(url_for("index", wc=wc))
+    if wc not in WEIGHT_CLASSES or old=="": flash("Robot not found","error"); return redirect(url_for("index", wc=wc or WEIGHT_CLASSES[0]))
+    with transaction([wc]) as txn:
+        db = txn.db(wc)
+        if old not in db.get("robots", {}): flash("Robot not found","error"); return redirect(url_for("index", wc=wc))
+        if new and new!=old and new in db.get("robots", {}): flash("Name already exists","error"); return redirect(url_for("index", wc=wc))
+        if new and new!=old:
+            db["robots"][new] = db["robots"].pop(old)
+            # robot match views are the history entries themselves, so only this robot's fights need touching
+            for m in db["robots"][new].get("matches", []):
+                if m.get("red_corner")==old: m["red_corner"]=new
+                if m.get("white_corner")==old: m["white_corner"]=new
+            target=new
+        else: target=old
+        r = db["robots"][target]
+        if rating is not None: r["rating"]=rating
+        if driver: r["driver_name"]=driver
+        if team: r["team_name"]=team
+        if img_url: r["image"]=img_url
+        txn.save_db(wc)
+    return redirect(url_for("index", wc=wc))
 
 @app.post("/robot/delete")
 def robot_delete():
     wc = request.form.get("wc"); name = request.form.get("name","").strip()
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc)
-    if name in db.get("robots", {}):
-        del db["robots"][name]
-        db["history"]=[m for m in db.get("history",[]) if m.get("red_corner")!=name and m.get("white_corner")!=name]
-        save_db(wc, db)
+    with transaction([wc], schedule=True, judging=True) as txn:
+        db = txn.db(wc)
+        if name in db.get("robots", {}):
+            # Only the roster entry goes: its fights stay in history, the KO feed and the opponents'
+            # records (their ratings already include them), as format-1 files load (_restore_orphan).
+            del db["robots"][name]
+            txn.save_db(wc)
+            # Its cards leave the running order as if it had gone absent.
+            refresh_schedule(txn, {**view_all(), wc: db}, changed=[(wc, name)])
     return redirect(url_for("index", wc=wc))
 
 @app.get("/robot/<wc>/<name>")
@@ -344,7 +476,7 @@ def robot_info(wc, name):
     wc = (wc or '').strip(); name = (name or '').strip()
     if wc not in WEIGHT_CLASSES:
         return "Bad weight class", 404
-    db = load_db(wc)
+    db = view_db(wc)
     info = db.get("robots", {}).get(name)
     if not info: return "Not found", 404
     matches = sorted(info.get("matches", []), key=lambda m: m["timestamp"], reverse=True)[:50]
@@ -354,12 +486,34 @@ def robot_info(wc, name):
 def save_settings_route():
     wc = request.form.get("wc")
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc)
     try: k = int(request.form.get("k")); ko = float(request.form.get("ko"))
     except Exception: flash("Invalid K/KO", "error"); return redirect(url_for("index", wc=wc))
-    db.setdefault("settings", {})["K"]=k; db["settings"]["ko_weight"]=ko; save_db(wc, db)
+    weights = {}
+    for term in DEFAULT_OBJECTIVE_WEIGHTS:
+        raw = request.form.get(f"weight_{term}")
+        if raw in (None, ""): continue
+        try: weights[term] = max(float(raw), 0.0)
+        except ValueError: flash(f"Invalid {term} weight", "error"); return redirect(url_for("index", wc=wc))
+    with transaction([wc]) as txn:
+        db = txn.db(wc)
+        db.setdefault("settings", {})["K"]=k; db["settings"]["ko_weight"]=ko
+        if weights: db["settings"]["schedule_weights"] = {**(db["settings"].get("schedule_weights") or {}), **weights}
+        if request.form.get("replay") == "1":
+            diff = replay_db(db, k, ko)
+            flash(f"Recomputed {len(diff['matches'])} matches and {len(diff['robots'])} ratings for {wc}", "info")
+        txn.save_db(wc)
     return redirect(url_for("index", wc=wc))
 
+@app.get("/api/replay/<wc>")
+def replay_preview_api(wc):
+    """Dry run: what replaying the history with the saved (or ``k``/``ko`` query) settings would change."""
+    if wc not in WEIGHT_CLASSES: return jsonify({"error": "Bad class"}), 404
+    db = view_db(wc)
+    k, ko = get_settings(db)
+    try: k = int(request.args.get("k", k)); ko = float(request.args.get("ko", ko))
+    except ValueError: return jsonify({"error": "Invalid K/KO"}), 400
+    return jsonify(replay_db(db, k, ko, dry_run=True))
+
 @app.get("/export/<wc>/csv")
 def export_wc_csv(wc):
     if wc not in WEIGHT_CLASSES: return "Bad class", 400
@@ -368,7 +522,7 @@ def export_wc_csv(wc):
 @app.get("/schedule")
 def schedule():
     state, _, schedule_list = get_synced_judging_state()
-    all_dbs = load_all()
+    all_dbs = view_all()
     presence = []
     for w, db in all_dbs.items():
         for name, info in (db.get("robots", {}) or {}).items():
@@ -379,6 +533,8 @@ def schedule():
         schedule=schedule_list,
         presence=presence,
         top=top,
+        lookahead=load_schedule().get("lookahead"),
+        objective=score_schedule(schedule_list, all_dbs) if schedule_list else None,
         weight_classes=WEIGHT_CLASSES,
         judge_panel=build_state_payload(state, history_limit=10),
         category_specs=CATEGORY_SPECS,
@@ -391,58 +547,74 @@ def schedule_generate():
     try: per = int(request.form.get("matchesPerRobot","1"))
     except Exception: per = 1
     interleave = request.form.get("interleave") == "1"
-    sched_list = generate(desired_per_robot=per, interleave=interleave, db_by_class=load_all())
-    schedule_data = {"list": sched_list}
-    save_schedule(schedule_data)
-    sync_judging_with_schedule(schedule_data)
+    strategy = request.form.get("strategy", "greedy")
+    if strategy not in SCHEDULE_STRATEGIES: strategy = "greedy"
+    try: budget = min(max(float(request.form.get("searchSeconds") or 0), 0.0), SCHEDULE_SEARCH_MAX_SECONDS)
+    except ValueError: budget = 0.0
+    sched_list = generate(desired_per_robot=per, interleave=interleave, db_by_class=view_all(), strategy=strategy,
+                          workers=SCHEDULE_WORKERS, time_budget=budget or None)
+    with transaction(schedule=True, judging=True) as txn:
+        txn.save_schedule({"list": sched_list})
+        sync_judging_with_schedule(txn)
+    return redirect(url_for("schedule"))
+
+@app.post("/schedule/stream")
+def schedule_stream():
+    try: lookahead = min(max(int(request.form.get("lookahead", SCHEDULE_LOOKAHEAD_DEFAULT)), 1), SCHEDULE_LOOKAHEAD_MAX)
+    except ValueError: lookahead = SCHEDULE_LOOKAHEAD_DEFAULT
+    with transaction(schedule=True, judging=True) as txn:
+        # Restarting keeps the rolling event's start so tonight's fights still count.
+        current = txn.schedule()
+        since = current.get("since") if current.get("lookahead") else None
+        schedule_data = {"list": [], "lookahead": lookahead, "since": since or int(time.time())}
+        top_up_schedule(schedule_data)
+        txn.save_schedule(schedule_data)
+        sync_judging_with_schedule(txn)
     return redirect(url_for("schedule"))
 
 @app.post("/schedule/clear")
 def schedule_clear():
-    schedule_data = {"list": []}
-    save_schedule(schedule_data)
-    sync_judging_with_schedule(schedule_data)
+    with transaction(schedule=True, judging=True) as txn:
+        txn.save_schedule({"list": []})
+        sync_judging_with_schedule(txn)
     return redirect(url_for("schedule"))
 
 @app.post("/schedule/move")
 def schedule_move():
     idx = int(request.form.get("index","-1")); direction = int(request.form.get("direction","0"))
-    sched = load_schedule(); L = sched.get("list", [])
-    if 0 <= idx < len(L):
-        newi = idx + direction
-        if 0 <= newi < len(L):
-            L[idx], L[newi] = L[newi], L[idx]
-            save_schedule(sched)
-            sync_judging_with_schedule(sched)
+    with transaction(schedule=True, judging=True) as txn:
+        sched = txn.schedule(); L = sched.get("list", [])
+        if 0 <= idx < len(L):
+            newi = idx + direction
+            if 0 <= newi < len(L):
+                L[idx], L[newi] = L[newi], L[idx]
+                txn.save_schedule(sched)
+                sync_judging_with_schedule(txn)
     return redirect(url_for("schedule"))
 
 @app.post("/schedule/delete")
 def schedule_delete():
-    idx = int(request.form.get("index","-1")); sched = load_schedule(); L = sched.get("list", [])
-    if 0 <= idx < len(L):
-        L.pop(idx)
-        save_schedule(sched)
-        sync_judging_with_schedule(sched)
+    idx = int(request.form.get("index","-1"))
+    with transaction(schedule=True, judging=True) as txn:
+        sched = txn.schedule(); L = sched.get("list", [])
+        if 0 <= idx < len(L):
+            L.pop(idx)
+            txn.save_schedule(sched)
+            sync_judging_with_schedule(txn)
     return redirect(url_for("schedule"))
 
 @app.post("/schedule/undo")
 def schedule_undo():
     wc = request.form.get("wc")
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc); hist = db.get("history", [])
-    if not hist: flash("No matches to undo","info"); return redirect(url_for("schedule"))
-    last = hist.pop(); red,white = last["red_corner"], last["white_corner"]
-    robots = db.get("robots", {})
-    if red in robots:
-        r = robots[red]; r["rating"]= last["old_rating_red"]
-        r["matches"]=[m for m in r.get("matches",[]) if m.get("match_id")!= last["match_id"]]
-    if white in robots:
-        w = robots[white]; w["rating"]= last["old_rating_white"]
-        w["matches"]=[m for m in w.get("matches",[]) if m.get("match_id")!= last["match_id"]]
-    save_db(wc, db)
-    sched = load_schedule(); sched.setdefault("list", []); sched["list"].insert(0, {"weight_class": wc, "red": red, "white": white})
-    save_schedule(sched)
-    sync_judging_with_schedule(sched)
+    with transaction([wc], schedule=True, judging=True) as txn:
+        hist = txn.db(wc).get("history", [])
+        if not hist: flash("No matches to undo","info"); return redirect(url_for("schedule"))
+        last = txn.commit_db_change(wc, {"op": "undo", "match_id": hist[-1].get("match_id")})
+        red,white = last["red_corner"], last["white_corner"]
+        sched = txn.schedule(); sched.setdefault("list", []); sched["list"].insert(0, {"weight_class": wc, "red": red, "white": white})
+        txn.save_schedule(sched)
+        sync_judging_with_schedule(txn)
     return redirect(url_for("schedule"))
 
 @app.post("/schedule/add")
@@ -465,22 +637,22 @@ def schedule_add():
 
     # (Optional) Try to normalize names to existing robots for that class (case-insensitive)
     # If not found, we still allow the free-form names.
-    db = load_db(wc)
+    db = view_db(wc)
     existing = {name.lower(): name for name in (db.get("robots", {}) or {}).keys()}
     red_norm = existing.get(red.lower(), red)
     white_norm = existing.get(white.lower(), white)
 
     item = {"weight_class": wc, "red": red_norm, "white": white_norm}
 
-    sched = load_schedule()
-    L = sched.get("list", [])
-    if position == "top":
-        L.insert(0, item)
-    else:
-        L.append(item)
-
-    save_schedule(sched)
-    sync_judging_with_schedule(sched)
+    with transaction(schedule=True, judging=True) as txn:
+        sched = txn.schedule()
+        L = sched.setdefault("list", [])
+        if position == "top":
+            L.insert(0, item)
+        else:
+            L.append(item)
+        txn.save_schedule(sched)
+        sync_judging_with_schedule(txn)
     flash(f"Added fight: [{wc}] {red_norm} vs {white_norm} ({position}).", "info")
     return redirect(url_for("schedule"))
 
@@ -498,29 +670,39 @@ def schedule_judge_history_update():
         return redirect(url_for("schedule"))
 
     sliders = {key: request.form.get(key) for key in CATEGORY_KEYS}
-    state, _, _ = get_synced_judging_state()
-    history = state.get("history", [])
-    target_index = None
-    for idx, entry in enumerate(history):
-        if entry.get("match_id") == match_id:
-            target_index = idx
-            break
-    if target_index is None:
-        flash("Match not found in judging history.", "error")
-        return redirect(url_for("schedule"))
-
-    entry = history[target_index]
-    entry.setdefault("judges", {})
-    entry["judges"][str(judge_id)] = create_judge_record(
-        judge_id,
-        sliders,
-        judge_name=request.form.get("judge_name"),
-    )
-    normalized_entry, _ = normalize_match(entry)
-    if normalized_entry is not None:
-        history[target_index] = normalized_entry
-    state["history"] = history
-    save_judging_state(state)
+    with transaction(schedule=True, judging=True) as txn:
+        state = sync_judging_with_schedule(txn)
+        history = state.get("history", [])
+        target_index = None
+        for idx, entry in enumerate(history):
+            if entry.get("match_id") == match_id:
+                target_index = idx
+                break
+        if target_index is None:
+            archived = next((e for e in iter_judging_archive() if e.get("match_id") == match_id), None)
+            if archived is None:
+                flash("Match not found in judging history.", "error")
+                return redirect(url_for("schedule"))
+            entry = copy.deepcopy(archived)
+        else:
+            entry = history[target_index]
+        entry.setdefault("judges", {})
+        entry["judges"][str(judge_id)] = create_judge_record(
+            judge_id,
+            sliders,
+            judge_name=request.form.get("judge_name"),
+        )
+        normalized_entry, _ = normalize_match(entry, force=True)
+        if normalized_entry is not None:
+            entry = normalized_entry
+        if target_index is None:
+            # The archive is append-only: the edited copy supersedes the older line.
+            txn.archive_judging([entry])
+        else:
+            history[target_index] = entry
+            state["history"] = history
+        # Saved either way so the version moves and cached panels pick the edit up.
+        txn.save_judging(state)
     flash(f"Updated Judge {judge_id} scorecard.", "info")
     return redirect(url_for("schedule"))
 
@@ -533,7 +715,10 @@ def judge_page(judge_id):
     if judge_id not in JUDGE_IDS:
         return "Unknown judge", 404
     state, _, _ = get_synced_judging_state()
-    panel_data = build_state_payload(state)
+    page = max(request.args.get("page", 1, type=int), 1)
+    panel_data = build_state_payload(state, history_limit=HISTORY_PAGE_SIZE)
+    # Older pages come out of the judging archive; page 1 is the memoized live panel.
+    history = history_page(state, page, HISTORY_PAGE_SIZE) if page > 1 else None
     current_payload = panel_data.get("current")
     current_match = state.get("current") if isinstance(state, dict) else None
     if current_payload and current_match:
@@ -550,13 +735,16 @@ def judge_page(judge_id):
     panel_data["api"] = {
         "submit": url_for("judge_submit", judge_id=judge_id),
         "state": url_for("judge_state_api"),
+        "stream": url_for("judge_stream_api"),
     }
     return render_template(
         "judge.html",
         judge_id=judge_id,
         judge_label=JUDGE_LABELS[judge_id],
         current=current_payload,
-        history=panel_data.get("history", []),
+        history=history["history"] if history else panel_data.get("history", []),
+        history_page=page,
+        history_has_more=history["has_more"] if history else len(panel_data.get("history", [])) >= HISTORY_PAGE_SIZE,
         categories=CATEGORY_SPECS,
         judge_labels=panel_data.get("judge_labels", JUDGE_LABELS),
         judge_state_json=panel_data,
@@ -579,12 +767,101 @@ def judge3_redirect():
     return redirect(url_for("judge_page", judge_id=3))
 
 
+def state_etag(*parts):
+    """ETag over the judging, schedule, Elo and archive versions plus any request-specific parts."""
+    return hashlib.sha1(repr((document_versions(), judging_archive_version(), parts)).encode("utf-8")).hexdigest()
+
+
 @app.get("/api/judge/state")
 def judge_state_api():
     history_limit = request.args.get("history", type=int)
-    state, _, _ = get_synced_judging_state()
-    payload = build_state_payload(state, history_limit=history_limit)
-    return jsonify(payload)
+    since = request.args.get("since", type=int)
+    wait = min(max(request.args.get("wait", 0.0, type=float), 0.0), LONG_POLL_MAX_SECONDS)
+    # ?delta=<revision>: only "current" plus history items that arrived after that payload revision.
+    delta = request.args.get("delta") or None
+    # Same state, same ETag: delta and full clients both get 304s until something changes.
+    etag_parts = (history_limit,)
+    state = None
+    # Long-poll (?since=<version>&wait=<seconds>): hold the request until the judging version moves.
+    # Held requests share the live-connection cap; past it they are answered immediately.
+    if since is not None and wait > 0 and _live_slots.acquire(blocking=False):
+        try:
+            state = wait_for_judging_version(since, wait)
+        finally:
+            _live_slots.release()
+    # Pollers only care whether anything changed; answer that from file versions alone.
+    if request.if_none_match.contains(state_etag(*etag_parts)):
+        response = app.response_class(status=304)
+    else:
+        if state is None:
+            state, _, _ = get_synced_judging_state()
+        if delta:
+            payload = build_state_delta(state, delta, history_limit=history_limit)
+        else:
+            payload = build_state_payload(state, history_limit=history_limit)
+        response = jsonify(payload)
+    # Computed after syncing, since get_synced_judging_state may have just written judging.json.
+    response.set_etag(state_etag(*etag_parts))
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.get("/api/judge/history")
+def judge_history_api():
+    """?page=<n>&per_page=<m>: the full results list, reaching back into the judging archive."""
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", HISTORY_PAGE_SIZE, type=int)
+    etag = state_etag("history", page, per_page)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        state, _, _ = get_synced_judging_state()
+        response = jsonify(history_page(state, page, per_page))
+        etag = state_etag("history", page, per_page)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.get("/api/schedule/what_if")
+def schedule_what_if_api():
+    etag = hashlib.sha1(repr(document_versions()[:2]).encode("utf-8")).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({"results": list(RESULTS), "cards": schedule_what_if()})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.get("/api/judge/stream")
+def judge_stream_api():
+    """Server-Sent Events: emit a small "state" event whenever any stored document changes."""
+    if not _live_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many live connections"}), 503
+
+    def events():
+        # Browsers reconnect on their own after STREAM_MAX_SECONDS, which recycles the thread.
+        yield "retry: 3000\n\n"
+        versions = None
+        started = time.monotonic()
+        while time.monotonic() - started < STREAM_MAX_SECONDS:
+            current = document_versions() if versions is None else wait_for_change(versions, STREAM_KEEPALIVE_SECONDS)
+            if current == versions:
+                yield ": keepalive\n\n"
+                continue
+            state, _, _ = get_synced_judging_state()
+            versions = document_versions()
+            meta = state.get("_meta") or {}
+            data = {"version": int(meta.get("version", 0)), "updated_at": meta.get("updated_at")}
+            yield f"event: state\ndata: {json.dumps(data)}\n\n"
+
+    response = app.response_class(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(_live_slots.release)
+    return response
 
 
 @app.post("/api/judge/<int:judge_id>/submit")
@@ -597,62 +874,43 @@ def judge_submit(judge_id):
     match_id = data.get("match_id")
     if not judge_name:
         return jsonify({"error": "Judge name required"}), 400
-    # unified, conflict-free state fetch
-    state, schedule_data, schedule_list = get_synced_judging_state()
     judge_record = create_judge_record(judge_id, sliders, judge_name=judge_name)
-
-    error_payload = {"error": "No active match"}
-    error_status = 400
-
-    class StateUpdateAbort(Exception):
-        pass
-
-    def mutate_state(current_state):
-        nonlocal error_payload, error_status
-        current_state, _ = ensure_state_for_schedule(current_state, schedule_list)
-        current_match = current_state.get("current") if isinstance(current_state, dict) else None
+    # One transaction: sync, score, and finalize a complete match with a single write per document.
+    with transaction(schedule=True, judging=True) as txn:
+        state = sync_judging_with_schedule(txn)
+        current_match = state.get("current") if isinstance(state, dict) else None
         if not current_match:
-            error_payload = {"error": "No active match"}
-            error_status = 400
-            raise StateUpdateAbort()
+            return jsonify({"error": "No active match"}), 400
         if match_id and match_id != current_match.get("match_id"):
-            error_payload = {"error": "Match has changed"}
-            error_status = 409
-            raise StateUpdateAbort()
+            return jsonify({"error": "Match has changed"}), 409
 
         judges = current_match.setdefault("judges", {})
         judges[str(judge_id)] = judge_record
-        normalized_current, _ = normalize_match(current_match)
-        current_state["current"] = normalized_current
-        return current_state
+        normalized_current, _ = normalize_match(current_match, force=True)
+        state["current"] = normalized_current
+        txn.save_judging(state)
 
-    try:
-        state = update_judging_state(mutate_state)
-    except StateUpdateAbort:
-        return jsonify(error_payload), error_status
-
-    current_match = state.get("current") if isinstance(state, dict) else None
-    summary = current_match.get("summary") if current_match else None
-    if summary and summary.get("is_complete"):
-        state, schedule_data = finalize_current_match(state, schedule_data)
+        summary = normalized_current.get("summary") if normalized_current else None
+        if summary and summary.get("is_complete"):
+            state, _ = finalize_current_match(txn)
 
     payload = build_state_payload(state)
     return jsonify(payload)
 
 
 # -------- Overlay endpoint for current top match --------
-@app.get("/overlay")
-def overlay():
+def build_overlay_payload():
+    """The overlay document for the current (or next scheduled) match."""
     state, _, schedule_list = get_synced_judging_state()
     current_match = state.get("current") if isinstance(state, dict) else None
     if not current_match:
         if not schedule_list:
-            return jsonify({"status": "empty"})
+            return {"status": "empty"}
         top_card = schedule_list[0]
         wc = top_card.get("weight_class")
         red_name = top_card.get("red")
         white_name = top_card.get("white")
-        return jsonify({
+        return {
             "status": "pending",
             "match_id": None,
             "weight_class": wc,
@@ -661,7 +919,8 @@ def overlay():
             "headline": "Awaiting judges",
             "judges": [],
             "pending_judges": JUDGE_IDS,
-        })
+            "what_if": what_if_for(wc, red_name, white_name),
+        }
 
     normalized_current, _ = normalize_match(current_match)
     match_data = normalized_current or current_match
@@ -695,8 +954,68 @@ def overlay():
         "red": robot_display(wc, red_name),
         "white": robot_display(wc, white_name),
         "judges": judge_cards,
+        "what_if": what_if_for(wc, red_name, white_name),
     }
-    return jsonify(payload)
+    return payload
+
+
+# OBS sources poll /overlay several times a second. The built document is kept in memory and in
+# data/overlay.snapshot.json (shared by the workers), keyed by the versions it depends on: the
+# judging state, the schedule and the Elo DB holding the two robots. Its ETag hashes the body, so
+# a rebuild that changes nothing still answers 304.
+_overlay_snapshot = {}
+_OVERLAY_LOCK = threading.Lock()
+
+
+def _overlay_deps(versions, weight_class):
+    elo_token, schedule_token, judging_token = versions
+    elo = elo_token[WEIGHT_CLASSES.index(weight_class)] if weight_class in WEIGHT_CLASSES else None
+    # Round-tripped through JSON so tokens read back from the on-disk copy compare equal.
+    return json.loads(json.dumps([elo, schedule_token, judging_token]))
+
+
+def overlay_snapshot():
+    """The current overlay as ``(body, etag)``, rebuilt only when a document it reads has changed."""
+    versions = document_versions()
+    with _OVERLAY_LOCK:
+        snapshot = _overlay_snapshot.get("doc")
+    if snapshot is None or _overlay_deps(versions, snapshot["weight_class"]) != snapshot["deps"]:
+        snapshot = load_snapshot("overlay")
+        if snapshot is None or _overlay_deps(versions, snapshot.get("weight_class")) != snapshot.get("deps"):
+            # Label the build with the versions read before it. If anything moved meanwhile
+            # (the first sync of a new top card writes judging.json), build once more; past
+            # that, serve the document without keeping it.
+            for _ in range(2):
+                payload = build_overlay_payload()
+                body = app.json.dumps(payload)
+                snapshot = {
+                    "weight_class": payload.get("weight_class"),
+                    "deps": _overlay_deps(versions, payload.get("weight_class")),
+                    "body": body,
+                    "etag": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+                }
+                after = document_versions()
+                if after == versions:
+                    break
+                versions = after
+            else:
+                return snapshot["body"], snapshot["etag"]
+            save_snapshot("overlay", snapshot)
+        with _OVERLAY_LOCK:
+            _overlay_snapshot["doc"] = snapshot
+    return snapshot["body"], snapshot["etag"]
+
+
+@app.get("/overlay")
+def overlay():
+    body, etag = overlay_snapshot()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @app.get("/robot_card2/<path:wc>/<path:name>")
@@ -706,7 +1025,7 @@ def robot_card2(wc, name):
     name_in = (name or "").strip()
     if wc not in WEIGHT_CLASSES:
         return "Bad weight class", 404
-    db = load_db(wc)
+    db = view_db(wc)
     robots = (db.get("robots", {}) or {})
     # exact
     info = robots.get(name_in); actual_name = name_in
@@ -737,7 +1056,7 @@ def debug_robots(wc):
     wc = (wc or "").strip()
     if wc not in WEIGHT_CLASSES:
         return jsonify({"error":"bad class","classes":WEIGHT_CLASSES}), 400
-    db = load_db(wc)
+    db = view_db(wc)
     return jsonify(sorted(list((db.get("robots", {}) or {}).keys())))
 
 
@@ -753,22 +1072,9 @@ def schedule_public():
     top_info = None
     if top:
         wc = top.get("weight_class"); red = top.get("red"); white = top.get("white")
-        db = load_db(wc); robots = db.get("robots", {})
+        db = view_db(wc); robots = db.get("robots", {})
         r = robots.get(red, {}); w = robots.get(white, {})
-        def stats(db, name):
-            s = {"wins":0,"losses":0,"draws":0,"ko_wins":0,"ko_losses":0}
-            info = db.get("robots",{}).get(name,{})
-            for m in info.get("matches",[]):
-                res = m.get("result","")
-                if res == "Draw": s["draws"]+=1; continue
-                robot_is_red = (m.get("red_corner")==name)
-                red_win = res.startswith("Red wins")
-                is_ko = "KO" in res
-                won = (red_win and robot_is_red) or ((not red_win) and (not robot_is_red))
-                if won: s["wins"]+=1; s["ko_wins"]+= int(is_ko)
-                else: s["losses"]+=1; s["ko_losses"]+= int(is_ko)
-            return s
-        rs = stats(db, red); ws = stats(db, white)
+        rs = robot_stats(db, red); ws = robot_stats(db, white)
         top_info = {
             "weight_class": wc,
             "red": {"name": red, "elo": r.get("rating", DEFAULT_RATING), "driver": r.get("driver_name",""), "team": r.get("team_name",""),
@@ -780,6 +1086,7 @@ def schedule_public():
         }
     # Build enriched schedule list with images for thumbnails
     enriched_schedule = []
+    swings = {(e["weight_class"], e["red"], e["white"]): e for e in schedule_what_if() if e}
     for idx, card in enumerate(schedule_list or []):
         if not isinstance(card, dict):
             continue
@@ -788,7 +1095,7 @@ def schedule_public():
         white = card.get("white")
         red_img = ""; white_img = ""
         try:
-            db_wc = load_db(wc) if wc in WEIGHT_CLASSES else None
+            db_wc = view_db(wc) if wc in WEIGHT_CLASSES else None
             robots_wc = db_wc.get("robots", {}) if db_wc else {}
             red_img = robots_wc.get(red, {}).get("image", "") if red in robots_wc else ""
             white_img = robots_wc.get(white, {}).get("image", "") if white in robots_wc else ""
@@ -800,6 +1107,7 @@ def schedule_public():
             "white": white,
             "red_image": red_img,
             "white_image": white_img,
+            "what_if": swings.get((wc, red, white)),
         })
     return render_template(
         "public_schedule.html",
@@ -814,24 +1122,14 @@ def schedule_public():
 def rankings_public():
     wc = request.args.get("wc", WEIGHT_CLASSES[0])
     if wc not in WEIGHT_CLASSES: wc = WEIGHT_CLASSES[0]
-    db = load_db(wc)
+    db = view_db(wc)
     robots = db.get("robots", {}) or {}
     rows = []
     for name, info in robots.items():
-        wins=losses=draws=0; ko_wins=ko_losses=0
-        for m in info.get("matches", []):
-            res = m.get("result","")
-            if res == "Draw": draws+=1; continue
-            robot_is_red = (m.get("red_corner")==name)
-            red_win = res.startswith("Red wins"); is_ko = "KO" in res
-            won = (red_win and robot_is_red) or ((not red_win) and (not robot_is_red))
-            if won: wins+=1; ko_wins += int(is_ko)
-            else: losses+=1; ko_losses += int(is_ko)
         rows.append({
             "name": name,
             "rating": info.get("rating", DEFAULT_RATING),
-            "wins": wins, "losses": losses, "draws": draws,
-            "ko_wins": ko_wins, "ko_losses": ko_losses,
+            **robot_stats(db, name),
             "driver": info.get("driver_name",""),
             "team": info.get("team_name",""),
             "image": info.get("image","")
@@ -848,7 +1146,7 @@ def robot_card(wc, name):
     name_in = (name or "").strip()
     if wc not in WEIGHT_CLASSES:
         return "Bad weight class", 404
-    db = load_db(wc)
+    db = view_db(wc)
     robots = (db.get("robots", {}) or {})
     # 1) exact match
     info = robots.get(name_in)
@@ -0,0 +1,210 @@
+"""Scaling benchmark for schedule_engine.generate.
+
+Builds synthetic weight-class DBs from fixed seeds (no data directory or network needed), runs
+every generate strategy over a grid of roster sizes, history densities and matches-per-robot,
+and records wall time, peak traced memory and schedule quality as JSON.
+
+    python bench_schedule.py --output bench.json
+    python bench_schedule.py --quick
+    python bench_schedule.py --robots 50 100 --density 0.5 --desired 2 --strategy matching
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional
+
+import schedule_engine
+from elo import DEFAULT_RATING
+
+DEFAULT_ROBOTS = (10, 25, 50, 100, 200)
+DEFAULT_DENSITY = (0.0, 0.3, 0.7)
+DEFAULT_DESIRED = (1, 3)
+QUICK_ROBOTS = (10, 25)
+QUICK_DENSITY = (0.0, 0.5)
+QUICK_DESIRED = (1, 2)
+WEIGHT_CLASS = "Bench"
+
+
+def synthetic_db(robots: int, density: float, seed: int, present_ratio: float = 1.0) -> Dict[str, dict]:
+    """One-class ``db_by_class`` where roughly ``density`` of all pairs have met before."""
+    rng = random.Random(seed)
+    names = [f"Bot{i:03d}" for i in range(robots)]
+    roster = {
+        name: {
+            "rating": int(rng.gauss(DEFAULT_RATING, 120)),
+            "matches": [],
+            "present": rng.random() < present_ratio,
+        }
+        for name in names
+    }
+    history = []
+    for i in range(robots):
+        for j in range(i + 1, robots):
+            if rng.random() >= density:
+                continue
+            for _ in range(1 if rng.random() < 0.8 else 2):
+                red, white = (names[i], names[j]) if rng.random() < 0.5 else (names[j], names[i])
+                history.append({
+                    "match_id": len(history) + 1,
+                    "timestamp": 1_700_000_000 + len(history),
+                    "red_corner": red,
+                    "white_corner": white,
+                    "result": rng.choice(("Red wins JD", "Red wins KO", "White wins JD", "White wins KO", "Draw")),
+                })
+    rng.shuffle(history)
+    return {WEIGHT_CLASS: {"robots": roster, "history": history}}
+
+
+def schedule_quality(schedule: List[Dict[str, str]], db_by_class: Dict[str, dict], desired_per_robot: int) -> Dict[str, Any]:
+    """Coverage, rematch, cooldown and objective figures for one generated card."""
+    met = schedule_engine.build_history_counts(db_by_class)
+    present = schedule_engine.present_by_class(db_by_class)
+    fights: Dict[tuple, int] = {(wc, name): 0 for wc, names in present.items() for name in names}
+    last_seen: Dict[tuple, int] = {}
+    rematches = 0
+    cooldown_violations = 0
+    for index, card in enumerate(schedule):
+        wc = card["weight_class"]
+        a, b = sorted((card["red"], card["white"]))
+        if met.get((wc, a, b)):
+            rematches += 1
+        for robot in ((wc, a), (wc, b)):
+            fights[robot] = fights.get(robot, 0) + 1
+            if robot in last_seen and index - last_seen[robot] <= schedule_engine.COOLDOWN_MATCHES:
+                cooldown_violations += 1
+            last_seen[robot] = index
+    robots = len(fights) or 1
+    return {
+        "matches": len(schedule),
+        "present_robots": len(fights),
+        "coverage": sum(1 for count in fights.values() if count >= desired_per_robot) / robots,
+        "fight_share": sum(min(count, desired_per_robot) for count in fights.values()) / (robots * desired_per_robot),
+        "unscheduled_robots": sum(1 for count in fights.values() if count == 0),
+        "rematches": rematches,
+        "cooldown_violations": cooldown_violations,
+        "objective": schedule_engine.score_schedule(schedule, db_by_class)["total"],
+    }
+
+
+def run_case(
+    robots: int,
+    density: float,
+    desired_per_robot: int,
+    strategy: str,
+    seed: int,
+    measure_memory: bool = True,
+    time_budget: Optional[float] = None,
+) -> Dict[str, Any]:
+    db_by_class = synthetic_db(robots, density, seed)
+
+    def once() -> List[Dict[str, str]]:
+        return schedule_engine.generate(
+            desired_per_robot=desired_per_robot,
+            db_by_class=db_by_class,
+            seed=seed,
+            strategy=strategy,
+            time_budget=time_budget,
+        )
+
+    started = time.perf_counter()
+    schedule = once()
+    wall_seconds = time.perf_counter() - started
+
+    peak_bytes = None
+    if measure_memory:
+        # A second, traced run: tracemalloc slows allocation-heavy code too much to time it.
+        tracemalloc.start()
+        try:
+            once()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "strategy": strategy,
+        "robots": robots,
+        "history_density": density,
+        "history_matches": len(db_by_class[WEIGHT_CLASS]["history"]),
+        "desired_per_robot": desired_per_robot,
+        "seed": seed,
+        "time_budget": time_budget,
+        "wall_seconds": round(wall_seconds, 4),
+        "peak_memory_bytes": peak_bytes,
+        **schedule_quality(schedule, db_by_class, desired_per_robot),
+    }
+
+
+def run_suite(
+    robots: Iterable[int],
+    densities: Iterable[float],
+    desired: Iterable[int],
+    strategies: Iterable[str],
+    seed: int,
+    measure_memory: bool = True,
+    time_budget: Optional[float] = None,
+    progress=None,
+) -> Dict[str, Any]:
+    results = []
+    for size in robots:
+        for density in densities:
+            for per_robot in desired:
+                for strategy in strategies:
+                    result = run_case(size, density, per_robot, strategy, seed, measure_memory, time_budget)
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cooldown_matches": schedule_engine.COOLDOWN_MATCHES,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def _print_progress(result: Dict[str, Any]) -> None:
+    print(
+        f"{result['strategy']:>8} robots={result['robots']:<4} density={result['history_density']:<4} "
+        f"desired={result['desired_per_robot']:<2} {result['wall_seconds']:>8.3f}s "
+        f"matches={result['matches']:<4} coverage={result['coverage']:.2f} "
+        f"rematches={result['rematches']} cooldown={result['cooldown_violations']} objective={result['objective']:.2f}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    parser = argparse.ArgumentParser(description="Benchmark schedule_engine.generate on synthetic rosters.")
+    parser.add_argument("--robots", type=int, nargs="+", help=f"robots per class (default {DEFAULT_ROBOTS})")
+    parser.add_argument("--density", type=float, nargs="+", help=f"share of pairs met before (default {DEFAULT_DENSITY})")
+    parser.add_argument("--desired", type=int, nargs="+", help=f"desired_per_robot values (default {DEFAULT_DESIRED})")
+    parser.add_argument("--strategy", nargs="+", choices=schedule_engine.STRATEGIES, default=list(schedule_engine.STRATEGIES))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--time-budget", type=float, default=None, help="cap greedy search at this many seconds per run")
+    parser.add_argument("--quick", action="store_true", help="small grid for a fast smoke run")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced second run")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_suite(
+        args.robots or (QUICK_ROBOTS if args.quick else DEFAULT_ROBOTS),
+        args.density or (QUICK_DENSITY if args.quick else DEFAULT_DENSITY),
+        args.desired or (QUICK_DESIRED if args.quick else DEFAULT_DESIRED),
+        args.strategy,
+        args.seed,
+        measure_memory=not args.no_memory,
+        time_budget=args.time_budget,
+        progress=_print_progress,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
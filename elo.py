@@ -1,3 +1,6 @@
+from array import array
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
 DEFAULT_RATING = 1000
 DEFAULT_K = 32
 KO_WEIGHT = 1.10
@@ -6,3 +9,125 @@ def get_expected(r_a, r_b):
 def get_k_for_robot(matches_count, base_k):
     if matches_count < 20: return base_k
     return max(8, int(base_k * 0.75))
+
+RESULTS = ("Red wins JD", "Red wins KO", "White wins JD", "White wins KO", "Draw")
+RATING_FIELDS = ("old_rating_red", "old_rating_white", "new_rating_red", "new_rating_white", "change_red", "change_white")
+
+
+def match_ratings(old_red, old_white, result, red_matches, white_matches, k_base=DEFAULT_K, ko_weight=KO_WEIGHT) -> Tuple[int, int]:
+    """(new red, new white) ratings for one result; ``*_matches`` count fights before this one.
+
+    A KO scales the winner's actual score by ``ko_weight``; anything that is not a win is a draw.
+    """
+    e_r = get_expected(old_red, old_white); e_w = 1 - e_r
+    if result == "Red wins JD": s_r,s_w,w_r,w_w=1,0,1,1
+    elif result == "Red wins KO": s_r,s_w,w_r,w_w=1,0,ko_weight,1
+    elif result == "White wins JD": s_r,s_w,w_r,w_w=0,1,1,1
+    elif result == "White wins KO": s_r,s_w,w_r,w_w=0,1,1,ko_weight
+    else: s_r,s_w,w_r,w_w=0.5,0.5,1,1
+    k_r = get_k_for_robot(red_matches, k_base)
+    k_w = get_k_for_robot(white_matches, k_base)
+    return round(old_red + k_r * ((s_r * w_r) - e_r)), round(old_white + k_w * ((s_w * w_w) - e_w))
+
+
+def what_if(old_red, old_white, red_matches, white_matches, k_base=DEFAULT_K, ko_weight=KO_WEIGHT) -> Dict[str, Any]:
+    """Expected scores and the rating fields every result in RESULTS would record for one fight."""
+    expected_red = get_expected(old_red, old_white)
+    outcomes = {}
+    for result in RESULTS:
+        new_r, new_w = match_ratings(old_red, old_white, result, red_matches, white_matches, k_base, ko_weight)
+        outcomes[result] = {"new_rating_red": new_r, "new_rating_white": new_w,
+                            "change_red": new_r - old_red, "change_white": new_w - old_white}
+    return {"rating_red": old_red, "rating_white": old_white,
+            "expected_red": expected_red, "expected_white": 1 - expected_red, "results": outcomes}
+
+
+def _rating_value(value: float):
+    return int(value) if float(value).is_integer() else value
+
+
+class Replay(NamedTuple):
+    """Ratings recomputed from a history, as flat arrays indexed by robot id or history position."""
+
+    names: List[str]  # robot id -> name
+    ratings: array  # robot id -> final rating ('d')
+    old_red: array  # history position -> rating before the fight ('d'), likewise below
+    old_white: array
+    new_red: array
+    new_white: array
+
+    def rating(self, name: str) -> Optional[float]:
+        try:
+            return _rating_value(self.ratings[self.names.index(name)])
+        except ValueError:
+            return None
+
+    def fields(self, position: int) -> Dict[str, Any]:
+        old_r, old_w = _rating_value(self.old_red[position]), _rating_value(self.old_white[position])
+        new_r, new_w = _rating_value(self.new_red[position]), _rating_value(self.new_white[position])
+        return {"old_rating_red": old_r, "old_rating_white": old_w, "new_rating_red": new_r, "new_rating_white": new_w,
+                "change_red": new_r - old_r, "change_white": new_w - old_w}
+
+
+def replay_history(history: Iterable[Dict[str, Any]], k_base=DEFAULT_K, ko_weight=KO_WEIGHT) -> Replay:
+    """Recompute every fight of ``history`` in order with the given settings.
+
+    Robots are interned to integer ids on first sight and start from the ``old_rating`` recorded
+    on that first fight (DEFAULT_RATING when missing), so custom starting ratings survive.
+    """
+    ids: Dict[str, int] = {}
+    names: List[str] = []
+    ratings, fought = array("d"), array("l")
+    old_red, old_white, new_red, new_white = array("d"), array("d"), array("d"), array("d")
+    for entry in history:
+        pair = []
+        for corner, seed_key in (("red_corner", "old_rating_red"), ("white_corner", "old_rating_white")):
+            name = entry.get(corner)
+            robot = ids.get(name)
+            if robot is None:
+                robot = ids[name] = len(names)
+                names.append(name)
+                seed = entry.get(seed_key)
+                ratings.append(float(seed if isinstance(seed, (int, float)) else DEFAULT_RATING))
+                fought.append(0)
+            pair.append(robot)
+        red, white = pair
+        before_r, before_w = ratings[red], ratings[white]
+        after_r, after_w = match_ratings(before_r, before_w, entry.get("result"), fought[red], fought[white], k_base, ko_weight)
+        old_red.append(before_r); old_white.append(before_w)
+        new_red.append(after_r); new_white.append(after_w)
+        ratings[red], ratings[white] = after_r, after_w
+        fought[red] += 1; fought[white] += 1
+    return Replay(names, ratings, old_red, old_white, new_red, new_white)
+
+
+def replay_db(db: Dict[str, Any], k_base=DEFAULT_K, ko_weight=KO_WEIGHT, dry_run=False) -> Dict[str, Any]:
+    """Recompute ratings and each history entry's rating fields; return what changed.
+
+    The diff lists every changed match (``before``/``after`` rating fields) and every robot whose
+    rating moves. With ``dry_run`` nothing is touched; otherwise entries are updated in place
+    (robot match lists share them) and robots that fought take their replayed rating.
+    """
+    history = db.get("history") or []
+    robots = db.get("robots") or {}
+    replay = replay_history(history, k_base, ko_weight)
+    matches = []
+    for position, entry in enumerate(history):
+        after = replay.fields(position)
+        before = {field: entry.get(field) for field in RATING_FIELDS}
+        if before != after:
+            matches.append({"match_id": entry.get("match_id"), "red_corner": entry.get("red_corner"),
+                            "white_corner": entry.get("white_corner"), "result": entry.get("result"),
+                            "before": before, "after": after})
+            if not dry_run:
+                entry.update(after)
+    ratings = {}
+    for robot, name in enumerate(replay.names):
+        if name not in robots:
+            continue
+        before, after = robots[name].get("rating", DEFAULT_RATING), _rating_value(replay.ratings[robot])
+        if before != after:
+            ratings[name] = {"before": before, "after": after}
+            if not dry_run:
+                robots[name]["rating"] = after
+    return {"replayed": len(history), "dry_run": bool(dry_run), "matches": matches, "robots": ratings}
@@ -1,7 +1,22 @@
+import hashlib
+import heapq
+import itertools
+import threading
 import time
 import uuid
-from typing import Dict, Tuple, Any, List, Optional
-from storage import load_all
+from collections import OrderedDict
+from typing import Dict, Tuple, Any, Iterator, List, Optional
+from storage import (
+    JUDGING_HISTORY_WINDOW,
+    archive_judging_entries,
+    elo_versions,
+    iter_judging_archive,
+    judging_archive_events,
+    judging_archive_version,
+    load_judging_archive,
+    update_judging_state,
+    view_all,
+)
 
 CATEGORY_SPECS = [
     {"key": "damage", "label": "Damage", "max": 8},
@@ -10,6 +25,8 @@ CATEGORY_SPECS = [
 ]
 CATEGORY_KEYS = [spec["key"] for spec in CATEGORY_SPECS]
 JUDGE_COUNT = 3
+# Bump when normalize_match starts producing a different shape, so stamped records are redone.
+JUDGING_SCHEMA_VERSION = 1
 
 
 def default_state() -> Dict[str, Any]:
@@ -119,9 +136,27 @@ def matches_card(match: Dict[str, Any], card: Dict[str, Any]) -> bool:
     )
 
 
-def normalize_match(match: Optional[Dict[str, Any]], judge_count: int = JUDGE_COUNT) -> Tuple[Optional[Dict[str, Any]], bool]:
+def _match_stamp(judge_count: int) -> str:
+    return f"{JUDGING_SCHEMA_VERSION}/{judge_count}"
+
+
+def is_normalized(match: Any, judge_count: int = JUDGE_COUNT) -> bool:
+    """True when ``match`` was written by normalize_match under the current schema.
+
+    A stamp check, not a content check: code that edits judge records passes ``force=True`` to
+    normalize_match, and hand-edited files are brought back with ``judging.py migrate --force``.
+    """
+    return isinstance(match, dict) and match.get("schema") == _match_stamp(judge_count)
+
+
+def normalize_match(
+    match: Optional[Dict[str, Any]], judge_count: int = JUDGE_COUNT, force: bool = False
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Rebuild a match's judge records and summary; stamped matches come back as is unless ``force``."""
     if not match:
         return None, False
+    if not force and is_normalized(match, judge_count):
+        return match, False
     changed = False
     normalized = dict(match)
     if not normalized.get("match_id"):
@@ -154,6 +189,10 @@ def normalize_match(match: Optional[Dict[str, Any]], judge_count: int = JUDGE_CO
     if normalized.get("summary") != summary:
         normalized["summary"] = summary
         changed = True
+    stamp = _match_stamp(judge_count)
+    if normalized.get("schema") != stamp:
+        normalized["schema"] = stamp
+        changed = True
     return normalized, changed
 
 
@@ -250,96 +289,136 @@ def build_match_payload(match: Optional[Dict[str, Any]]) -> Optional[Dict[str, A
     }
 
 
-def build_state_payload(state: Dict[str, Any], history_limit: Optional[int] = None) -> Dict[str, Any]:
-    """Build the payload for judge panels.
+def _completed_at(entry: Dict[str, Any]) -> int:
+    return int(entry.get("completed_at") or entry.get("created_at") or 0)
 
-    Augmentation: include recent KO fights (entered via Elo submission) so that
-    they appear in the unified results list even if they never went through the
-    judging subsystem. We synthesize a minimal match payload for those entries.
-    """
-    raw_history = state.get("history", []) or []
 
-    # Collect existing match identity triples to avoid duplicates
-    seen_keys = set()
-    normalized_history: List[Dict[str, Any]] = []
-    for entry in raw_history:
-        if not isinstance(entry, dict):
-            continue
-        key = (
-            str(entry.get("weight_class", "")).strip().lower(),
-            str(entry.get("red", "")).strip().lower(),
-            str(entry.get("white", "")).strip().lower(),
-            int(entry.get("completed_at") or entry.get("created_at") or 0),
-        )
-        seen_keys.add(key)
-        normalized_history.append(entry)
+def _synthesize_ko_match(wc: str, h: Dict[str, Any]) -> Dict[str, Any]:
+    """Minimal judged-match record for a KO fight that was entered straight into the Elo DB."""
+    result = h.get("result") or ""
+    red = h.get("red_corner")
+    white = h.get("white_corner")
+    ts = int(h.get("timestamp") or 0)
+    # Determine winner name & decision label
+    if result.startswith("Red wins KO"):
+        winner_name = red
+    elif result.startswith("White wins KO"):
+        winner_name = white
+    else:
+        winner_name = None
+    winner = "red" if winner_name == red else ("white" if winner_name == white else "draw")
+    headline = f"{winner_name} wins via KO" if winner_name else "KO recorded"
+    return {
+        "match_id": f"elo_{wc}_{h.get('match_id')}",
+        "weight_class": wc,
+        "red": red,
+        "white": white,
+        "created_at": ts,
+        "completed_at": ts,
+        "judges": [],
+        "pending_judges": [],
+        "is_complete": True,
+        "headline": headline,
+        "winner": winner,
+        "winner_name": winner_name,
+        "decision": "KO",
+        "scorecard_strings": [],
+        "counts": {},
+        # Embed a summary so build_match_payload does not overwrite winner
+        "summary": {
+            "counts": {},
+            "winner": winner,
+            "winner_name": winner_name,
+            "decision": "KO",
+            "scorecard_strings": [],
+            "pending_judges": [],
+            "is_complete": True,
+            "judge_cards": [],
+            "headline": headline,
+        },
+    }
+
+
+def _ko_feed(wc: str, ko_results: List[Dict[str, Any]]) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    # The per-class KO index is ascending by timestamp; walk it newest first.
+    for h in reversed(ko_results or []):
+        yield int(h.get("timestamp") or 0), wc, h
+
+
+def _merged_history(judged: Iterator[Dict[str, Any]], skip: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Newest-first merge of judged matches with every class's KO index.
 
-    # Load Elo DBs and harvest KO results not already represented.
+    ``judged`` must already be newest first; it is consumed lazily, so only as much of it
+    (and of the archive behind it) is read as ``skip + limit`` entries need.
+    """
     try:
-        all_dbs = load_all()
+        all_dbs = view_all()
     except Exception:
         all_dbs = {}
-    for wc, db in (all_dbs or {}).items():
-        hist = (db or {}).get("history", []) or []
-        for h in reversed(hist[-150:]):  # limit recent slice per class for perf
-            result = h.get("result")
-            if not isinstance(result, str):
-                continue
-            if "KO" not in result:
-                continue  # only augment KO fights
-            red = h.get("red_corner")
-            white = h.get("white_corner")
-            ts = int(h.get("timestamp") or 0)
-            key = (str(wc).strip().lower(), str(red).strip().lower(), str(white).strip().lower(), ts)
+    ko_feeds = heapq.merge(
+        *(_ko_feed(wc, (db or {}).get("ko_results")) for wc, db in (all_dbs or {}).items()),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+    judged_feed = ((_completed_at(entry), "", entry) for entry in judged)
+
+    # Match identity triples of judged entries already merged. heapq.merge yields the judged
+    # feed first on equal timestamps, so a KO's judged twin is always seen before it.
+    seen_keys = set()
+    seen_ids = set()
+    merged: List[Dict[str, Any]] = []
+    for ts, wc, entry in heapq.merge(judged_feed, ko_feeds, key=lambda item: item[0], reverse=True):
+        if limit is not None and len(merged) >= skip + limit:
+            break
+        if wc:
+            key = (
+                str(wc).strip().lower(),
+                str(entry.get("red_corner")).strip().lower(),
+                str(entry.get("white_corner")).strip().lower(),
+                ts,
+            )
             if key in seen_keys:
                 continue
-            # Determine winner name & decision label
-            if result.startswith("Red wins KO"):
-                winner_name = red
-                decision = "ko"
-            elif result.startswith("White wins KO"):
-                winner_name = white
-                decision = "ko"
-            else:
-                winner_name = None
-                decision = "ko"
-            synth = {
-                "match_id": f"elo_{wc}_{h.get('match_id')}",
-                "weight_class": wc,
-                "red": red,
-                "white": white,
-                "created_at": ts,
-                "completed_at": ts,
-                "judges": [],
-                "pending_judges": [],
-                "is_complete": True,
-                "headline": f"{winner_name} wins via KO" if winner_name else "KO recorded",
-                "winner": "red" if winner_name == red else ("white" if winner_name == white else "draw"),
-                "winner_name": winner_name,
-                "decision": "KO",
-                "scorecard_strings": [],
-                "counts": {},
-                # Embed a summary so build_match_payload does not overwrite winner
-                "summary": {
-                    "counts": {},
-                    "winner": "red" if winner_name == red else ("white" if winner_name == white else "draw"),
-                    "winner_name": winner_name,
-                    "decision": "KO",
-                    "scorecard_strings": [],
-                    "pending_judges": [],
-                    "is_complete": True,
-                    "judge_cards": [],
-                    "headline": f"{winner_name} wins via KO" if winner_name else "KO recorded",
-                },
-            }
-            normalized_history.append(synth)
             seen_keys.add(key)
+            entry = _synthesize_ko_match(wc, entry)
+        else:
+            match_id = entry.get("match_id")
+            if match_id is not None and match_id in seen_ids:
+                continue  # archived and still in the hot window after an interrupted rotation
+            seen_ids.add(match_id)
+            seen_keys.add((
+                str(entry.get("weight_class", "")).strip().lower(),
+                str(entry.get("red", "")).strip().lower(),
+                str(entry.get("white", "")).strip().lower(),
+                ts,
+            ))
+        merged.append(entry)
+    return merged[skip:]
+
+
+def _hot_history(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    raw_history = [entry for entry in (state.get("history", []) or []) if isinstance(entry, dict)]
+    # Judging history is kept newest first; only re-sort if it was edited out of order.
+    if any(_completed_at(a) < _completed_at(b) for a, b in zip(raw_history, raw_history[1:])):
+        raw_history = sorted(raw_history, key=_completed_at, reverse=True)
+    return raw_history
 
-    # Sort combined history by completion timestamp desc
-    normalized_history.sort(key=lambda e: int(e.get("completed_at") or e.get("created_at") or 0), reverse=True)
 
-    if history_limit is not None:
-        normalized_history = normalized_history[:history_limit]
+def _build_state_payload(state: Dict[str, Any], history_limit: Optional[int] = None) -> Dict[str, Any]:
+    """Build the payload for judge panels.
+
+    Augmentation: include KO fights (entered via Elo submission) so that they
+    appear in the unified results list even if they never went through the
+    judging subsystem. Each Elo DB keeps them in a timestamp-ordered
+    ``ko_results`` index, which is merged with the judging history here.
+
+    The hot state only holds the newest JUDGING_HISTORY_WINDOW judged matches; a longer list
+    reads on into the judging archive.
+    """
+    judged: Iterator[Dict[str, Any]] = iter(_hot_history(state))
+    if history_limit is None or history_limit > JUDGING_HISTORY_WINDOW:
+        judged = itertools.chain(judged, iter_judging_archive())
+    normalized_history = _merged_history(judged, limit=history_limit)
 
     meta = state.get("_meta") or {}
     meta_payload = {"version": int(meta.get("version", 0)), "updated_at": meta.get("updated_at")}
@@ -352,6 +431,107 @@ def build_state_payload(state: Dict[str, Any], history_limit: Optional[int] = No
     }
 
 
+# Built payloads, memoized per (judging state fingerprint, Elo versions, archive version,
+# history_limit). Judge
+# pages, overlays and public screens poll far more often than anything changes.
+_PAYLOAD_CACHE_SIZE = 32
+_payload_cache: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+_payload_by_revision: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+
+def _state_fingerprint(state: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+    meta = state.get("_meta")
+    if not isinstance(meta, dict):
+        return None  # never persisted; nothing stable to key on
+    current = state.get("current") or {}
+    judges = current.get("judges") if isinstance(current, dict) else None
+    return (
+        int(meta.get("version", 0)),
+        meta.get("updated_at"),
+        len(state.get("history") or []),
+        current.get("match_id") if isinstance(current, dict) else None,
+        tuple(sorted(str(k) for k in judges)) if isinstance(judges, dict) else (),
+    )
+
+
+def _remember(cache: "OrderedDict[Any, Dict[str, Any]]", key: Any, payload: Dict[str, Any]) -> None:
+    cache[key] = payload
+    cache.move_to_end(key)
+    while len(cache) > _PAYLOAD_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _copy_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Callers decorate the top level and "current" (robot details, judge id); keep those private.
+    copied = dict(payload)
+    if isinstance(copied.get("current"), dict):
+        copied["current"] = dict(copied["current"])
+    return copied
+
+
+def build_state_payload(state: Dict[str, Any], history_limit: Optional[int] = None) -> Dict[str, Any]:
+    """Memoized _build_state_payload; rebuilt only when judging or an Elo DB changed.
+
+    Cached payloads carry a ``revision`` token (stable across worker processes) that
+    clients hand back to build_state_delta.
+    """
+    fingerprint = _state_fingerprint(state)
+    if fingerprint is None:
+        return _build_state_payload(state, history_limit=history_limit)
+    # Longer lists read into the archive, which migrate --force and rotation rewrite behind the state.
+    reads_archive = history_limit is None or history_limit > JUDGING_HISTORY_WINDOW
+    key = (fingerprint, elo_versions(), judging_archive_version() if reads_archive else None, history_limit)
+    with _payload_cache_lock:
+        payload = _payload_cache.get(key)
+    if payload is None:
+        payload = _build_state_payload(state, history_limit=history_limit)
+        payload["revision"] = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        with _payload_cache_lock:
+            _remember(_payload_cache, key, payload)
+            _remember(_payload_by_revision, payload["revision"], payload)
+    return _copy_payload(payload)
+
+
+def build_state_delta(state: Dict[str, Any], since_revision: str, history_limit: Optional[int] = None) -> Dict[str, Any]:
+    """Payload holding only ``current`` and the history items prepended since ``since_revision``.
+
+    Falls back to the full payload (``"delta": False``) when the older payload is no longer
+    cached or when history changed in any way other than new items arriving on top.
+    """
+    payload = build_state_payload(state, history_limit=history_limit)
+    with _payload_cache_lock:
+        previous = _payload_by_revision.get(since_revision)
+    if previous is None:
+        return dict(payload, delta=False)
+    new_history = payload.get("history", [])
+    old_history = previous.get("history", [])
+    old_ids = {item.get("match_id") for item in old_history}
+    fresh = 0
+    while fresh < len(new_history) and new_history[fresh].get("match_id") not in old_ids:
+        fresh += 1
+    overlap = new_history[fresh:]
+    if overlap != old_history[: len(overlap)]:
+        return dict(payload, delta=False)
+    delta = dict(payload, delta=True, since=since_revision)
+    delta["history"] = new_history[:fresh]
+    return delta
+
+
+def history_page(state: Dict[str, Any], page: int = 1, per_page: int = JUDGING_HISTORY_WINDOW) -> Dict[str, Any]:
+    """One page of the full results list, newest first: hot history, then the judging archive."""
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), 100)
+    judged = itertools.chain(_hot_history(state), iter_judging_archive())
+    # One extra entry tells whether another page exists.
+    entries = _merged_history(judged, skip=(page - 1) * per_page, limit=per_page + 1)
+    return {
+        "page": page,
+        "per_page": per_page,
+        "has_more": len(entries) > per_page,
+        "history": [build_match_payload(entry) for entry in entries[:per_page]],
+    }
+
 def ensure_state_for_schedule(state: Dict[str, Any], schedule_list: List[Dict[str, Any]], judge_count: int = JUDGE_COUNT) -> Tuple[Dict[str, Any], bool]:
     if not isinstance(state, dict):
         state = default_state()
@@ -361,14 +541,12 @@ def ensure_state_for_schedule(state: Dict[str, Any], schedule_list: List[Dict[st
         state["history"] = []
         history = state["history"]
         changed = True
-    normalized_history: List[Dict[str, Any]] = []
-    for entry in history:
-        normalized_entry, entry_changed = normalize_match(entry, judge_count=judge_count)
-        normalized_history.append(normalized_entry or {})
-        if entry_changed:
-            changed = True
-    if normalized_history != history:
-        state["history"] = normalized_history
+    # Stamped entries are skipped in O(1); only legacy ones are rebuilt and replaced in place.
+    for index, entry in enumerate(history):
+        if is_normalized(entry, judge_count):
+            continue
+        normalized_entry, _ = normalize_match(entry, judge_count=judge_count)
+        history[index] = normalized_entry or {}
         changed = True
     current = state.get("current")
     top_card = schedule_list[0] if schedule_list else None
@@ -379,10 +557,61 @@ def ensure_state_for_schedule(state: Dict[str, Any], schedule_list: List[Dict[st
                 state["current"] = normalized_current
                 changed = True
         else:
-            state["current"] = create_match_record(top_card)
+            # Normalized (and stamped) straight away, so the next sync has nothing left to write.
+            state["current"], _ = normalize_match(create_match_record(top_card), judge_count=judge_count)
             changed = True
     else:
         if current is not None:
             state["current"] = None
             changed = True
     return state, changed
+
+
+def migrate_judging_state(judge_count: int = JUDGE_COUNT, force: bool = False) -> Dict[str, int]:
+    """Bring the stored judging state and archive up to JUDGING_SCHEMA_VERSION in one pass.
+
+    Stale hot matches are normalized in place (and any history past the window rotated out by
+    the save); stale archived matches are re-archived, superseding their old lines. ``force``
+    re-normalizes stamped matches too, for files that were edited by hand.
+    """
+    counts = {"current": 0, "history": 0, "archive": 0}
+
+    def renormalized(entry: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(entry, dict) or (not force and is_normalized(entry, judge_count)):
+            return None
+        normalized, changed = normalize_match(entry, judge_count=judge_count, force=True)
+        return normalized if changed else None
+
+    def migrate(state: Dict[str, Any]) -> Dict[str, Any]:
+        current = renormalized(state.get("current"))
+        if current is not None:
+            state["current"] = current
+            counts["current"] += 1
+        history = state.get("history")
+        if isinstance(history, list):
+            for index, entry in enumerate(history):
+                normalized = renormalized(entry)
+                if normalized is not None:
+                    history[index] = normalized
+                    counts["history"] += 1
+        return state
+
+    update_judging_state(migrate)
+    for event in judging_archive_events():
+        stale = [entry for entry in map(renormalized, load_judging_archive(event)) if entry is not None]
+        archive_judging_entries(stale)
+        counts["archive"] += len(stale)
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="BotBrawl judging maintenance")
+    parser.add_argument("command", choices=["migrate"],
+                        help="migrate: normalize and stamp every judged match in the current schema")
+    parser.add_argument("--force", action="store_true",
+                        help="also re-normalize stamped matches (after editing judging files by hand)")
+    args = parser.parse_args()
+    migrated = migrate_judging_state(force=args.force)
+    print(f"migrate: {migrated['current']} current, {migrated['history']} history, "
+          f"{migrated['archive']} archived matches updated to schema {JUDGING_SCHEMA_VERSION}")
@@ -1,15 +1,42 @@
+import concurrent.futures
+from array import array
+import hashlib
+import heapq
+import itertools
+import math
+import multiprocessing
 import random
-from typing import Dict, Optional
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
 
-from elo import DEFAULT_RATING
+from elo import DEFAULT_RATING, get_expected
+from matching import max_weight_matching
 
 try:  # pragma: no cover - fallback for tests that provide db explicitly
-    from storage import load_all as _load_all_dbs
+    from storage import view_all as _load_all_dbs, derive_from_view as _derive_from_view
 except Exception:  # pragma: no cover - allow generate() to be used without storage module
     _load_all_dbs = None
 
+    def _derive_from_view(view, name, build):
+        return build(view)
+
 
 COOLDOWN_MATCHES = 3
+STRATEGIES = ("greedy", "matching")
+
+# Matching strategy edge costs. A rematch outweighs everything else, catching up a robot that
+# sat out a round outweighs rating closeness, and the weighted rating term (scaled to at most
+# MATCHING_RATING_GAP_CAP) only breaks the remaining ties.
+MATCHING_REMATCH_COST = 100_000
+MATCHING_NEED_BONUS = 1_000
+MATCHING_RATING_GAP_CAP = 999
+
+# Weights of the schedule objective (see score_schedule; lower totals are better). A class DB
+# can override any of them under settings["schedule_weights"].
+DEFAULT_OBJECTIVE_WEIGHTS: Dict[str, float] = {"rating": 1.0, "rematch": 10.0, "cooldown": 5.0, "interleave": 0.5}
 
 RobotKey = Tuple[str, str]
 PairKey = Tuple[str, str, str]
@@ -21,22 +48,6 @@ def _normalize(name: Optional[str]) -> str:
     return unicodedata.normalize("NFKC", str(name)).strip()
 
 
-def _canonicalize(name: Optional[str], roster: Iterable[str]) -> str:
-    normalized = _normalize(name)
-    if not normalized:
-        return ""
-
-    if normalized in roster:
-        return normalized
-
-    lowered = normalized.casefold()
-    for candidate in roster:
-        if candidate.casefold() == lowered:
-            return candidate
-
-    return normalized
-
-
 def _collect_present(db_by_class: Dict[str, dict]) -> Dict[str, List[str]]:
     present = {}
     for weight_class, payload in db_by_class.items():
@@ -51,68 +62,119 @@ def _collect_present(db_by_class: Dict[str, dict]) -> Dict[str, List[str]]:
     return present
 
 
-def _build_history_pairs(db_by_class: Dict[str, dict]) -> Set[PairKey]:
-    seen: Set[PairKey] = set()
-    for weight_class, payload in db_by_class.items():
-        roster = payload.get("robots") or {}
-        normalized_roster = {
-            _normalize(name): meta for name, meta in roster.items()
-        }
-        history = payload.get("history") or []
-        for match in history:
-            red = _canonicalize(match.get("red_corner"), normalized_roster.keys())
-            white = _canonicalize(match.get("white_corner"), normalized_roster.keys())
-            if not red or not white:
-                continue
-            pair = tuple(sorted((red, white)))
-            seen.add((weight_class, *pair))
-    return seen
-
-
-def _eligible_pairs(present: Dict[str, List[str]], history_pairs: Set[PairKey]) -> Dict[str, List[Tuple[str, str]]]:
-    pairs: Dict[str, List[Tuple[str, str]]] = {}
-    for weight_class, robots in present.items():
-        class_pairs: List[Tuple[str, str]] = []
-        for i in range(len(robots)):
-            for j in range(i + 1, len(robots)):
-                a, b = robots[i], robots[j]
-                pair = (weight_class, *tuple(sorted((a, b))))
-                if pair in history_pairs:
-                    continue
-                class_pairs.append(tuple(sorted((a, b))))
-        if class_pairs:
-            pairs[weight_class] = class_pairs
-    return pairs
+class _ClassIndex(NamedTuple):
+    """One weight class with robots interned to ids (their position in the sorted roster)."""
+
+    names: List[str]
+    ids: Dict[str, int]
+    folded: Dict[str, int]  # casefolded name -> id, for history typed with different case
+    met: array  # met[i * len(names) + j]: times robots i and j have fought, kept symmetric
+
+    def robot_id(self, name: Optional[str]) -> Optional[int]:
+        normalized = _normalize(name)
+        found = self.ids.get(normalized)
+        return found if found is not None else self.folded.get(normalized.casefold())
+
+    def met_count(self, a: int, b: int) -> int:
+        return self.met[a * len(self.names) + b]
+
+
+def _build_class_index(payload: dict) -> _ClassIndex:
+    roster = [_normalize(name) for name in (payload.get("robots") or {})]
+    names = sorted(set(roster))
+    ids = {name: i for i, name in enumerate(names)}
+    folded: Dict[str, int] = {}
+    for name in roster:  # first roster entry wins a casefold clash, as a linear scan would
+        folded.setdefault(name.casefold(), ids[name])
+    index = _ClassIndex(names, ids, folded, array("H", bytes(2 * len(names) ** 2)))
+    size = len(names)
+    for match in payload.get("history") or []:
+        red = index.robot_id(match.get("red_corner"))
+        white = index.robot_id(match.get("white_corner"))
+        if red is None or white is None or red == white:
+            continue
+        if index.met[red * size + white] < 0xFFFF:
+            index.met[red * size + white] += 1
+            index.met[white * size + red] += 1
+    return index
+
+
+def _class_index(payload: dict) -> _ClassIndex:
+    """Pair index for one class DB, built once per cached DB version when it is a storage view."""
+    return _derive_from_view(payload, "schedule_engine.class_index", _build_class_index)
+
+
+class _Problem(NamedTuple):
+    """Greedy search input with every robot and eligible pair reduced to an integer id."""
+
+    robots: List[RobotKey]  # robot id -> (weight class, name)
+    pairs: List[Tuple[int, int]]  # pair id -> (robot id, robot id), in class then roster order
+    robot_pairs: List[List[int]]  # robot id -> ids of its eligible pairs
+    pair_cost: List[float]  # pair id -> weighted rating term, which the heap uses as a tiebreak bias
+    interleave_cost: Dict[str, float]  # weight class -> interleave weight, for scoring attempts
+
+
+def _build_problem(
+    present: Dict[str, List[str]],
+    indexes: Dict[str, _ClassIndex],
+    ratings: Optional[Dict[RobotKey, float]] = None,
+    class_weights: Optional[Dict[str, Dict[str, float]]] = None,
+) -> _Problem:
+    ratings = ratings or {}
+    class_weights = class_weights or {}
+    robots: List[RobotKey] = []
+    pairs: List[Tuple[int, int]] = []
+    pair_cost: List[float] = []
+    for weight_class, names in present.items():
+        index = indexes[weight_class]
+        size = len(index.names)
+        base = len(robots)
+        local = [index.ids[name] for name in names]
+        robots.extend((weight_class, name) for name in names)
+        rating_weight = class_weights.get(weight_class, DEFAULT_OBJECTIVE_WEIGHTS)["rating"]
+        class_ratings = [ratings.get((weight_class, name), DEFAULT_RATING) for name in names]
+        for i in range(len(local)):
+            row = local[i] * size
+            for j in range(i + 1, len(local)):
+                if index.met[row + local[j]] == 0:
+                    pairs.append((base + i, base + j))
+                    pair_cost.append(rating_weight * _rating_penalty(class_ratings[i], class_ratings[j]))
+    robot_pairs: List[List[int]] = [[] for _ in robots]
+    for pair_id, (a, b) in enumerate(pairs):
+        robot_pairs[a].append(pair_id)
+        robot_pairs[b].append(pair_id)
+    interleave_cost = {
+        weight_class: class_weights.get(weight_class, DEFAULT_OBJECTIVE_WEIGHTS)["interleave"] for weight_class in present
+    }
+    return _Problem(robots, pairs, robot_pairs, pair_cost, interleave_cost)
 
 
-def _index_robot_opponents(pairs: Dict[str, List[Tuple[str, str]]]) -> Dict[RobotKey, List[str]]:
-    mapping: Dict[RobotKey, List[str]] = defaultdict(list)
-    for weight_class, class_pairs in pairs.items():
-        for a, b in class_pairs:
-            mapping[(weight_class, a)].append(b)
-            mapping[(weight_class, b)].append(a)
-    return mapping
+def _attempt_cost(problem: _Problem, pair_ids: List[int]) -> float:
+    """Objective of one greedy attempt. Attempts only book fresh pairs outside cooldown, so the
+    rematch and cooldown terms are zero and only rating and interleave remain."""
+    cost = 0.0
+    previous_class = None
+    for pair_id in pair_ids:
+        cost += problem.pair_cost[pair_id]
+        weight_class = problem.robots[problem.pairs[pair_id][0]][0]
+        if weight_class == previous_class:
+            cost += problem.interleave_cost[weight_class]
+        previous_class = weight_class
+    return cost
 
 
 def _cooldown_ok(last_seen: int, current_index: int) -> bool:
     return current_index - last_seen > COOLDOWN_MATCHES
 
 
-def _available_opponents(
-    key: RobotKey,
-    opponents: Dict[RobotKey, List[str]],
-    used_pairs: Set[PairKey],
-    counts: Dict[RobotKey, int],
-    desired_per_robot: int,
-) -> int:
-    weight_class, robot = key
-    options = 0
-    for opponent in opponents.get(key, []):
-        pair = tuple(sorted((robot, opponent)))
-        pair_key: PairKey = (weight_class, *pair)
-        if pair_key in used_pairs:
+def has_unscheduled_fresh_opponent(wc, robot, present, hist, tonight, used_pairs, desired_per_robot):
+    for opponent in present.get(wc, []):
+        if opponent == robot:
             continue
-        if counts[(weight_class, opponent)] >= desired_per_robot:
+        if tonight.get((wc, opponent), 0) >= desired_per_robot:
+            continue
+        pair = tuple(sorted((robot, opponent)))
+        if (wc, *pair) in used_pairs:
             continue
         if hist.get((wc, *pair), 0) == 0:
             return True
@@ -120,12 +182,11 @@ def _available_opponents(
 def build_history_counts(db_by_class):
     hist = {}
     for wc, db in db_by_class.items():
-        seen={}
-        for m in db.get("history", []):
-            r=m.get("red_corner"); w=m.get("white_corner")
-            if not r or not w: continue
-            k=tuple(sorted([r,w])); seen[k]=seen.get(k,0)+1
-        for (a,b),c in seen.items(): hist[(wc,a,b)]=c
+        index=_class_index(db); names=index.names; n=len(names)
+        for i in range(n):
+            for j in range(i+1, n):
+                c=index.met[i*n+j]
+                if c: hist[(wc,names[i],names[j])]=c
     return hist
 def present_by_class(db_by_class):
     out={}
@@ -135,92 +196,534 @@ def present_by_class(db_by_class):
     return out
 def rating_lookup(db_by_class):
     return {(wc,n): info.get("rating", DEFAULT_RATING) for wc,db in db_by_class.items() for n,info in (db.get("robots",{}) or {}).items()}
-def generate(
-    desired_per_robot: int = 1,
-    interleave: bool = True,
+
+
+def objective_weights(payload: Optional[dict], overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Objective weights for one class: defaults, then its settings, then ``overrides``."""
+    weights = dict(DEFAULT_OBJECTIVE_WEIGHTS)
+    configured = ((payload or {}).get("settings") or {}).get("schedule_weights") or {}
+    for term, value in {**configured, **(overrides or {})}.items():
+        try:
+            weights[term] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return weights
+
+
+def _rating_penalty(rating_a: float, rating_b: float) -> float:
+    """0 for an even fight, approaching 1 as the favourite's expected score nears certainty."""
+    return abs(2.0 * get_expected(rating_a, rating_b) - 1.0)
+
+
+class _CardArrays(NamedTuple):
+    """A card list flattened once, so every objective term is a single pass over plain arrays."""
+
+    classes: List[str]
+    red: List[RobotKey]
+    white: List[RobotKey]
+    expected: array  # card -> red's expected score ('d')
+    met: array  # card -> meetings before tonight ('H')
+
+
+def _card_arrays(schedule: List[Dict[str, Any]], db_by_class: Dict[str, dict]) -> _CardArrays:
+    indexes = {weight_class: _class_index(payload) for weight_class, payload in db_by_class.items()}
+    ratings = {(wc, _normalize(name)): rating for (wc, name), rating in rating_lookup(db_by_class).items()}
+    classes, red, white = [], [], []
+    expected, met = array("d"), array("H")
+    for card in schedule:
+        weight_class, a, b = _card_key(card, indexes)
+        classes.append(weight_class)
+        red.append((weight_class, a))
+        white.append((weight_class, b))
+        expected.append(get_expected(ratings.get((weight_class, a), DEFAULT_RATING), ratings.get((weight_class, b), DEFAULT_RATING)))
+        index = indexes.get(weight_class)
+        a_id = index.robot_id(a) if index is not None else None
+        b_id = index.robot_id(b) if index is not None else None
+        met.append(min(index.met_count(a_id, b_id), 0xFFFF) if a_id is not None and b_id is not None else 0)
+    return _CardArrays(classes, red, white, expected, met)
+
+
+def _rating_term(cards: _CardArrays) -> List[float]:
+    return [abs(2.0 * expected - 1.0) for expected in cards.expected]
+
+
+def _rematch_term(cards: _CardArrays) -> List[float]:
+    seen: Dict[PairKey, int] = defaultdict(int)
+    values = []
+    for weight_class, (_, a), (_, b), met in zip(cards.classes, cards.red, cards.white, cards.met):
+        pair = _unique_pair_key((weight_class, a, b))
+        values.append(float(met + seen[pair]))
+        seen[pair] += 1
+    return values
+
+
+def _cooldown_term(cards: _CardArrays) -> List[float]:
+    """Per card, how many slots short of full rest each robot is (0 when both are rested)."""
+    last_seen: Dict[RobotKey, int] = {}
+    values = []
+    for position, robots in enumerate(zip(cards.red, cards.white)):
+        shortfall = 0
+        for robot in robots:
+            previous = last_seen.get(robot)
+            if previous is not None:
+                shortfall += max(0, COOLDOWN_MATCHES + 1 - (position - previous))
+            last_seen[robot] = position
+        values.append(float(shortfall))
+    return values
+
+
+def _interleave_term(cards: _CardArrays) -> List[float]:
+    return [float(position > 0 and cards.classes[position - 1] == weight_class) for position, weight_class in enumerate(cards.classes)]
+
+
+# Objective terms: name -> per-card penalties for a flattened card list. Add an entry (and a
+# weight under the same name) to score a new concern; terms without a weight count at 1.0.
+OBJECTIVE_TERMS: Dict[str, Callable[[_CardArrays], Sequence[float]]] = {
+    "rating": _rating_term,
+    "rematch": _rematch_term,
+    "cooldown": _cooldown_term,
+    "interleave": _interleave_term,
+}
+
+
+def score_schedule(
+    schedule: List[Dict[str, Any]],
     db_by_class: Optional[Dict[str, dict]] = None,
-    seed: Optional[int] = None,
-):
-    if seed is not None:
-        random.seed(seed)
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Objective value of a card, lower is better, as ``{"total", "terms": {name: weighted}}``.
+
+    Each card is weighted by its own class's objective_weights; ``weights`` overrides them for
+    every class, which is how two cards can be compared on equal terms.
+    """
     if db_by_class is None:
         if _load_all_dbs is None:
             raise RuntimeError("Database loader unavailable; provide db_by_class explicitly")
         db_by_class = _load_all_dbs()
-    if not db_by_class:
+    cards = _card_arrays(schedule, db_by_class)
+    class_weights = {weight_class: objective_weights(db_by_class.get(weight_class), weights) for weight_class in set(cards.classes)}
+    card_weights = [class_weights[weight_class] for weight_class in cards.classes]
+    terms = {}
+    for name, term in OBJECTIVE_TERMS.items():
+        terms[name] = round(sum(w.get(name, 1.0) * value for w, value in zip(card_weights, term(cards))), 4)
+    return {"total": round(sum(terms.values()), 4), "terms": terms}
+
+
+def _max_schedule_length(problem: _Problem, desired_per_robot: int) -> int:
+    """Upper bound on matches: every robot fights min(desired, eligible opponents) times."""
+    by_class: Dict[str, int] = defaultdict(int)
+    for (weight_class, _), robot_pairs in zip(problem.robots, problem.robot_pairs):
+        by_class[weight_class] += min(desired_per_robot, len(robot_pairs))
+    return sum(total // 2 for total in by_class.values())
+
+
+def _run_single_attempt(problem: _Problem, desired_per_robot: int, deadline: Optional[float] = None) -> List[int]:
+    """Greedy pass: repeatedly book the off-cooldown pair whose robots have the fewest options left.
+
+    Candidates live in a heap keyed ``(available, -remaining_need, tiebreak)``; after each pick only
+    pairs touching a robot whose count or option total changed are re-keyed. Superseded heap entries
+    are skipped via per-pair stamps, and pairs still on cooldown are parked until the pick at which
+    both robots are rested. Returns pair ids in booking order; past ``deadline`` (a
+    ``time.monotonic()`` value) it stops booking and returns the card built so far.
+    """
+    if desired_per_robot <= 0:
         return []
-    hist = build_history_counts(db_by_class); present = present_by_class(db_by_class)
-    if not present: return []
-    tonight={(wc,r):0 for wc,rs in present.items() for r in rs}; used_pairs=set(); sched=[]; last=set(); ratings=rating_lookup(db_by_class)
-    def candidates():
-        C=[]
-        for wc,rs in present.items():
-            for i in range(len(rs)):
-                for j in range(i+1,len(rs)):
-                    a,b=rs[i],rs[j]
-                    if tonight[(wc,a)]>=desired_per_robot or tonight[(wc,b)]>=desired_per_robot: continue
-                    key=tuple(sorted([a,b]))
-                    if (wc,*key) in used_pairs: continue
-                    met=hist.get((wc,*key),0); never=1 if met==0 else 0
-                    fresh_penalty = 0
-                    if met>0 and (
-                        has_unscheduled_fresh_opponent(wc, a, present, hist, tonight, used_pairs, desired_per_robot)
-                        or has_unscheduled_fresh_opponent(wc, b, present, hist, tonight, used_pairs, desired_per_robot)
-                    ):
-                        fresh_penalty = 1
-                    diff=abs(ratings.get((wc,a),DEFAULT_RATING)-ratings.get((wc,b),DEFAULT_RATING))
-                    consec = (a in last or b in last)
-                    C.append((-never, fresh_penalty, met, diff, consec, random.random(), wc, a, b))
-        return C
-    while True:
-        candidates: List[Tuple[Tuple[int, int, float], PairKey]] = []
+    ends = problem.pairs
+    robot_pairs = problem.robot_pairs
+    counts = [0] * len(problem.robots)
+    last_seen = [-(COOLDOWN_MATCHES + 1)] * len(problem.robots)
+    used = bytearray(len(ends))
+    schedule: List[int] = []
+    # Nobody has fought yet, so every eligible opponent is still an option.
+    available = [len(pair_ids) for pair_ids in robot_pairs]
+    # Random restarts stay diverse, while the rating term tilts ties toward closer fights.
+    tiebreak = [cost + random.random() for cost in problem.pair_cost]
+    stamps = [0] * len(ends)  # -1 once a pair is booked or can never be booked
+    heap: List[Tuple[Tuple[int, int, float], int, int]] = [
+        ((available[a] + available[b], -2 * desired_per_robot, tiebreak[pair_id]), 0, pair_id)
+        for pair_id, (a, b) in enumerate(ends)
+    ]
+    heapq.heapify(heap)
+    parked: Dict[int, list] = defaultdict(list)
+    open_robots = len(problem.robots)  # robots still short of desired_per_robot
+    pops = 0
+
+    while (heap or parked) and open_robots >= 2:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
         index = len(schedule)
-        for weight_class, class_pairs in pairs.items():
-            for a, b in class_pairs:
-                pair_key: PairKey = (weight_class, a, b)
-                if pair_key in used_pairs:
-                    continue
-                count_a = counts[(weight_class, a)]
-                count_b = counts[(weight_class, b)]
-                if count_a >= desired_per_robot or count_b >= desired_per_robot:
-                    continue
-                if not _cooldown_ok(last_seen[(weight_class, a)], index):
-                    continue
-                if not _cooldown_ok(last_seen[(weight_class, b)], index):
-                    continue
-                remaining_need = (desired_per_robot - count_a) + (desired_per_robot - count_b)
-                available = _available_opponents((weight_class, a), opponents, used_pairs, counts, desired_per_robot)
-                available += _available_opponents((weight_class, b), opponents, used_pairs, counts, desired_per_robot)
-                candidates.append(
-                    ((available, -remaining_need, random.random()), pair_key)
-                )
-        if not candidates:
+        for entry in parked.pop(index, ()):
+            heapq.heappush(heap, entry)
+        chosen = -1
+        while heap:
+            pops += 1
+            if deadline is not None and not pops % 4096 and time.monotonic() >= deadline:
+                break  # draining stale entries can take a while on big rosters
+            entry = heapq.heappop(heap)
+            pair_id = entry[2]
+            if stamps[pair_id] != entry[1]:
+                continue  # superseded by a re-keyed entry, or already retired
+            a, b = ends[pair_id]
+            if counts[a] >= desired_per_robot or counts[b] >= desired_per_robot:
+                stamps[pair_id] = -1
+                continue
+            if not _cooldown_ok(last_seen[a], index) or not _cooldown_ok(last_seen[b], index):
+                parked[max(last_seen[a], last_seen[b]) + COOLDOWN_MATCHES + 1].append(entry)
+                continue
+            chosen = pair_id
+            break
+        if chosen < 0:
             break
-        candidates.sort(key=lambda item: item[0])
-        chosen = candidates[0][1]
-        weight_class, red, white = chosen
+
+        stamps[chosen] = -1
+        used[chosen] = 1
         schedule.append(chosen)
-        counts[(weight_class, red)] += 1
-        counts[(weight_class, white)] += 1
-        last_seen[(weight_class, red)] = len(schedule) - 1
-        last_seen[(weight_class, white)] = len(schedule) - 1
-        used_pairs.add(_unique_pair_key(chosen))
+        touched = list(ends[chosen])
+        for robot in touched[:2]:
+            counts[robot] += 1
+            last_seen[robot] = index
+            available[robot] -= 1  # the pair just booked no longer counts as an option
+        for robot in touched[:2]:
+            if counts[robot] < desired_per_robot:
+                continue
+            open_robots -= 1
+            # Saturated: stops counting as an option for everyone it has not fought yet.
+            for pair_id in robot_pairs[robot]:
+                if used[pair_id]:
+                    continue
+                a, b = ends[pair_id]
+                opponent = b if a == robot else a
+                available[opponent] -= 1
+                touched.append(opponent)
+        for robot in set(touched):
+            for pair_id in robot_pairs[robot]:
+                stamp = stamps[pair_id]
+                if stamp < 0:
+                    continue
+                stamps[pair_id] = stamp + 1
+                a, b = ends[pair_id]
+                remaining_need = 2 * desired_per_robot - counts[a] - counts[b]
+                rank = (available[a] + available[b], -remaining_need, tiebreak[pair_id])
+                heapq.heappush(heap, (rank, stamp + 1, pair_id))
     return schedule
 
 
+def _pair_keys(problem: _Problem, pair_ids: List[int]) -> List[PairKey]:
+    keys: List[PairKey] = []
+    for pair_id in pair_ids:
+        a, b = problem.pairs[pair_id]
+        (weight_class, red), (_, white) = problem.robots[a], problem.robots[b]
+        keys.append((weight_class, red, white))
+    return keys
+
+
 def _unique_pair_key(pair: PairKey) -> PairKey:
     weight_class, a, b = pair
     ordered = tuple(sorted((a, b)))
     return (weight_class, *ordered)
 
 
+def _matching_round(
+    weight_class: str,
+    robots: List[str],
+    counts: Dict[RobotKey, int],
+    desired_per_robot: int,
+    used_pairs: Set[PairKey],
+    index: _ClassIndex,
+    ratings: Dict[RobotKey, float],
+    rating_weight: float = DEFAULT_OBJECTIVE_WEIGHTS["rating"],
+) -> List[PairKey]:
+    """One round for one class: a maximum-cardinality matching of least total cost."""
+    needy = [robot for robot in robots if counts[(weight_class, robot)] < desired_per_robot]
+    edges: List[Tuple[int, int, int]] = []
+    for i in range(len(needy)):
+        for j in range(i + 1, len(needy)):
+            pair_key: PairKey = _unique_pair_key((weight_class, needy[i], needy[j]))
+            if pair_key in used_pairs:
+                continue
+            _, a, b = pair_key
+            need = 2 * desired_per_robot - counts[(weight_class, a)] - counts[(weight_class, b)]
+            penalty = rating_weight * _rating_penalty(
+                ratings.get((weight_class, a), DEFAULT_RATING), ratings.get((weight_class, b), DEFAULT_RATING)
+            )
+            met = index.met_count(index.ids[a], index.ids[b])
+            cost = MATCHING_REMATCH_COST * met + min(int(MATCHING_RATING_GAP_CAP * penalty), MATCHING_RATING_GAP_CAP)
+            edges.append((i, j, MATCHING_NEED_BONUS * need - cost))
+    mate = max_weight_matching(edges, maxcardinality=True)
+    return [
+        _unique_pair_key((weight_class, needy[v], needy[w]))
+        for v, w in enumerate(mate)
+        if w > v
+    ]
+
+
+def _sequence_rounds(rounds: List[List[PairKey]]) -> List[PairKey]:
+    """Order stacked rounds into one card, keeping COOLDOWN_MATCHES spacing wherever possible.
+
+    Each pick prefers a pair whose robots are both rested, then the earliest round, then the
+    longest rest; a pair is only booked inside its robots' cooldown when nothing else is left.
+    """
+    remaining = [(round_index, random.random(), pair_key) for round_index, pairs in enumerate(rounds) for pair_key in pairs]
+    last_seen: Dict[RobotKey, int] = defaultdict(lambda: -(COOLDOWN_MATCHES + 1))
+    schedule: List[PairKey] = []
+    while remaining:
+        index = len(schedule)
+
+        def rank(item):
+            round_index, tiebreak, (weight_class, a, b) = item
+            rest = index - max(last_seen[(weight_class, a)], last_seen[(weight_class, b)])
+            return (rest <= COOLDOWN_MATCHES, round_index, -rest, tiebreak)
+
+        best = min(range(len(remaining)), key=lambda position: rank(remaining[position]))
+        weight_class, a, b = remaining.pop(best)[2]
+        schedule.append((weight_class, a, b))
+        last_seen[(weight_class, a)] = last_seen[(weight_class, b)] = index
+    return schedule
+
+
+def _generate_matching(
+    present: Dict[str, List[str]],
+    db_by_class: Dict[str, dict],
+    indexes: Dict[str, _ClassIndex],
+    desired_per_robot: int,
+    class_weights: Optional[Dict[str, Dict[str, float]]] = None,
+) -> List[PairKey]:
+    """Stack per-class matching rounds until every robot reaches its target or no pair is left.
+
+    Unlike the greedy search this may book a rematch, at a cost no fresh pairing can reach,
+    rather than leave a present robot without a fight.
+    """
+    ratings = {(wc, _normalize(name)): rating for (wc, name), rating in rating_lookup(db_by_class).items()}
+    counts: Dict[RobotKey, int] = defaultdict(int)
+    used_pairs: Set[PairKey] = set()
+    rounds: List[List[PairKey]] = []
+    # Odd rosters sit one robot out per round, so allow catch-up rounds beyond the target.
+    for _ in range(2 * max(desired_per_robot, 0)):
+        booked: List[PairKey] = []
+        for weight_class, robots in present.items():
+            booked.extend(
+                _matching_round(
+                    weight_class, robots, counts, desired_per_robot, used_pairs, indexes[weight_class], ratings,
+                    (class_weights or {}).get(weight_class, DEFAULT_OBJECTIVE_WEIGHTS)["rating"],
+                )
+            )
+        if not booked:
+            break
+        for pair_key in booked:
+            weight_class, a, b = pair_key
+            counts[(weight_class, a)] += 1
+            counts[(weight_class, b)] += 1
+            used_pairs.add(pair_key)
+        rounds.append(booked)
+    return _sequence_rounds(rounds)
+
+
+def derive_seed(base_seed: int, attempt: int) -> int:
+    """Seed for one multi-start attempt; depends only on the base seed and the attempt number."""
+    digest = hashlib.sha256(f"{base_seed}:{attempt}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _run_attempt_chunk(
+    problem: _Problem,
+    desired_per_robot: int,
+    base_seed: int,
+    start: int,
+    stop: int,
+    longest_possible: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> Optional[Tuple[int, List[int]]]:
+    """Process-pool entry point: run attempts ``start..stop-1`` and return the first longest,
+    lowest-cost one.
+
+    The chunk returns as soon as an attempt reaches ``longest_possible``; later attempts could
+    not beat it. ``deadline`` is a ``time.monotonic()`` value (the clock is system-wide, so it
+    holds in pool workers too) and cuts the running attempt short. Returns None when no attempt
+    started before the deadline.
+    """
+    best: Optional[Tuple[int, float, int, List[int]]] = None  # (length, -cost, -attempt, schedule)
+    for attempt in range(start, stop):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        random.seed(derive_seed(base_seed, attempt))
+        schedule_attempt = _run_single_attempt(problem, desired_per_robot, deadline)
+        candidate = (len(schedule_attempt), -_attempt_cost(problem, schedule_attempt), -attempt, schedule_attempt)
+        if best is None or candidate[:3] > best[:3]:
+            best = candidate
+        if longest_possible is not None and best[0] >= longest_possible:
+            break
+    return (-best[2], best[3]) if best is not None else None
+
+
+# One pool for the whole process: spawning interpreters costs far more than a typical search,
+# so requests share it (growing it if one asks for more workers) instead of paying that each time.
+_POOL: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _shared_pool(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS < workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)  # searches already running on it finish normally
+            # "spawn" rather than fork: the web app calls this from a threaded gunicorn worker.
+            _POOL = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _POOL_WORKERS = workers
+        return _POOL
+
+
+def _discard_pool(pool: concurrent.futures.ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next search starts a fresh one."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL, _POOL_WORKERS = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _search_multi_start(
+    problem: _Problem,
+    desired_per_robot: int,
+    base_seed: int,
+    attempts: int,
+    longest_possible: int,
+    workers: int,
+    time_budget: Optional[float],
+) -> List[int]:
+    """Fan the restart loop out over the shared process pool (see _shared_pool).
+
+    Attempt ``i`` is seeded with ``derive_seed(base_seed, i)`` and every chunk stops at its first
+    full-length attempt, so the winner is the first attempt (in attempt order) that reaches
+    ``longest_possible``, or else the longest, then lowest-cost, then lowest-numbered attempt. A
+    search that runs to completion therefore returns the same card for a given base seed whatever
+    the worker count. Attempt 0 runs here first, so a card that is full length at once never
+    touches the pool. ``time_budget`` is a hard stop: attempts still running when it expires are
+    cut short, and the best of what finished is returned.
+    """
+    deadline = None if not time_budget else time.monotonic() + time_budget
+    chunk = max(1, math.ceil(attempts / (max(workers, 1) * 4)))
+    results: Dict[int, Tuple[int, List[int]]] = {}  # chunk start -> (attempt, schedule)
+
+    def first_full_chunk() -> Optional[int]:
+        return min((start for start, (_, ids) in results.items() if len(ids) >= longest_possible), default=None)
+
+    def pick() -> List[int]:
+        cutoff = first_full_chunk()
+        ranked = [
+            (len(ids), -_attempt_cost(problem, ids), -attempt, ids)
+            for start, (attempt, ids) in results.items()
+            if cutoff is None or start <= cutoff
+        ]
+        return max(ranked, key=lambda item: item[:3])[3] if ranked else []
+
+    def run_here(bounds: Sequence[Tuple[int, int]]) -> None:
+        saved_state = random.getstate()
+        try:
+            for start, stop in bounds:
+                if first_full_chunk() is not None:
+                    break
+                result = _run_attempt_chunk(problem, desired_per_robot, base_seed, start, stop, longest_possible, deadline)
+                if result is None:
+                    break  # budget spent
+                results[start] = result
+        finally:
+            random.setstate(saved_state)  # keep the caller's stream (used for corner orientation) intact
+
+    run_here([(0, 1)])
+    bounds = [(start, min(start + chunk, attempts)) for start in range(1, attempts, chunk)]
+    if workers <= 1 or first_full_chunk() is not None:
+        run_here(bounds)
+        return pick()
+
+    pool = _shared_pool(workers)
+    futures: Dict[concurrent.futures.Future, int] = {}
+    pending: Set[concurrent.futures.Future] = set()
+    try:
+        for start, stop in bounds:
+            future = pool.submit(
+                _run_attempt_chunk, problem, desired_per_robot, base_seed, start, stop, longest_possible, deadline
+            )
+            futures[future] = start
+            pending.add(future)
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                break  # budget spent; running chunks cut their attempt short at the same deadline
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    results[futures[future]] = result
+            # Once every chunk before the first full-length one is in, later chunks cannot count.
+            cutoff = first_full_chunk()
+            if cutoff is not None and all(futures[future] > cutoff for future in pending):
+                break
+    except concurrent.futures.BrokenExecutor:
+        # A crashed worker costs this search its parallelism, not the request: finish here.
+        _discard_pool(pool)
+        run_here([bound for bound in bounds if bound[0] not in results])
+    finally:
+        for future in pending:
+            future.cancel()  # queued chunks give their slots back to the next search
+    return pick()
+
+def _generate_greedy(
+    present: Dict[str, List[str]],
+    indexes: Dict[str, _ClassIndex],
+    desired_per_robot: int,
+    workers: int = 1,
+    time_budget: Optional[float] = None,
+    ratings: Optional[Dict[RobotKey, float]] = None,
+    class_weights: Optional[Dict[str, Dict[str, float]]] = None,
+) -> List[PairKey]:
+    problem = _build_problem(present, indexes, ratings, class_weights)
+    if not problem.pairs:
+        return []
+
+    longest_possible = _max_schedule_length(problem, desired_per_robot)
+    best_schedule: List[int] = []
+    best_cost = 0.0
+    attempts = max(5, len(problem.pairs))
+    if workers > 1 or time_budget:
+        base_seed = random.getrandbits(63)
+        best_schedule = _search_multi_start(
+            problem, desired_per_robot, base_seed, attempts, longest_possible, workers, time_budget
+        )
+        return _pair_keys(problem, best_schedule)
+    for _ in range(attempts):
+        schedule_attempt = _run_single_attempt(problem, desired_per_robot)
+        cost = _attempt_cost(problem, schedule_attempt)
+        if len(schedule_attempt) > len(best_schedule) or (len(schedule_attempt) == len(best_schedule) and cost < best_cost):
+            best_schedule, best_cost = schedule_attempt, cost
+        if len(best_schedule) >= longest_possible:
+            break  # full length reached; further restarts would only trade objective for time
+    return _pair_keys(problem, best_schedule)
+
+
 def generate(
     desired_per_robot: int = 1,
     interleave: bool = True,
     db_by_class: Optional[Dict[str, dict]] = None,
     seed: Optional[int] = None,
+    strategy: str = "greedy",
+    workers: int = 1,
+    time_budget: Optional[float] = None,
+    weights: Optional[Dict[str, float]] = None,
 ) -> List[Dict[str, str]]:
-    del interleave  # interleaving handled implicitly by cooldown logic
+    """Build tonight's card.
+
+    ``strategy="greedy"`` runs randomized restarts over fresh pairs only; ``"matching"`` solves
+    each round as a maximum-cardinality, minimum-cost matching per class (see _generate_matching).
+    For greedy, ``workers > 1`` or a ``time_budget`` in seconds switches the restarts to
+    _search_multi_start. Both lean on the objective weights of each class (objective_weights,
+    with ``weights`` overriding); ``interleave=False`` zeroes the interleave term.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown schedule strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
     if seed is not None:
         random.seed(seed)
 
@@ -236,17 +739,16 @@ def generate(
     if not present:
         return []
 
-    history_pairs = _build_history_pairs(db_by_class)
-    pairs = _eligible_pairs(present, history_pairs)
-    if not pairs:
-        return []
-
-    best_schedule: List[PairKey] = []
-    attempts = max(5, sum(len(class_pairs) for class_pairs in pairs.values()))
-    for _ in range(attempts):
-        schedule_attempt = _run_single_attempt(present, pairs, desired_per_robot)
-        if len(schedule_attempt) > len(best_schedule):
-            best_schedule = schedule_attempt
+    indexes = {weight_class: _class_index(db_by_class[weight_class]) for weight_class in present}
+    overrides = dict(weights or {}, **({} if interleave else {"interleave": 0.0}))
+    class_weights = {weight_class: objective_weights(db_by_class[weight_class], overrides) for weight_class in present}
+    if strategy == "matching":
+        best_schedule = _generate_matching(present, db_by_class, indexes, desired_per_robot, class_weights)
+    else:
+        ratings = {(wc, _normalize(name)): rating for (wc, name), rating in rating_lookup(db_by_class).items()}
+        best_schedule = _generate_greedy(
+            present, indexes, desired_per_robot, workers, time_budget, ratings, class_weights
+        )
 
     results: List[Dict[str, str]] = []
     used_pairs: Set[PairKey] = set()
@@ -262,3 +764,382 @@ def generate(
         results.append({"weight_class": weight_class, "red": red, "white": white})
 
     return results
+
+
+def _card_key(card: Dict[str, Any], indexes: Dict[str, _ClassIndex]) -> Tuple[str, str, str]:
+    """(weight class, red, white) with names resolved to the roster spelling where possible."""
+    weight_class = card.get("weight_class") or ""
+    index = indexes.get(weight_class)
+    names = []
+    for corner in ("red", "white"):
+        name = _normalize(card.get(corner))
+        robot_id = index.robot_id(name) if index is not None else None
+        names.append(index.names[robot_id] if robot_id is not None else name)
+    return (weight_class, names[0], names[1])
+
+
+def _cooldown_clashes(keys: List[Tuple[str, str, str]]) -> List[Tuple[int, int]]:
+    """(earlier, later) card positions sharing a robot less than COOLDOWN_MATCHES + 1 apart."""
+    last_seen: Dict[RobotKey, int] = {}
+    clashes = []
+    for position, (weight_class, red, white) in enumerate(keys):
+        for robot in ((weight_class, red), (weight_class, white)):
+            previous = last_seen.get(robot)
+            if previous is not None and position - previous <= COOLDOWN_MATCHES:
+                clashes.append((previous, position))
+            last_seen[robot] = position
+    return clashes
+
+
+def _fits(keys: List[Tuple[str, str, str]], position: int, robots: Iterable[RobotKey]) -> bool:
+    """Would a card for ``robots`` inserted at ``position`` keep COOLDOWN_MATCHES spacing?"""
+    robots = set(robots)
+    for neighbour in range(max(0, position - COOLDOWN_MATCHES), min(len(keys), position + COOLDOWN_MATCHES)):
+        weight_class, red, white = keys[neighbour]
+        if (weight_class, red) in robots or (weight_class, white) in robots:
+            return False
+    return True
+
+
+def repair(
+    schedule_list: List[Dict[str, Any]],
+    changed: Iterable[Tuple[str, str]],
+    db_by_class: Optional[Dict[str, dict]] = None,
+    desired_per_robot: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Patch an existing card after presence changes instead of regenerating it.
+
+    ``changed`` lists the ``(weight_class, robot)`` whose presence flipped. Cards with one of
+    them that is now absent are dropped and each opponent left short is offered a fresh
+    replacement in the dropped slot (or the next slot where cooldown allows). Robots that are
+    now present get fresh fights placed as late in the card as cooldown allows. Cooldown clashes
+    the patch introduced are then resolved by re-sequencing the card from the first of them
+    (further back only if needed; the top card never moves), and a fresh fight that still
+    clashes is taken back rather than booked inside a robot's cooldown. ``desired_per_robot`` defaults to the most fights any robot in the class
+    already has on the card. Returns a new list; the input is not modified.
+    """
+    if db_by_class is None:
+        if _load_all_dbs is None:
+            raise RuntimeError("Database loader unavailable; provide db_by_class explicitly")
+        db_by_class = _load_all_dbs()
+
+    indexes = {weight_class: _class_index(payload) for weight_class, payload in db_by_class.items()}
+    present: Dict[str, Set[str]] = {
+        weight_class: {_normalize(name) for name, meta in (payload.get("robots") or {}).items() if meta and meta.get("present")}
+        for weight_class, payload in db_by_class.items()
+    }
+    ratings = {(wc, _normalize(name)): rating for (wc, name), rating in rating_lookup(db_by_class).items()}
+
+    def canonical(weight_class: str, name: str) -> RobotKey:
+        index = indexes.get(weight_class)
+        robot_id = index.robot_id(name) if index is not None else None
+        return (weight_class, index.names[robot_id] if robot_id is not None else _normalize(name))
+
+    flipped = {canonical(weight_class, name) for weight_class, name in changed}
+    gone = {robot for robot in flipped if robot[1] not in present.get(robot[0], ())}
+    arrived = sorted(flipped - gone)
+
+    targets: Dict[str, int] = defaultdict(int)
+    counts_before: Dict[RobotKey, int] = defaultdict(int)
+    for card in schedule_list:
+        weight_class, red, white = _card_key(card, indexes)
+        counts_before[(weight_class, red)] += 1
+        counts_before[(weight_class, white)] += 1
+    for (weight_class, _), count in counts_before.items():
+        targets[weight_class] = max(targets[weight_class], count)
+
+    def target(weight_class: str) -> int:
+        return desired_per_robot if desired_per_robot is not None else max(targets.get(weight_class, 0), 1)
+
+    original_clashes = {
+        (id(schedule_list[a]), id(schedule_list[b]))
+        for a, b in _cooldown_clashes([_card_key(card, indexes) for card in schedule_list])
+    }
+
+    # 1. Drop cards involving robots that just left, remembering who lost a fight and where.
+    cards: List[Dict[str, Any]] = []
+    orphans: List[Tuple[int, RobotKey, str]] = []  # (slot, robot, corner it fought from)
+    for card in schedule_list:
+        weight_class, red, white = _card_key(card, indexes)
+        red_key, white_key = (weight_class, red), (weight_class, white)
+        if red_key in gone or white_key in gone:
+            for robot, corner in ((red_key, "red"), (white_key, "white")):
+                if robot not in gone:
+                    orphans.append((len(cards), robot, corner))
+            continue
+        cards.append(card)
+    keys = [_card_key(card, indexes) for card in cards]
+    counts: Dict[RobotKey, int] = defaultdict(int)
+    booked: Set[PairKey] = set()
+    for weight_class, red, white in keys:
+        counts[(weight_class, red)] += 1
+        counts[(weight_class, white)] += 1
+        booked.add(_unique_pair_key((weight_class, red, white)))
+
+    def opponent_for(robot: RobotKey, extra: int = 0) -> Optional[str]:
+        weight_class, name = robot
+        index = indexes.get(weight_class)
+        robot_id = index.robot_id(name) if index is not None else None
+        if robot_id is None or name not in present.get(weight_class, ()):
+            return None
+        rating = ratings.get(robot, DEFAULT_RATING)
+        best: Optional[Tuple[int, float, str]] = None
+        for other in present.get(weight_class, ()):
+            other_id = index.robot_id(other)
+            if other_id is None or other_id == robot_id or counts[(weight_class, other)] >= target(weight_class) + extra:
+                continue
+            if index.met_count(robot_id, other_id) or _unique_pair_key((weight_class, name, other)) in booked:
+                continue
+            rank = (counts[(weight_class, other)], abs(ratings.get((weight_class, other), DEFAULT_RATING) - rating), other)
+            if best is None or rank < best:
+                best = rank
+        return best[2] if best is not None else None
+
+    fills: Set[int] = set()  # ids of the cards this repair booked
+
+    def book(position: int, weight_class: str, red: str, white: str) -> None:
+        card = {"weight_class": weight_class, "red": red, "white": white}
+        fills.add(id(card))
+        cards.insert(position, card)
+        keys.insert(position, (weight_class, red, white))
+        counts[(weight_class, red)] += 1
+        counts[(weight_class, white)] += 1
+        booked.add(_unique_pair_key((weight_class, red, white)))
+
+    # 2. Refill dropped slots, latest first so earlier slot numbers stay valid.
+    for slot, robot, corner in sorted(orphans, key=lambda item: item[0], reverse=True):
+        weight_class, name = robot
+        if counts[robot] >= target(weight_class):
+            continue
+        other = opponent_for(robot)
+        if other is None:
+            continue
+        position = next(
+            (p for p in range(slot, len(cards) + 1) if _fits(keys, p, (robot, (weight_class, other)))),
+            None,
+        )
+        if position is not None:
+            red, white = (name, other) if corner == "red" else (other, name)
+            book(position, weight_class, red, white)
+
+    # 3. Newly present robots: fresh fights as late as cooldown allows, never ahead of the top card.
+    for robot in arrived:
+        weight_class, name = robot
+        while counts[robot] < target(weight_class):
+            # Nobody left under target: an arrival still gets a fight, costing someone one extra.
+            other = opponent_for(robot) or opponent_for(robot, extra=1)
+            if other is None:
+                break
+            position = next(
+                (p for p in range(len(cards), 0, -1) if _fits(keys, p, (robot, (weight_class, other)))),
+                None,
+            )
+            if position is None:
+                break
+            book(position, weight_class, name, other)
+
+    # 4. Dropped cards close gaps and fills shift later cards, so re-sequence from the first clash
+    # this repair introduced, reaching further back (never past the top card) only while clashes
+    # remain.
+    def introduced() -> List[Tuple[int, int]]:
+        return [
+            (early, late) for early, late in _cooldown_clashes(keys)
+            if (id(cards[early]), id(cards[late])) not in original_clashes
+        ]
+
+    fresh = introduced()
+    if not fresh:
+        return cards
+    start = min(late for _, late in fresh)
+    while True:
+        _resequence(cards, keys, start)
+        _untangle(cards, keys, start, introduced)
+        fresh = introduced()
+        if not fresh:
+            return cards
+        if start > 1:
+            start = max(1, start - (COOLDOWN_MATCHES + 1))
+            continue
+        # A fresh fight is not worth a clash: take back one that clashes, else the latest one
+        # (it still crowds the card), and try again.
+        rejected = next((cards[p] for pair in reversed(fresh) for p in pair if id(cards[p]) in fills), None)
+        if rejected is None:
+            rejected = next((card for card in reversed(cards[start:]) if id(card) in fills), None)
+        if rejected is None:
+            return cards
+        position = next(p for p, card in enumerate(cards) if card is rejected)
+        del cards[position], keys[position]
+
+
+def _resequence(cards: List[Dict[str, Any]], keys: List[Tuple[str, str, str]], start: int) -> None:
+    """Reorder ``cards[start:]`` in place: each slot takes the earliest remaining card whose robots
+    are rested, and only a card that fits nowhere is booked inside cooldown."""
+    recent_keys = keys[max(0, start - COOLDOWN_MATCHES):start]
+    remaining = list(zip(cards[start:], keys[start:]))
+    del cards[start:], keys[start:]
+    while remaining:
+        resting = {(weight_class, name) for weight_class, red, white in recent_keys for name in (red, white)}
+        pick = next(
+            (i for i, (_, (weight_class, red, white)) in enumerate(remaining)
+             if (weight_class, red) not in resting and (weight_class, white) not in resting),
+            0,
+        )
+        card, key = remaining.pop(pick)
+        cards.append(card)
+        keys.append(key)
+        recent_keys = (recent_keys + [key])[-COOLDOWN_MATCHES:]
+
+
+def _untangle(
+    cards: List[Dict[str, Any]],
+    keys: List[Tuple[str, str, str]],
+    start: int,
+    clashes: Callable[[], List[Tuple[int, int]]],
+) -> None:
+    """Swap clashing cards with any card from ``start`` on while that strictly lowers ``clashes()``.
+
+    The forward pass of _resequence can strand the last few cards together; this untangles them.
+    """
+    def swap(i: int, j: int) -> None:
+        cards[i], cards[j] = cards[j], cards[i]
+        keys[i], keys[j] = keys[j], keys[i]
+
+    count = len(clashes())
+    while count:
+        best: Optional[Tuple[int, int, int]] = None
+        for position in sorted({p for pair in clashes() for p in pair if p >= start}):
+            for other in range(start, len(cards)):
+                if other == position:
+                    continue
+                swap(position, other)
+                candidate = len(clashes())
+                swap(position, other)
+                if candidate < count and (best is None or candidate < best[0]):
+                    best = (candidate, position, other)
+        if best is None:
+            return  # what is left cannot be untangled by single swaps
+        count, position, other = best
+        swap(position, other)
+
+
+def _tonight_sequence(
+    db_by_class: Dict[str, dict],
+    indexes: Dict[str, _ClassIndex],
+    since: Optional[float],
+) -> List[Tuple[str, str, str]]:
+    """Fights recorded at or after ``since`` across every class, oldest first, as card keys."""
+    if since is None:
+        return []
+    fought = []
+    for weight_class, payload in db_by_class.items():
+        for entry in payload.get("history") or ():
+            timestamp = entry.get("timestamp") or 0
+            if timestamp >= since:
+                card = {"weight_class": weight_class, "red": entry.get("red_corner"), "white": entry.get("white_corner")}
+                fought.append((timestamp, entry.get("match_id") or 0, _card_key(card, indexes)))
+    fought.sort(key=lambda item: item[:2])
+    return [key for _, _, key in fought]
+
+
+def _next_card(
+    db_by_class: Dict[str, dict],
+    sequence: List[Tuple[str, str, str]],
+    queued_pairs: Dict[PairKey, int],
+) -> Optional[Dict[str, str]]:
+    """Best next card after ``sequence`` (tonight's fights then queued cards) on live data."""
+    indexes = {weight_class: _class_index(payload) for weight_class, payload in db_by_class.items()}
+    present = {
+        weight_class: sorted({indexes[weight_class].names[indexes[weight_class].robot_id(name)] for name in names})
+        for weight_class, names in _collect_present(db_by_class).items()
+    }
+    if not present:
+        return None
+    ratings = {(wc, _normalize(name)): rating for (wc, name), rating in rating_lookup(db_by_class).items()}
+    counts: Dict[RobotKey, int] = defaultdict(int)
+    reds: Dict[RobotKey, int] = defaultdict(int)
+    last_seen: Dict[RobotKey, int] = {}
+    for position, (weight_class, red, white) in enumerate(sequence):
+        for robot in ((weight_class, red), (weight_class, white)):
+            counts[robot] += 1
+            last_seen[robot] = position
+        reds[(weight_class, red)] += 1
+    blocked = {robot for robot, position in last_seen.items() if len(sequence) - position <= COOLDOWN_MATCHES}
+    tonight_pairs = {_unique_pair_key(key) for key in sequence}
+
+    def robot_rank(robot: RobotKey) -> Tuple:
+        return (robot in blocked, counts[robot], last_seen.get(robot, -1), robot)
+
+    def best_opponent(robot: RobotKey) -> Tuple[Tuple, str]:
+        weight_class, name = robot
+        index = indexes[weight_class]
+        robot_id = index.robot_id(name)
+        rating = ratings.get(robot, DEFAULT_RATING)
+        return min(
+            (
+                (
+                    (weight_class, other) in blocked,
+                    index.met_count(robot_id, index.robot_id(other)) + queued_pairs.get(_unique_pair_key((weight_class, name, other)), 0),
+                    counts[(weight_class, other)],
+                    abs(ratings.get((weight_class, other), DEFAULT_RATING) - rating),
+                    other,
+                ),
+                other,
+            )
+            for other in present[weight_class]
+            if other != name
+        )
+
+    candidates = sorted(((weight_class, name) for weight_class, names in present.items() for name in names), key=robot_rank)
+    choice = None
+    for robot in candidates:
+        rank, other = best_opponent(robot)
+        if choice is None:
+            choice = (robot, other)
+        if robot not in blocked and not rank[0] and _unique_pair_key((robot[0], robot[1], other)) not in tonight_pairs:
+            choice = (robot, other)
+            break
+    (weight_class, name), other = choice
+    if reds[(weight_class, other)] < reds[(weight_class, name)]:
+        name, other = other, name
+    return {"weight_class": weight_class, "red": name, "white": other}
+
+
+def stream(
+    queued: Iterable[Dict[str, Any]] = (),
+    since: Optional[float] = None,
+    db_by_class: Optional[Dict[str, dict]] = None,
+) -> Iterator[Dict[str, str]]:
+    """Yield schedule cards one at a time for open-ended events.
+
+    Each card is chosen when it is requested, from the live DBs at that moment (re-read through
+    the storage views unless ``db_by_class`` is given): fights recorded since ``since`` and the
+    ``queued`` cards count as tonight's, the least-fought robot that is out of cooldown goes
+    next, and it meets the opponent it has met least, then the least-fought, then the closest
+    rating. Cooldown is honoured whenever any pair allows it; a class too small to rest anyone
+    keeps fighting rather than stalling the event. Stops when fewer than two robots are present.
+    """
+    if db_by_class is None and _load_all_dbs is None:
+        raise RuntimeError("Database loader unavailable; provide db_by_class explicitly")
+    queued_cards = [dict(card) for card in queued]
+    while True:
+        live = db_by_class if db_by_class is not None else _load_all_dbs()
+        indexes = {weight_class: _class_index(payload) for weight_class, payload in live.items()}
+        queued_keys = [_card_key(card, indexes) for card in queued_cards]
+        queued_pairs: Dict[PairKey, int] = defaultdict(int)
+        for key in queued_keys:
+            queued_pairs[_unique_pair_key(key)] += 1
+        card = _next_card(live, _tonight_sequence(live, indexes, since) + queued_keys, queued_pairs)
+        if card is None:
+            return
+        queued_cards.append(card)
+        yield card
+
+
+def next_cards(
+    queued: Iterable[Dict[str, Any]],
+    count: int,
+    since: Optional[float] = None,
+    db_by_class: Optional[Dict[str, dict]] = None,
+) -> List[Dict[str, str]]:
+    """The next ``count`` cards to append after ``queued``; see :func:`stream`."""
+    return list(itertools.islice(stream(queued, since=since, db_by_class=db_by_class), max(0, count)))
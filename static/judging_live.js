@@ -1,14 +1,25 @@
 (function () {
   const DEFAULT_INTERVAL = 5000;
+  const LONG_POLL_WAIT_SECONDS = 25;
+
+  // ?live=stream|longpoll|poll on the page URL picks the update channel (handy for OBS sources).
+  const liveModeOverride = () => {
+    try {
+      return new URLSearchParams(window.location.search).get('live');
+    } catch (err) {
+      return null;
+    }
+  };
 
   const normalizeNumber = (value) => {
     const num = Number(value);
     return Number.isFinite(num) ? num : 0;
   };
 
-  const startPoller = (config) => {
+  const startLive = (config) => {
     if (!config || !config.stateUrl) return;
     let currentVersion = normalizeNumber(config.version);
+    let etag = null;
     const interval = Math.max(normalizeNumber(config.interval) || DEFAULT_INTERVAL, 1000);
     const onUpdate = typeof config.onUpdate === 'function'
       ? config.onUpdate
@@ -18,26 +29,39 @@
           }
         };
 
+    const check = async (params) => {
+      const headers = { 'Accept': 'application/json' };
+      if (etag) {
+        headers['If-None-Match'] = etag;
+      }
+      // Pages reload on any change, so they fetch the full payload rather than ?delta=<revision>.
+      const url = new URL(config.stateUrl, window.location.href);
+      Object.entries(params || {}).forEach(([key, value]) => url.searchParams.set(key, value));
+      const response = await fetch(url.toString(), {
+        cache: 'no-store',
+        credentials: 'same-origin',
+        headers,
+      });
+      if (response.status === 304) {
+        return;
+      }
+      if (!response.ok) {
+        throw new Error(`Poll failed (${response.status})`);
+      }
+      etag = response.headers.get('ETag') || null;
+      const data = await response.json().catch(() => ({}));
+      const nextVersion = normalizeNumber(data?.meta?.version);
+      if (nextVersion && nextVersion !== currentVersion) {
+        const previousVersion = currentVersion;
+        currentVersion = nextVersion;
+        onUpdate({ data, version: nextVersion, previousVersion });
+      }
+    };
+
     const poll = async () => {
       try {
-        if (document.hidden && config.skipWhenHidden) {
-          window.setTimeout(poll, interval);
-          return;
-        }
-        const response = await fetch(config.stateUrl, {
-          cache: 'no-store',
-          credentials: 'same-origin',
-          headers: { 'Accept': 'application/json' },
-        });
-        if (!response.ok) {
-          throw new Error(`Poll failed (${response.status})`);
-        }
-        const data = await response.json().catch(() => ({}));
-        const nextVersion = normalizeNumber(data?.meta?.version);
-        if (nextVersion && nextVersion !== currentVersion) {
-          const previousVersion = currentVersion;
-          currentVersion = nextVersion;
-          onUpdate({ data, version: nextVersion, previousVersion });
+        if (!(document.hidden && config.skipWhenHidden)) {
+          await check();
         }
       } catch (err) {
         console.error('Judging live poll error:', err);
@@ -46,7 +70,61 @@
       }
     };
 
-    window.setTimeout(poll, interval);
+    const startPolling = () => {
+      window.setTimeout(poll, interval);
+    };
+
+    const longPoll = async () => {
+      const started = Date.now();
+      let delay = 0;
+      try {
+        if (document.hidden && config.skipWhenHidden) {
+          delay = interval;
+        } else {
+          await check({ since: currentVersion, wait: LONG_POLL_WAIT_SECONDS });
+        }
+      } catch (err) {
+        console.error('Judging live long-poll error:', err);
+        delay = interval;
+      } finally {
+        // A quick answer means the server could not hold the request; back off to the poll interval.
+        if (Date.now() - started < 1000) {
+          delay = Math.max(delay, interval);
+        }
+        window.setTimeout(longPoll, delay);
+      }
+    };
+
+    const mode = liveModeOverride() || config.mode || 'stream';
+    if (mode === 'poll') {
+      startPolling();
+      return;
+    }
+    if (mode === 'longpoll' || !config.streamUrl || typeof window.EventSource !== 'function') {
+      longPoll();
+      return;
+    }
+
+    const source = new window.EventSource(config.streamUrl, { withCredentials: true });
+    source.addEventListener('state', (event) => {
+      let payload = {};
+      try {
+        payload = JSON.parse(event.data || '{}');
+      } catch (err) {
+        payload = {};
+      }
+      const version = normalizeNumber(payload.version);
+      if (version && version !== currentVersion) {
+        check().catch((err) => console.error('Judging live refresh error:', err));
+      }
+    });
+    source.onerror = () => {
+      // Dropped streams are retried by the browser; a CLOSED source (e.g. 503) means long-poll instead.
+      if (source.readyState === window.EventSource.CLOSED) {
+        source.close();
+        longPoll();
+      }
+    };
   };
 
   document.addEventListener('DOMContentLoaded', () => {
@@ -55,6 +133,7 @@
       configs.push({
         version: normalizeNumber(window.JUDGE_PAGE_STATE?.meta?.version),
         stateUrl: window.JUDGE_PAGE_STATE.api.state,
+        streamUrl: window.JUDGE_PAGE_STATE.api.stream,
         reload: true,
         interval: 4000,
         skipWhenHidden: false,
@@ -66,14 +145,16 @@
           configs.push({
             version: normalizeNumber(cfg.version),
             stateUrl: cfg.stateUrl,
+            streamUrl: cfg.streamUrl,
             reload: cfg.reload !== false,
             interval: normalizeNumber(cfg.interval) || DEFAULT_INTERVAL,
             skipWhenHidden: cfg.skipWhenHidden !== false,
             onUpdate: cfg.onUpdate,
+            mode: cfg.mode,
           });
         }
       });
     }
-    configs.forEach(startPoller);
+    configs.forEach(startLive);
   });
 })();
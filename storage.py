@@ -1,10 +1,11 @@
-import os, json, datetime, tempfile, shutil, csv, time
-from typing import Callable, Any, Optional
+import os, json, datetime, tempfile, shutil, csv, time, threading, contextlib, functools
+from typing import Callable, Any, Iterator, List, Optional, Dict, Tuple
 
 try:
     import fcntl  # type: ignore[attr-defined]
 except ImportError:  # pragma: no cover - Windows fallback
     fcntl = None
+from storage_sqlite import SQLiteStore
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 DB_FILES = {
     "Antweights": os.path.join(DATA_DIR, "elo_antweights.txt"),
@@ -17,37 +18,457 @@ JUDGING_LOCK_FP = os.path.join(DATA_DIR, "judging.lock")
 DEFAULT_RATING = 1000; DEFAULT_K = 32; KO_WEIGHT = 1.10
 def ensure_dirs(): os.makedirs(DATA_DIR, exist_ok=True)
 def _blank_db():
-    return {"robots": {}, "history": [], "next_match_id": 1, "settings": {"K": DEFAULT_K, "ko_weight": KO_WEIGHT}}
-def load_db(weight_class):
+    return {"robots": {}, "history": [], "next_match_id": 1, "settings": {"K": DEFAULT_K, "ko_weight": KO_WEIGHT},
+            "format_version": DB_FORMAT_VERSION, "ko_results": []}
+
+
+class _ReadOnlyDict(dict):
+    """dict that refuses in-place mutation; shared cache entries are handed out as these."""
+    __slots__ = ()
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached DB view is read-only; use storage.load_db() for a mutable copy")
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    def __copy__(self): return dict(self)
+    def __deepcopy__(self, memo): return _thaw(self)
+
+
+class _ReadOnlyList(list):
+    __slots__ = ()
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached DB view is read-only; use storage.load_db() for a mutable copy")
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+    def __copy__(self): return list(self)
+    def __deepcopy__(self, memo): return _thaw(self)
+
+
+def _freeze(value, memo=None):
+    # memo keeps shared sub-objects shared (robot match views point at history entries).
+    if not isinstance(value, (dict, list)): return value
+    memo = {} if memo is None else memo
+    if id(value) in memo: return memo[id(value)]
+    if isinstance(value, dict): frozen = _ReadOnlyDict((k, _freeze(v, memo)) for k, v in value.items())
+    else: frozen = _ReadOnlyList(_freeze(v, memo) for v in value)
+    memo[id(value)] = frozen
+    return frozen
+def _thaw(value, memo=None):
+    if not isinstance(value, (dict, list)): return value
+    memo = {} if memo is None else memo
+    if id(value) in memo: return memo[id(value)]
+    if isinstance(value, dict): thawed = {k: _thaw(v, memo) for k, v in value.items()}
+    else: thawed = [_thaw(v, memo) for v in value]
+    memo[id(value)] = thawed
+    return thawed
+
+
+# On-disk format 2 stores every match once, in "history"; robots carry only "match_ids".
+# In memory each robot still gets a "matches" list whose items are the history entries themselves.
+DB_FORMAT_VERSION = 2
+def _unpack_db(data):
+    """Rebuild per-robot ``matches`` views from history (migrating format 1 embedded copies)."""
+    if not isinstance(data, dict): return data
+    history = data["history"] = data.get("history") or []
+    by_id = {m.get("match_id"): m for m in history}
+    for info in (data.get("robots") or {}).values():
+        if not isinstance(info, dict): continue
+        if "match_ids" in info: ids = info.pop("match_ids") or []
+        else:  # format 1
+            ids = []
+            for m in info.get("matches", []) or []:
+                if isinstance(m, dict) and m.get("match_id") is not None:
+                    ids.append(m["match_id"])
+                    if m["match_id"] not in by_id: _restore_orphan(history, by_id, m)
+        info["matches"] = [by_id[i] for i in ids if i in by_id]
+    if "ko_match_ids" in data: data["ko_results"] = [by_id[i] for i in data.pop("ko_match_ids") or [] if i in by_id]
+    data["format_version"] = DB_FORMAT_VERSION
+    return _ensure_ko_index(_ensure_robot_stats(data))
+def _restore_orphan(history, by_id, match):
+    # Format-1 robot deletion dropped a fight from history but left the opponent's embedded copy.
+    # Deleting a robot keeps its fights (see app.robot_delete), so put the fight back at its
+    # match_id position and the opponent keeps its record and stats.
+    match = dict(match); by_id[match["match_id"]] = match
+    position = len(history)
+    while position and int(history[position - 1].get("match_id") or 0) > int(match["match_id"]): position -= 1
+    history.insert(position, match)
+def _pack_db(db):
+    """Return the on-disk form of ``db`` without mutating it: robots reference matches by id."""
+    packed = dict(db); packed["format_version"] = DB_FORMAT_VERSION; robots = {}
+    for name, info in (db.get("robots") or {}).items():
+        info = dict(info); info["match_ids"] = [m.get("match_id") for m in info.pop("matches", []) or []]
+        robots[name] = info
+    packed["robots"] = robots
+    live = {m.get("match_id") for m in db.get("history", []) or []}
+    ko_results = packed.pop("ko_results", None)
+    if not isinstance(ko_results, list): ko_results = sorted(filter(is_ko_result, db.get("history", []) or []), key=_ko_sort_key)
+    packed["ko_match_ids"] = [m.get("match_id") for m in ko_results if m.get("match_id") in live]
+    return packed
+
+
+# Per-process cache of parsed Elo DBs, keyed by file path and validated by (mtime_ns, size, inode)
+# so that saves made by another gunicorn worker are noticed on the next read.
+_DB_CACHE: Dict[str, Tuple[Any, _ReadOnlyDict, int]] = {}
+_DB_CACHE_LOCK = threading.Lock()
+def _stat_signature(st): return (st.st_mtime_ns, st.st_size, st.st_ino)
+def _path_signature(fp):
+    try: return _stat_signature(os.stat(fp))
+    except FileNotFoundError: return None
+def _cache_put(fp, signature, view, journal_offset=0):
+    with _DB_CACHE_LOCK: _DB_CACHE[fp] = (signature, view, journal_offset)
+def _cache_get(fp):
+    with _DB_CACHE_LOCK: return _DB_CACHE.get(fp)
+# Structures other modules derive from a cached view (e.g. the scheduler's pair index) are kept
+# beside it, keyed by (name, view identity), and dropped once that view leaves _DB_CACHE.
+_DERIVED_CACHE: Dict[Tuple[str, int], Tuple[Any, Any]] = {}
+def derive_from_view(view, name, build):
+    """``build(view)``, computed once per cached DB version; plain (uncached) dicts are built every time."""
+    if not isinstance(view, _ReadOnlyDict): return build(view)
+    with _DB_CACHE_LOCK: hit = _DERIVED_CACHE.get((name, id(view)))
+    if hit is not None and hit[0] is view: return hit[1]
+    value = build(view)
+    with _DB_CACHE_LOCK:
+        live = {id(entry[1]) for entry in _DB_CACHE.values()}; live.add(id(view))
+        for key in [key for key in _DERIVED_CACHE if key[1] not in live]: del _DERIVED_CACHE[key]
+        _DERIVED_CACHE[(name, id(view))] = (view, value)
+    return value
+
+# Change notification for live clients (SSE stream, long-poll). Writes made by this process wake
+# waiters at once; a single watcher thread per process compares document_versions() every
+# CHANGE_WATCH_INTERVAL seconds so writes from the other gunicorn workers are noticed too.
+CHANGE_WATCH_INTERVAL = 0.25
+_CHANGE_COND = threading.Condition()
+_change_watcher: Optional[threading.Thread] = None
+def notify_change():
+    with _CHANGE_COND: _CHANGE_COND.notify_all()
+def _notifies(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try: return func(*args, **kwargs)
+        finally: notify_change()
+    return wrapper
+def _watch_changes():
+    last = None
+    while True:
+        try: current = document_versions()
+        except Exception: current = last
+        if current != last: last = current; notify_change()
+        time.sleep(CHANGE_WATCH_INTERVAL)
+def _ensure_change_watcher():
+    global _change_watcher
+    with _CHANGE_COND:
+        if _change_watcher is None or not _change_watcher.is_alive():
+            _change_watcher = threading.Thread(target=_watch_changes, name="storage-change-watcher", daemon=True)
+            _change_watcher.start()
+def wait_for_change(since, timeout):
+    """Block until document_versions() differs from ``since`` or ``timeout`` seconds pass.
+
+    Returns the current versions. Waiters sleep on a condition variable rather than re-reading files.
+    """
+    _ensure_change_watcher()
+    deadline = time.monotonic() + timeout
+    while True:
+        current = document_versions()
+        remaining = deadline - time.monotonic()
+        if current != since or remaining <= 0: return current
+        with _CHANGE_COND: _CHANGE_COND.wait(min(remaining, CHANGE_WATCH_INTERVAL * 4))
+
+
+# "json" rewrites the whole Elo file on every change; "journal" appends one compact record per
+# match/undo/presence change to <elo file>.journal and folds it into the snapshot periodically;
+# "sqlite" keeps Elo, schedule and judging documents in one WAL-mode database (storage_sqlite.py).
+STORAGE_BACKEND = os.environ.get("BOTBRAWL_STORAGE", "json").strip().lower()
+JOURNAL_COMPACT_BYTES = 256 * 1024
+SQLITE_FILENAME = "botbrawl.sqlite3"
+_SQLITE_STORES: Dict[str, SQLiteStore] = {}
+def _sqlite_store():
+    path = os.path.join(DATA_DIR, SQLITE_FILENAME)
+    with _DB_CACHE_LOCK:
+        store = _SQLITE_STORES.get(path)
+        if store is None: store = _SQLITE_STORES[path] = SQLiteStore(path)
+    return store
+def _view_sqlite_db(weight_class):
+    store = _sqlite_store(); key = store.path + "#" + weight_class
+    signature = store.version("elo:" + weight_class)
+    cached = _cache_get(key)
+    if cached is not None and cached[0] == signature: return cached[1]
+    with store.snapshot():
+        signature = store.version("elo:" + weight_class); db = store.load_db(weight_class)
+    view = _freeze(_ensure_ko_index(_ensure_robot_stats(db)) if db is not None else _blank_db())
+    _cache_put(key, signature, view)
+    return view
+
+
+_HELD_LOCKS = threading.local()
+@contextlib.contextmanager
+def _exclusive_lock(lock_fp):
+    """flock ``lock_fp``; re-entrant per thread, so saves inside a transaction() reuse its locks."""
+    held = getattr(_HELD_LOCKS, "paths", None)
+    if held is None: held = _HELD_LOCKS.paths = set()
+    if lock_fp in held:
+        yield
+        return
+    lock_file = open(lock_fp, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        held.add(lock_fp)
+        yield
+    finally:
+        held.discard(lock_fp)
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _write_json_atomic(fp, data, prefix, **dump_kwargs):
+    """Write ``data`` to ``fp`` via temp file + rename and return the new file's stat signature."""
+    fd, tmp = tempfile.mkstemp(prefix=prefix, dir=DATA_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs); f.flush(); os.fsync(f.fileno())
+        signature = _stat_signature(os.fstat(f.fileno()))
+    os.replace(tmp, fp)
+    return signature
+def _read_snapshot(fp):
+    try: f = open(fp, "r", encoding="utf-8")
+    except FileNotFoundError: return _blank_db(), None
+    with f:
+        signature = _stat_signature(os.fstat(f.fileno()))
+        try: return _unpack_db(json.load(f)), signature
+        except Exception:
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S"); shutil.copy(fp, fp + ".corrupt_" + ts); return _blank_db(), None
+def _journal_fp(fp): return fp + ".journal"
+def _journal_lock_fp(fp): return fp + ".lock"
+
+
+# Per-robot win/loss aggregate kept next to "rating" and updated in O(1) per match/undo.
+STAT_KEYS = ("wins", "losses", "draws", "ko_wins", "ko_losses")
+def blank_robot_stats(): return {**{k: 0 for k in STAT_KEYS}, "matches": 0, "last_match_ts": None}
+def _tally_match(stats, entry, name, sign=1):
+    res = entry.get("result", ""); stats["matches"] += sign
+    if res == "Draw": stats["draws"] += sign; return
+    is_ko = int("KO" in res)
+    if res.startswith("Red wins") == (entry.get("red_corner") == name): stats["wins"] += sign; stats["ko_wins"] += sign * is_ko
+    else: stats["losses"] += sign; stats["ko_losses"] += sign * is_ko
+def compute_robot_stats(info, name):
+    """Tally a robot's aggregate from its match list (the slow path used for rebuilds)."""
+    stats = blank_robot_stats()
+    for m in info.get("matches", []) or []:
+        _tally_match(stats, m, name); ts = m.get("timestamp")
+        if ts is not None: stats["last_match_ts"] = ts if stats["last_match_ts"] is None else max(stats["last_match_ts"], ts)
+    return stats
+def robot_stats_record(info, name):
+    """Return the robot's stored aggregate, computing it on the fly for records that predate it."""
+    stats = (info or {}).get("stats")
+    return stats if isinstance(stats, dict) else compute_robot_stats(info or {}, name)
+def rebuild_robot_stats(db, names=None):
+    """Recompute the stored aggregate of ``names`` (default: every robot) from the match lists."""
+    robots = db.get("robots") or {}
+    for name in (robots.keys() if names is None else names):
+        if name in robots: robots[name]["stats"] = compute_robot_stats(robots[name], name)
+    return db
+def _ensure_robot_stats(db):
+    robots = db.get("robots") or {}
+    missing = [name for name, info in robots.items() if isinstance(info, dict) and not isinstance(info.get("stats"), dict)]
+    if missing: rebuild_robot_stats(db, missing)
+    return db
+
+
+# "ko_results" holds a class's KO fights (the history entries themselves) ordered by (timestamp, match_id),
+# so the judging feed can merge them in without rescanning history. On disk it is "ko_match_ids".
+def is_ko_result(entry): res = entry.get("result"); return isinstance(res, str) and "KO" in res
+def _ko_sort_key(entry): return (int(entry.get("timestamp") or 0), int(entry.get("match_id") or 0))
+def rebuild_ko_index(db):
+    """Recompute ``db["ko_results"]`` from history (after bulk edits such as reset or robot deletion)."""
+    db["ko_results"] = sorted((m for m in db.get("history", []) or [] if is_ko_result(m)), key=_ko_sort_key)
+    return db
+def _ensure_ko_index(db):
+    if isinstance(db, dict) and not isinstance(db.get("ko_results"), list): rebuild_ko_index(db)
+    return db
+def _ko_index_add(db, entry):
+    index = db.setdefault("ko_results", []); index.append(entry)
+    if len(index) > 1 and _ko_sort_key(index[-2]) > _ko_sort_key(entry): index.sort(key=_ko_sort_key)
+def _ko_index_remove(db, entry):
+    index = db.get("ko_results") or []
+    for idx in range(len(index) - 1, -1, -1):
+        if index[idx].get("match_id") == entry.get("match_id"): del index[idx]; return
+
+
+def apply_db_record(db, record):
+    """Apply one change record to a mutable Elo DB in place.
+
+    Records are ``{"op": "match", "entry": {...}}``, ``{"op": "undo", "match_id": id}`` or
+    ``{"op": "presence", "robot": name, "present": bool}``. Returns the history entry that was
+    added or removed for match/undo records, otherwise None.
+    """
+    op = record.get("op"); robots = db.setdefault("robots", {}); result = None
+    if op == "match":
+        entry = record["entry"]; result = entry
+        db.setdefault("history", []).append(entry)
+        db["next_match_id"] = max(int(db.get("next_match_id", 1)), int(entry["match_id"]) + 1)
+        if is_ko_result(entry): _ko_index_add(db, entry)
+        for name, key in ((entry["red_corner"], "new_rating_red"), (entry["white_corner"], "new_rating_white")):
+            if name in robots:
+                r = robots[name]; stats = r["stats"] = robot_stats_record(r, name)
+                r["rating"] = entry[key]; r.setdefault("matches", []).append(entry)
+                _tally_match(stats, entry, name)
+                if entry.get("timestamp") is not None: stats["last_match_ts"] = max(stats["last_match_ts"] or 0, entry["timestamp"])
+    elif op == "undo":
+        hist = db.get("history", [])
+        for idx in range(len(hist) - 1, -1, -1):
+            if hist[idx].get("match_id") == record.get("match_id"):
+                result = hist.pop(idx); break
+        if result is not None:
+            if is_ko_result(result): _ko_index_remove(db, result)
+            for name, key in ((result["red_corner"], "old_rating_red"), (result["white_corner"], "old_rating_white")):
+                if name in robots:
+                    r = robots[name]; r["rating"] = result[key]; ms = r.setdefault("matches", [])
+                    stats = r["stats"] = robot_stats_record(r, name)
+                    if ms and ms[-1].get("match_id") == result["match_id"]: ms.pop()
+                    else: ms = r["matches"] = [m for m in ms if m.get("match_id") != result["match_id"]]
+                    _tally_match(stats, result, name, -1)
+                    stats["last_match_ts"] = ms[-1].get("timestamp") if ms else None
+    elif op == "presence":
+        if record.get("robot") in robots: robots[record["robot"]]["present"] = bool(record.get("present"))
+    if "seq" in record: db["journal_seq"] = max(int(db.get("journal_seq", 0)), int(record["seq"]))
+    return result
+
+
+def _replay_journal(jf, db, offset):
+    """Apply complete journal lines after ``offset`` that the snapshot has not folded in yet."""
+    jf.seek(offset); folded = int(db.get("journal_seq", 0))
+    for line in jf:
+        if not line.endswith(b"\n"): break  # partial append in progress; pick it up next time
+        offset += len(line)
+        try: record = json.loads(line.decode("utf-8"))
+        except ValueError: continue
+        if int(record.get("seq", 0)) > folded: apply_db_record(db, record)
+    return offset
+
+
+def _view_journaled_db(fp):
+    snapshot_sig = _path_signature(fp)
+    try: jf = open(_journal_fp(fp), "rb")
+    except FileNotFoundError: jf = None
+    with contextlib.ExitStack() as stack:
+        journal_sig = None
+        if jf is not None:
+            stack.enter_context(jf); journal_sig = _stat_signature(os.fstat(jf.fileno()))
+        signature = (snapshot_sig, journal_sig)
+        cached = _cache_get(fp)
+        if cached is not None and cached[0] == signature: return cached[1]
+        offset = 0
+        if (cached is not None and cached[0][0] == snapshot_sig and snapshot_sig is not None and journal_sig is not None
+                and cached[0][1] is not None and cached[0][1][2] == journal_sig[2]):
+            # Same snapshot, same journal file: only the appended tail needs replaying.
+            db = _thaw(cached[1]); offset = cached[2]
+        else:
+            db, _ = _read_snapshot(fp)
+        if jf is not None: offset = _replay_journal(jf, db, offset)
+    view = _freeze(db)
+    _cache_put(fp, signature, view, offset)
+    return view
+
+
+def view_db(weight_class):
+    """Return the shared, read-only view of a weight class DB (re-parsed only when the file changed)."""
     ensure_dirs(); fp = DB_FILES[weight_class]
-    if not os.path.exists(fp): return _blank_db()
-    with open(fp, "r", encoding="utf-8") as f:
-        try: return json.load(f)
+    if STORAGE_BACKEND == "journal": return _view_journaled_db(fp)
+    if STORAGE_BACKEND == "sqlite": return _view_sqlite_db(weight_class)
+    try: f = open(fp, "r", encoding="utf-8")
+    except FileNotFoundError: return _freeze(_blank_db())
+    with f:
+        signature = _stat_signature(os.fstat(f.fileno()))
+        cached = _cache_get(fp)
+        if cached is not None and cached[0] == signature: return cached[1]
+        try: view = _freeze(_unpack_db(json.load(f)))
         except Exception:
-            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S"); shutil.copy(fp, fp + ".corrupt_" + ts); return _blank_db()
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S"); shutil.copy(fp, fp + ".corrupt_" + ts); return _freeze(_blank_db())
+    _cache_put(fp, signature, view)
+    return view
+def load_db(weight_class):
+    """Return a private, mutable copy of a weight class DB for load-modify-save cycles."""
+    return _thaw(view_db(weight_class))
+@_notifies
 def save_db(weight_class, db):
     ensure_dirs(); fp = DB_FILES[weight_class]
-    fd, tmp = tempfile.mkstemp(prefix="._elo_", dir=DATA_DIR)
-    with os.fdopen(fd, "w", encoding="utf-8") as f:
-        json.dump(db, f, indent=2, ensure_ascii=False); f.flush(); os.fsync(f.fileno())
-    os.replace(tmp, fp)
+    if STORAGE_BACKEND == "sqlite": _sqlite_store().save_db(weight_class, db); return
+    if STORAGE_BACKEND == "journal":
+        # Journal records newer than db["journal_seq"] still replay on top of this snapshot.
+        with _exclusive_lock(_journal_lock_fp(fp)): _write_json_atomic(fp, _pack_db(db), "._elo_", indent=2)
+        return
+    packed = _pack_db(db)
+    signature = _write_json_atomic(fp, packed, "._elo_", indent=2)
+    # Cache exactly what a reload would return (KO index, robot stats), not the dict as passed in.
+    _cache_put(fp, signature, _freeze(_unpack_db(packed)))
+
+
+@_notifies
+def commit_db_change(weight_class, db, record):
+    """Apply ``record`` (see apply_db_record) to ``db`` and persist it.
+
+    The JSON backend rewrites the whole file; the journal backend appends a single line and
+    compacts once the journal grows past JOURNAL_COMPACT_BYTES; SQLite writes only the touched rows.
+    """
+    result = apply_db_record(db, record)
+    _persist_db_record(weight_class, db, record, result)
+    return result
+def _persist_db_record(weight_class, db, record, result):
+    """Write a record that apply_db_record has already applied to ``db``."""
+    ensure_dirs()
+    if STORAGE_BACKEND == "sqlite": _sqlite_store().commit_record(weight_class, db, record, result); return
+    if STORAGE_BACKEND != "journal": save_db(weight_class, db); return
+    fp = DB_FILES[weight_class]
+    with _exclusive_lock(_journal_lock_fp(fp)):
+        # Sequence past anything on disk so a concurrent compaction can't fold this record away.
+        seq = max(int(db.get("journal_seq", 0)), int(_view_journaled_db(fp).get("journal_seq", 0))) + 1
+        db["journal_seq"] = seq
+        line = json.dumps(dict(record, seq=seq), ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(_journal_fp(fp), "a", encoding="utf-8", newline="") as f:
+            f.write(line); f.flush(); os.fsync(f.fileno()); size = f.tell()
+        if size >= JOURNAL_COMPACT_BYTES: _compact_journal_locked(fp)
+
+
+def _compact_journal_locked(fp):
+    db = _thaw(_view_journaled_db(fp))
+    _write_json_atomic(fp, _pack_db(db), "._elo_", indent=2)
+    # Swap in a fresh (new inode) journal so readers never tail-read across a truncation.
+    fd, tmp = tempfile.mkstemp(prefix="._elo_journal_", dir=DATA_DIR); os.close(fd)
+    os.replace(tmp, _journal_fp(fp))
+def compact_journal(weight_class):
+    """Fold the weight class journal into its snapshot file and start an empty journal."""
+    ensure_dirs(); fp = DB_FILES[weight_class]
+    if not os.path.exists(_journal_fp(fp)): return
+    with _exclusive_lock(_journal_lock_fp(fp)): _compact_journal_locked(fp)
+def compact_journals():
+    if STORAGE_BACKEND != "journal": return
+    for wc in DB_FILES.keys(): compact_journal(wc)
+def document_versions():
+    """Cheap change tokens for every Elo DB, the schedule and the judging state.
+
+    Built from file stat signatures (or the SQLite version counters) without parsing anything,
+    so callers can detect "nothing changed" before doing real work.
+    """
+    ensure_dirs()
+    if STORAGE_BACKEND == "sqlite":
+        store = _sqlite_store()
+        with store.snapshot():
+            return (elo_versions(), store.version("schedule"), store.version("judging"))
+    return (elo_versions(), _path_signature(SCHEDULE_FP), _path_signature(JUDGING_FP))
+def elo_versions():
+    """Change tokens for the Elo DBs only (see document_versions)."""
+    if STORAGE_BACKEND == "sqlite":
+        store = _sqlite_store()
+        return tuple(store.version("elo:" + wc) for wc in DB_FILES.keys())
+    return tuple((_path_signature(fp), _path_signature(_journal_fp(fp))) for fp in DB_FILES.values())
 def load_all(): return {wc: load_db(wc) for wc in DB_FILES.keys()}
+def view_all(): return {wc: view_db(wc) for wc in DB_FILES.keys()}
 def export_stats_csv(weight_class):
-    db = load_db(weight_class); robots = db.get("robots", {}); rows = []
+    db = view_db(weight_class); robots = db.get("robots", {}); rows = []
     for name, info in robots.items():
-        matches = info.get("matches", []); wins=losses=draws=ko_wins=ko_losses=0; last_ts=None
-        for m in matches:
-            ts=m.get("timestamp"); last_ts = max(last_ts, ts) if last_ts is not None else ts
-            res = m.get("result",""); robot_is_red = (m.get("red_corner")==name)
-            if res=="Draw": draws+=1; continue
-            red_win = res.startswith("Red wins"); is_ko = "KO" in res
-            won = (red_win and robot_is_red) or ((not red_win) and (not robot_is_red))
-            if won: wins+=1; ko_wins+= int(is_ko)
-            else: losses+=1; ko_losses+= int(is_ko)
-        total = wins+losses+draws
+        stats = robot_stats_record(info, name); total = stats["matches"]; last_ts = stats["last_match_ts"]
         rows.append({"robot":name,"rating":info.get("rating",DEFAULT_RATING),"matches":total,
-                     "wins":wins,"losses":losses,"draws":draws,"ko_wins":ko_wins,"ko_losses":ko_losses,
-                     "win_rate": round(wins/total,4) if total else 0.0,
+                     **{k: stats[k] for k in STAT_KEYS},
+                     "win_rate": round(stats["wins"]/total,4) if total else 0.0,
                      "last_match_date": (datetime.datetime.fromtimestamp(last_ts).strftime('%Y-%m-%d %H:%M:%S') if last_ts else "")})
     outdir = os.path.join(DATA_DIR,"exports"); os.makedirs(outdir, exist_ok=True)
     fp = os.path.join(outdir, f"{weight_class.lower()}_stats.csv")
@@ -57,12 +478,16 @@ def export_stats_csv(weight_class):
     return fp
 def load_schedule():
     ensure_dirs()
+    if STORAGE_BACKEND == "sqlite": return _sqlite_store().load_schedule() or {"list":[]}
     if not os.path.exists(SCHEDULE_FP): return {"list":[]}
     with open(SCHEDULE_FP,"r",encoding="utf-8") as f:
         try: return json.load(f)
         except Exception: return {"list":[]}
+@_notifies
 def save_schedule(sched):
-    ensure_dirs(); fd,tmp = tempfile.mkstemp(prefix="._elo_sched_", dir=DATA_DIR)
+    ensure_dirs()
+    if STORAGE_BACKEND == "sqlite": _sqlite_store().save_schedule(sched); return
+    fd,tmp = tempfile.mkstemp(prefix="._elo_sched_", dir=DATA_DIR)
     with os.fdopen(fd,"w",encoding="utf-8") as f:
         json.dump(sched,f,indent=2,ensure_ascii=False); f.flush(); os.fsync(f.fileno())
     os.replace(tmp, SCHEDULE_FP)
@@ -99,6 +524,12 @@ def _ensure_state_metadata(state, *, bump: bool = True, timestamp: Optional[int]
 
 def load_judging_state():
     ensure_dirs()
+    if STORAGE_BACKEND == "sqlite":
+        state = _sqlite_store().load_judging_state()
+        if state is None:
+            state = _blank_judging_state()
+            save_judging_state(state)
+        return state
     if not os.path.exists(JUDGING_FP):
         state = _blank_judging_state()
         save_judging_state(state)
@@ -115,9 +546,14 @@ def load_judging_state():
         except Exception:
             return _blank_judging_state()
 
+@_notifies
 def save_judging_state(state, *, bump: bool = True):
     ensure_dirs()
     state = _ensure_state_metadata(state, bump=bump)
+    _rotate_judging_history(state)
+    if STORAGE_BACKEND == "sqlite":
+        _sqlite_store().save_judging_state(state)
+        return
     fd, tmp = tempfile.mkstemp(prefix="._judging_", dir=DATA_DIR)
     with os.fdopen(fd, "w", encoding="utf-8") as f:
         json.dump(state, f, indent=2, ensure_ascii=False)
@@ -126,31 +562,333 @@ def save_judging_state(state, *, bump: bool = True):
     os.replace(tmp, JUDGING_FP)
 
 
+
+# Judged matches beyond the newest JUDGING_HISTORY_WINDOW leave judging.json for an append-only
+# archive: one JSON-lines segment per event (the local date the match was completed), so the hot
+# state every page view loads and normalizes stays bounded however long the night runs.
+JUDGING_HISTORY_WINDOW = 25
+_ARCHIVE_CACHE: Dict[str, Tuple[Any, List[dict]]] = {}
+_ARCHIVE_CACHE_LOCK = threading.Lock()
+
+
+def _judging_archive_dir(): return os.path.join(DATA_DIR, "judging_archive")
+
+
+def _judged_at(entry) -> int:
+    try: return int(entry.get("completed_at") or entry.get("created_at") or 0)
+    except (TypeError, ValueError): return 0
+
+
+def _archive_event(entry) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(_judged_at(entry) or time.time()))
+
+
+def archive_judging_entries(entries):
+    """Append judged matches to their event segments; re-archiving a match_id supersedes the old line."""
+    by_event: Dict[str, List[str]] = {}
+    for entry in entries:
+        if isinstance(entry, dict):
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+            by_event.setdefault(_archive_event(entry), []).append(line)
+    if not by_event: return
+    os.makedirs(_judging_archive_dir(), exist_ok=True)
+    for event, lines in by_event.items():
+        with open(os.path.join(_judging_archive_dir(), event + ".jsonl"), "a", encoding="utf-8") as f:
+            f.write("".join(lines)); f.flush(); os.fsync(f.fileno())
+
+
+def _rotate_judging_history(state):
+    history = state.get("history")
+    if not isinstance(history, list) or len(history) <= JUDGING_HISTORY_WINDOW: return
+    history = sorted(history, key=lambda e: _judged_at(e) if isinstance(e, dict) else 0, reverse=True)
+    # Archive first: a crash before the save leaves a duplicate that readers drop by match_id.
+    archive_judging_entries(history[JUDGING_HISTORY_WINDOW:])
+    state["history"] = history[:JUDGING_HISTORY_WINDOW]
+
+
+def judging_archive_events() -> List[str]:
+    """Archived event names, newest first."""
+    try: names = os.listdir(_judging_archive_dir())
+    except FileNotFoundError: return []
+    return sorted((n[:-len(".jsonl")] for n in names if n.endswith(".jsonl")), reverse=True)
+
+
+def judging_archive_version():
+    """Change token for the judging archive: the stat signature of every segment."""
+    return tuple((event, _path_signature(os.path.join(_judging_archive_dir(), event + ".jsonl")))
+                 for event in judging_archive_events())
+
+
+def load_judging_archive(event) -> List[dict]:
+    """One event's archived matches, newest first (cached until the segment grows). Treat as read-only."""
+    fp = os.path.join(_judging_archive_dir(), event + ".jsonl")
+    signature = _path_signature(fp)
+    with _ARCHIVE_CACHE_LOCK: cached = _ARCHIVE_CACHE.get(fp)
+    if cached is not None and cached[0] == signature: return cached[1]
+    latest: Dict[Any, dict] = {}
+    if signature is not None:
+        with open(fp, "r", encoding="utf-8") as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue  # torn tail from a crash mid-append
+                if isinstance(entry, dict): latest[entry.get("match_id") or id(entry)] = entry
+    entries = sorted(latest.values(), key=_judged_at, reverse=True)
+    with _ARCHIVE_CACHE_LOCK: _ARCHIVE_CACHE[fp] = (signature, entries)
+    return entries
+
+
+def iter_judging_archive() -> Iterator[dict]:
+    """Every archived match, newest event first; lazily, so paging reads only the segments it needs."""
+    for event in judging_archive_events():
+        yield from load_judging_archive(event)
+
+
+@contextlib.contextmanager
+def _judging_write_lock():
+    if STORAGE_BACKEND == "sqlite":
+        with _sqlite_store().transaction():
+            yield
+        return
+    with _exclusive_lock(JUDGING_LOCK_FP):
+        yield
+
+
+class _SectionTracker(dict):
+    """Judging state handed to update_judging_state mutators.
+
+    The first read of a top-level section (``current``, ``history``, ...) snapshots that
+    section, so change detection afterwards compares only what the mutator could have reached.
+    Whole-dict reads (``dict(state)``, ``{**state}``, ``items()``) touch every section.
+    """
+    __slots__ = ("snapshots",)
+    def __init__(self, state):
+        super().__init__(state)
+        self.snapshots = {}
+    def _touch(self, key):
+        if key not in self.snapshots and dict.__contains__(self, key):
+            self.snapshots[key] = _thaw(dict.__getitem__(self, key))
+    def _touch_all(self):
+        for key in dict.keys(self): self._touch(key)
+    def __getitem__(self, key):
+        self._touch(key)
+        return dict.__getitem__(self, key)
+    def get(self, key, default=None):
+        self._touch(key)
+        return dict.get(self, key, default)
+    def pop(self, key, *default):
+        self._touch(key)
+        return dict.pop(self, key, *default)
+    def setdefault(self, key, default=None):
+        self._touch(key)
+        return dict.setdefault(self, key, default)
+    def popitem(self):
+        self._touch_all()
+        return dict.popitem(self)
+    # Overriding __iter__ also routes dict(state), {**state} and state | other through __getitem__.
+    def __iter__(self):
+        return iter(dict.keys(self))
+    def items(self):
+        self._touch_all()
+        return dict.items(self)
+    def values(self):
+        self._touch_all()
+        return dict.values(self)
+    def copy(self):
+        return dict(self)
+    __copy__ = copy
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def changed(self, new_state, original):
+        """Whether ``new_state`` differs from the loaded state in any section it touched or replaced."""
+        for key in original.keys() | new_state.keys():
+            before = self.snapshots.get(key, original.get(key, _MISSING))
+            after = dict.get(new_state, key, _MISSING)
+            if key not in self.snapshots and after is before:
+                continue  # never read, so never mutated in place
+            if after != before:
+                return True
+        return False
+
+
+_MISSING = object()
+
+
+@_notifies
 def update_judging_state(mutator: Callable[[Any], Any]):
-    """Atomically load, mutate, and persist the judging state."""
+    """Atomically load, mutate, and persist the judging state.
+
+    Change detection is per section: a section is copied the first time the mutator reads it,
+    and only read or replaced sections are compared afterwards, so the cost follows what the
+    mutator touched rather than the whole state. Request handlers use transaction() instead,
+    where the caller says what changed by calling save_judging().
+    """
     ensure_dirs()
-    lock_file = open(JUDGING_LOCK_FP, "a+")
-    try:
-        if fcntl is not None:
-            fcntl.flock(lock_file, fcntl.LOCK_EX)
-        state = load_judging_state()
-        original_snapshot = json.dumps(
-            state, sort_keys=True, separators=(",", ":"), ensure_ascii=False
-        )
+    with _judging_write_lock():
+        original = load_judging_state()
+        state = _SectionTracker(original)
         new_state = mutator(state)
         if new_state is None or not isinstance(new_state, dict):
             new_state = state
-        updated_snapshot = json.dumps(
-            new_state, sort_keys=True, separators=(",", ":"), ensure_ascii=False
-        )
-        changed = updated_snapshot != original_snapshot
-        has_meta = isinstance(new_state.get("_meta"), dict) if isinstance(new_state, dict) else False
+        changed = state.changed(new_state, original)
+        new_state = dict(dict.items(new_state))
+        has_meta = isinstance(new_state.get("_meta"), dict)
         if changed:
             save_judging_state(new_state, bump=True)
         elif not has_meta:
             save_judging_state(new_state, bump=False)
         return new_state
-    finally:
-        if fcntl is not None:
-            fcntl.flock(lock_file, fcntl.LOCK_UN)
-        lock_file.close()
+
+
+# Snapshots are derived documents (e.g. the OBS overlay) shared between worker processes. They
+# are rebuildable from the real documents, so writes are atomic but not fsynced or announced.
+def _snapshot_fp(name): return os.path.join(DATA_DIR, f"{name}.snapshot.json")
+
+
+def load_snapshot(name):
+    """The last snapshot saved under ``name``, or None."""
+    snapshot = _read_json_file(_snapshot_fp(name), None)
+    return snapshot if isinstance(snapshot, dict) else None
+
+
+def save_snapshot(name, snapshot):
+    ensure_dirs()
+    fd, tmp = tempfile.mkstemp(prefix=f"._{name}_", dir=DATA_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, _snapshot_fp(name))
+
+def _schedule_lock_fp(): return SCHEDULE_FP + ".lock"
+
+
+class Transaction:
+    """Documents claimed by transaction(): each is loaded once and written when the block exits.
+
+    Read with db()/schedule()/judging(); stage writes with commit_db_change() (an Elo change
+    record, journaled or row-level where the backend supports it), save_db(), save_schedule(),
+    save_judging() and archive_judging(). Touching a document that was not claimed raises
+    ValueError, since its lock was never taken.
+    """
+
+    def __init__(self, weight_classes, schedule, judging):
+        self._claimed = set(weight_classes) | ({"schedule"} if schedule else set()) | ({"judging"} if judging else set())
+        self._dbs: Dict[str, Any] = {}
+        self._records: Dict[str, list] = {}
+        self._full_saves = set()
+        self._schedule = None
+        self._schedule_dirty = False
+        self._judging = None
+        self._judging_bump = None  # None: unchanged; else the bump flag for save_judging_state
+        self._archived = []
+
+    def _claim(self, document):
+        if document not in self._claimed:
+            raise ValueError(f"{document!r} is not part of this transaction")
+
+    def db(self, weight_class):
+        self._claim(weight_class)
+        if weight_class not in self._dbs: self._dbs[weight_class] = load_db(weight_class)
+        return self._dbs[weight_class]
+
+    def commit_db_change(self, weight_class, record):
+        """Apply ``record`` now (see apply_db_record); it is persisted when the transaction commits."""
+        db = self.db(weight_class)
+        result = apply_db_record(db, record)
+        self._records.setdefault(weight_class, []).append((record, result))
+        return result
+
+    def save_db(self, weight_class, db=None):
+        if db is not None: self._claim(weight_class); self._dbs[weight_class] = db
+        else: self.db(weight_class)
+        self._full_saves.add(weight_class)
+
+    def schedule(self):
+        self._claim("schedule")
+        if self._schedule is None: self._schedule = load_schedule()
+        return self._schedule
+
+    def save_schedule(self, sched=None):
+        self._claim("schedule")
+        self._schedule = sched if sched is not None else self.schedule()
+        self._schedule_dirty = True
+
+    def judging(self):
+        self._claim("judging")
+        if self._judging is None: self._judging = load_judging_state()
+        return self._judging
+
+    def save_judging(self, state=None, *, bump: bool = True):
+        self._claim("judging")
+        self._judging = state if state is not None else self.judging()
+        self._judging_bump = bool(bump or self._judging_bump)
+
+    def archive_judging(self, entries):
+        """Stage judged matches for archive_judging_entries(); appended only if the block commits."""
+        self._claim("judging")
+        self._archived.extend(entries)
+
+    def _commit(self):
+        for weight_class in DB_FILES:
+            if weight_class in self._full_saves or (STORAGE_BACKEND == "json" and weight_class in self._records):
+                save_db(weight_class, self._dbs[weight_class])
+                continue
+            for record, result in self._records.get(weight_class, ()):
+                _persist_db_record(weight_class, self._dbs[weight_class], record, result)
+            if weight_class in self._records: notify_change()
+        if self._schedule_dirty: save_schedule(self._schedule)
+        archive_judging_entries(self._archived)
+        if self._judging_bump is not None: save_judging_state(self._judging, bump=self._judging_bump)
+
+
+@contextlib.contextmanager
+def transaction(weight_classes=(), *, schedule=False, judging=False):
+    """Hold the locks of several documents, hand out one loaded copy of each, commit at the end.
+
+    Locks are taken in a fixed order (Elo DBs in DB_FILES order, then the schedule, then the
+    judging state) so concurrent transactions cannot deadlock, and only the claimed documents
+    are locked, so e.g. a judge submission and a match on another class proceed side by side.
+    Nothing is written if the block raises. SQLite runs the whole block in one write transaction.
+    """
+    weight_classes = [wc for wc in DB_FILES if wc in set(weight_classes)]
+    ensure_dirs()
+    txn = Transaction(weight_classes, schedule, judging)
+    with contextlib.ExitStack() as stack:
+        if STORAGE_BACKEND == "sqlite":
+            stack.enter_context(_sqlite_store().transaction())
+        else:
+            for wc in weight_classes: stack.enter_context(_exclusive_lock(_journal_lock_fp(DB_FILES[wc])))
+            if schedule: stack.enter_context(_exclusive_lock(_schedule_lock_fp()))
+            if judging: stack.enter_context(_exclusive_lock(JUDGING_LOCK_FP))
+        yield txn
+        txn._commit()
+
+
+def _read_json_file(fp, default):
+    if not os.path.exists(fp): return default
+    with open(fp, "r", encoding="utf-8") as f:
+        try: return json.load(f)
+        except Exception: return default
+def import_json_to_sqlite():
+    """Copy the Elo files (plus any journal), schedule.json and judging.json into the SQLite database."""
+    ensure_dirs(); store = _sqlite_store()
+    with store.transaction():
+        for wc, fp in DB_FILES.items(): store.save_db(wc, _thaw(_view_journaled_db(fp)))
+        store.save_schedule(_read_json_file(SCHEDULE_FP, {"list": []}))
+        state = _read_json_file(JUDGING_FP, None)
+        store.save_judging_state(_ensure_state_metadata(state if isinstance(state, dict) else None, bump=False))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="BotBrawl storage maintenance")
+    parser.add_argument("command", choices=["migrate", "compact", "import-sqlite", "rebuild-stats"],
+                        help="migrate: rewrite Elo files in the current format; compact: fold journals into "
+                             "snapshots; import-sqlite: load the JSON data files into the SQLite database; "
+                             "rebuild-stats: recompute every robot's win/loss aggregate from history")
+    args = parser.parse_args()
+    if args.command == "import-sqlite":
+        import_json_to_sqlite(); print(f"imported into {_sqlite_store().path}"); raise SystemExit(0)
+    for wc in DB_FILES.keys():
+        if args.command == "migrate": save_db(wc, load_db(wc))
+        elif args.command == "compact": compact_journal(wc)
+        elif args.command == "rebuild-stats": save_db(wc, rebuild_robot_stats(load_db(wc)))
+        print(f"{args.command}: {wc} done")
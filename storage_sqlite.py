@@ -0,0 +1,297 @@
+"""SQLite (WAL mode) backend for storage.py, selected with BOTBRAWL_STORAGE=sqlite.
+
+Documents are handed back in the same dict shapes the JSON files use. Robots, matches, schedule
+cards, judged matches and judge cards each live in their own indexed table, and saving a whole
+document only rewrites the rows whose content actually changed.
+"""
+import contextlib
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS weight_classes (
+    weight_class TEXT PRIMARY KEY, next_match_id INTEGER NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS robots (
+    weight_class TEXT NOT NULL, name TEXT NOT NULL, rating REAL, present INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL, PRIMARY KEY (weight_class, name));
+CREATE TABLE IF NOT EXISTS matches (
+    weight_class TEXT NOT NULL, match_id INTEGER NOT NULL, timestamp INTEGER, red_corner TEXT,
+    white_corner TEXT, result TEXT, data TEXT NOT NULL, PRIMARY KEY (weight_class, match_id));
+CREATE INDEX IF NOT EXISTS matches_red ON matches (weight_class, red_corner);
+CREATE INDEX IF NOT EXISTS matches_white ON matches (weight_class, white_corner);
+CREATE TABLE IF NOT EXISTS schedule_cards (
+    position INTEGER PRIMARY KEY, weight_class TEXT, red TEXT, white TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS judging_matches (
+    slot TEXT NOT NULL, position INTEGER NOT NULL, match_id TEXT, data TEXT NOT NULL,
+    PRIMARY KEY (slot, position));
+CREATE INDEX IF NOT EXISTS judging_matches_id ON judging_matches (match_id);
+CREATE TABLE IF NOT EXISTS judge_cards (
+    slot TEXT NOT NULL, position INTEGER NOT NULL, judge_key TEXT NOT NULL, data TEXT NOT NULL,
+    PRIMARY KEY (slot, position, judge_key));
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+class SQLiteStore:
+    """One SQLite database file; connections are kept per thread (gthread workers)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self, mode: str = "IMMEDIATE"):
+        """Run statements in one transaction; nested calls join the outer transaction."""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def snapshot(self):
+        """Read-only transaction so multi-table reads see one consistent state."""
+        return self.transaction("DEFERRED")
+
+    # ---- versions & meta -------------------------------------------------
+    def version(self, doc: str) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key=?", ("version:" + doc,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump(self, conn: sqlite3.Connection, doc: str) -> None:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            ("version:" + doc,),
+        )
+
+    def _get_meta(self, conn: sqlite3.Connection, key: str) -> Optional[Any]:
+        row = conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: Any) -> None:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, _dumps(value)),
+        )
+
+    def _sync(
+        self,
+        conn: sqlite3.Connection,
+        table: str,
+        scope: Dict[str, Any],
+        keys: Tuple[str, ...],
+        rows: Dict[Tuple[Any, ...], Dict[str, Any]],
+    ) -> None:
+        """Make ``table`` rows inside ``scope`` equal ``rows``, touching only rows that differ."""
+        where = " AND ".join(f"{col}=?" for col in scope) or "1"
+        existing = {
+            tuple(r[:-1]): r[-1]
+            for r in conn.execute(f"SELECT {', '.join(keys)}, data FROM {table} WHERE {where}", tuple(scope.values()))
+        }
+        for key in existing.keys() - rows.keys():
+            clause = " AND ".join(f"{col}=?" for col in (*scope, *keys))
+            conn.execute(f"DELETE FROM {table} WHERE {clause}", (*scope.values(), *key))
+        pk = (*scope, *keys)
+        for key, cols in rows.items():
+            if existing.get(key) == cols["data"]:
+                continue
+            values = {**scope, **dict(zip(keys, key)), **cols}
+            updates = ", ".join(f"{col}=excluded.{col}" for col in cols)
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join('?' * len(values))}) "
+                f"ON CONFLICT({', '.join(pk)}) DO UPDATE SET {updates}",
+                tuple(values.values()),
+            )
+
+    # ---- Elo databases ---------------------------------------------------
+    @staticmethod
+    def _robot_cols(info: Dict[str, Any]) -> Dict[str, Any]:
+        data = {k: v for k, v in info.items() if k != "matches"}
+        return {"rating": data.get("rating"), "present": int(bool(data.get("present"))), "data": _dumps(data)}
+
+    @staticmethod
+    def _match_cols(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "timestamp": entry.get("timestamp"),
+            "red_corner": entry.get("red_corner"),
+            "white_corner": entry.get("white_corner"),
+            "result": entry.get("result"),
+            "data": _dumps(entry),
+        }
+
+    def load_db(self, weight_class: str) -> Optional[Dict[str, Any]]:
+        with self.snapshot() as conn:
+            row = conn.execute(
+                "SELECT next_match_id, data FROM weight_classes WHERE weight_class=?", (weight_class,)
+            ).fetchone()
+            if row is None:
+                return None
+            db = json.loads(row[1])
+            db["next_match_id"] = row[0]
+            history = [
+                json.loads(data)
+                for (data,) in conn.execute("SELECT data FROM matches WHERE weight_class=? ORDER BY rowid", (weight_class,))
+            ]
+            robots = {}
+            for name, data in conn.execute("SELECT name, data FROM robots WHERE weight_class=? ORDER BY rowid", (weight_class,)):
+                info = json.loads(data)
+                info["matches"] = []
+                robots[name] = info
+        for entry in history:
+            for corner in {entry.get("red_corner"), entry.get("white_corner")}:
+                if corner in robots:
+                    robots[corner]["matches"].append(entry)
+        db["robots"] = robots
+        db["history"] = history
+        return db
+
+    def save_db(self, weight_class: str, db: Dict[str, Any]) -> None:
+        class_data = {k: v for k, v in db.items() if k not in ("robots", "history", "next_match_id", "ko_results")}
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO weight_classes (weight_class, next_match_id, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(weight_class) DO UPDATE SET next_match_id=excluded.next_match_id, data=excluded.data",
+                (weight_class, int(db.get("next_match_id", 1)), _dumps(class_data)),
+            )
+            robots = db.get("robots") or {}
+            self._sync(conn, "robots", {"weight_class": weight_class}, ("name",),
+                       {(name,): self._robot_cols(info) for name, info in robots.items()})
+            history = db.get("history") or []
+            self._sync(conn, "matches", {"weight_class": weight_class}, ("match_id",),
+                       {(entry.get("match_id"),): self._match_cols(entry) for entry in history})
+            self._bump(conn, "elo:" + weight_class)
+
+    def commit_record(self, weight_class: str, db: Dict[str, Any], record: Dict[str, Any], result: Any) -> None:
+        """Persist a change already applied to ``db`` by writing only the rows it touched."""
+        op = record.get("op")
+        robots = db.get("robots") or {}
+        touched: Iterable[str] = ()
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM weight_classes WHERE weight_class=?", (weight_class,)).fetchone() is None:
+                self.save_db(weight_class, db)
+                return
+            if op == "match":
+                conn.execute(
+                    "INSERT INTO matches (weight_class, match_id, timestamp, red_corner, white_corner, result, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (weight_class, result.get("match_id"), *self._match_cols(result).values()),
+                )
+                conn.execute(
+                    "UPDATE weight_classes SET next_match_id=? WHERE weight_class=?",
+                    (int(db.get("next_match_id", 1)), weight_class),
+                )
+                touched = (result.get("red_corner"), result.get("white_corner"))
+            elif op == "undo" and result is not None:
+                conn.execute(
+                    "DELETE FROM matches WHERE weight_class=? AND match_id=?", (weight_class, result.get("match_id"))
+                )
+                touched = (result.get("red_corner"), result.get("white_corner"))
+            elif op == "presence":
+                touched = (record.get("robot"),)
+            for name in touched:
+                if name in robots:
+                    cols = self._robot_cols(robots[name])
+                    conn.execute(
+                        "UPDATE robots SET rating=?, present=?, data=? WHERE weight_class=? AND name=?",
+                        (*cols.values(), weight_class, name),
+                    )
+            self._bump(conn, "elo:" + weight_class)
+
+    # ---- schedule --------------------------------------------------------
+    def load_schedule(self) -> Optional[Dict[str, Any]]:
+        with self.snapshot() as conn:
+            extra = self._get_meta(conn, "schedule:extra")
+            if extra is None:
+                return None
+            cards = [json.loads(data) for (data,) in conn.execute("SELECT data FROM schedule_cards ORDER BY position")]
+        extra["list"] = cards
+        return extra
+
+    def save_schedule(self, sched: Dict[str, Any]) -> None:
+        cards = sched.get("list") or []
+        rows = {}
+        for idx, card in enumerate(cards):
+            card_d = card if isinstance(card, dict) else {}
+            rows[(idx,)] = {
+                "weight_class": card_d.get("weight_class"),
+                "red": card_d.get("red"),
+                "white": card_d.get("white"),
+                "data": _dumps(card),
+            }
+        with self.transaction() as conn:
+            self._sync(conn, "schedule_cards", {}, ("position",), rows)
+            self._set_meta(conn, "schedule:extra", {k: v for k, v in sched.items() if k != "list"})
+            self._bump(conn, "schedule")
+
+    # ---- judging ---------------------------------------------------------
+    def load_judging_state(self) -> Optional[Dict[str, Any]]:
+        with self.snapshot() as conn:
+            meta = self._get_meta(conn, "judging:meta")
+            if meta is None:
+                return None
+            state = self._get_meta(conn, "judging:extra") or {}
+            matches = {
+                (slot, position): json.loads(data)
+                for slot, position, data in conn.execute(
+                    "SELECT slot, position, data FROM judging_matches ORDER BY slot, position DESC"
+                )
+            }
+            for slot, position, judge_key, data in conn.execute(
+                "SELECT slot, position, judge_key, data FROM judge_cards ORDER BY rowid"
+            ):
+                match = matches.get((slot, position))
+                if isinstance(match, dict):
+                    match.setdefault("judges", {})[judge_key] = json.loads(data)
+        state["current"] = matches.get(("current", 0))
+        state["history"] = [m for (slot, _), m in matches.items() if slot == "history"]
+        state["_meta"] = meta
+        return state
+
+    def save_judging_state(self, state: Dict[str, Any]) -> None:
+        match_rows: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        card_rows: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+        def add(slot: str, position: int, match: Any) -> None:
+            data = match
+            if isinstance(match, dict) and isinstance(match.get("judges"), dict):
+                data = dict(match, judges={})
+                for judge_key, rec in match["judges"].items():
+                    card_rows[(slot, position, str(judge_key))] = {"data": _dumps(rec)}
+            match_id = match.get("match_id") if isinstance(match, dict) else None
+            match_rows[(slot, position)] = {"match_id": match_id, "data": _dumps(data)}
+
+        if state.get("current") is not None:
+            add("current", 0, state["current"])
+        history = state.get("history") or []
+        # Positions count up from the oldest entry so prepending a result leaves older rows untouched.
+        for idx, entry in enumerate(history):
+            add("history", len(history) - 1 - idx, entry)
+        extra = {k: v for k, v in state.items() if k not in ("current", "history", "_meta")}
+        with self.transaction() as conn:
+            self._sync(conn, "judging_matches", {}, ("slot", "position"), match_rows)
+            self._sync(conn, "judge_cards", {}, ("slot", "position", "judge_key"), card_rows)
+            self._set_meta(conn, "judging:meta", state.get("_meta") or {})
+            self._set_meta(conn, "judging:extra", extra)
+            self._bump(conn, "judging")
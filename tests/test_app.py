@@ -1,11 +1,15 @@
+import json
 import os
 import tempfile
+import threading
+import time
 import unittest
 from unittest import mock
 
 from flask import url_for
 
 import app as bot_app
+import judging
 import storage
 
 
@@ -40,6 +44,21 @@ class AppRoutesTestCase(unittest.TestCase):
             self.addCleanup(p.stop)
 
         storage.ensure_dirs()
+        # Version-keyed caches outlive a test; SQLite version counters restart with every database.
+        bot_app._overlay_snapshot.clear()
+        bot_app._WHAT_IF_CACHE.clear()
+
+    def _add_robots(self, *names, absent=(), ratings=None, wc=None):
+        """Register ``names`` (Alpha and Bravo by default) in ``wc``; returns the weight class."""
+        wc = wc or bot_app.WEIGHT_CLASSES[0]
+        db = storage.load_db(wc)
+        for name in names or ("Alpha", "Bravo"):
+            db["robots"][name] = {"rating": (ratings or {}).get(name, 1000), "matches": [], "present": name not in absent}
+        storage.save_db(wc, db)
+        return wc
+
+    def _schedule(self, wc, *pairs):
+        storage.save_schedule({"list": [{"weight_class": wc, "red": red, "white": white} for red, white in pairs]})
 
     def test_robot_display_handles_invalid_weight_class(self):
         result = bot_app.robot_display("Unknown", "TestBot")
@@ -103,6 +122,347 @@ class AppRoutesTestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn(b"No fights are scheduled yet", resp.data)
 
+    def test_judge_state_etag_ignores_delta_and_tracks_the_archive(self):
+        wc = bot_app.WEIGHT_CLASSES[0]
+        total = storage.JUDGING_HISTORY_WINDOW + 5
+        history = [
+            {"match_id": f"j{i}", "weight_class": wc, "red": "Alpha", "white": "Bravo",
+             "created_at": 1000 + i, "completed_at": 1000 + i, "judges": {}}
+            for i in range(total, 0, -1)
+        ]
+        storage.update_judging_state(lambda s: dict(s, history=history))
+        first = self.client.get("/api/judge/state")
+        etag = first.headers["ETag"]
+        delta = self.client.get(f"/api/judge/state?delta={first.get_json()['revision']}", headers={"If-None-Match": etag})
+        self.assertEqual(delta.status_code, 304)
+
+        # Re-archiving supersedes the old line without touching judging.json.
+        storage.archive_judging_entries([dict(history[-1], red="Aleph")])
+        changed = self.client.get("/api/judge/state", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()["history"][-1]["red"], "Aleph")
+
+    def test_submit_match_and_undo_round_trip(self):
+        wc = self._add_robots()
+
+        self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": "Red wins JD"})
+        after = storage.view_db(wc)
+        self.assertEqual(len(after["history"]), 1)
+        self.assertGreater(after["robots"]["Alpha"]["rating"], 1000)
+        self.assertEqual(len(after["robots"]["Bravo"]["matches"]), 1)
+
+        self.client.post("/undo", data={"wc": wc})
+        undone = storage.view_db(wc)
+        self.assertEqual(undone["history"], [])
+        self.assertEqual(undone["robots"]["Alpha"]["rating"], 1000)
+        self.assertEqual(undone["robots"]["Alpha"]["matches"], [])
+
+    def test_robot_rename_updates_shared_match_entries(self):
+        wc = self._add_robots()
+        self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": "Red wins KO"})
+
+        self.client.post("/robot/edit", data={"wc": wc, "old": "Alpha", "new": "Aleph"})
+        renamed = storage.view_db(wc)
+        self.assertEqual(renamed["history"][0]["red_corner"], "Aleph")
+        self.assertEqual(renamed["robots"]["Bravo"]["matches"][0]["red_corner"], "Aleph")
+        self.assertEqual(bot_app.robot_stats(renamed, "Aleph")["ko_wins"], 1)
+
+    def test_deleted_robots_keep_their_fights_after_delete_and_format_1_load(self):
+        wc, legacy_wc = self._add_robots(), bot_app.WEIGHT_CLASSES[1]
+        self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": "Red wins KO"})
+        fight = dict(storage.view_db(wc)["history"][0])
+        self.client.post("/robot/delete", data={"wc": wc, "name": "Alpha"})
+
+        # A format-1 file written by the old deletion: the fight survives only in Bravo's copy.
+        legacy = {"robots": {"Bravo": {"rating": fight["new_rating_white"], "matches": [fight]}},
+                  "history": [], "next_match_id": 2}
+        with open(storage.DB_FILES[legacy_wc], "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        with mock.patch.object(storage, "STORAGE_BACKEND", "json"):
+            loaded = storage.view_db(legacy_wc)
+
+        for view in (storage.view_db(wc), loaded):
+            self.assertNotIn("Alpha", view["robots"])
+            self.assertEqual([m["match_id"] for m in view["history"]], [fight["match_id"]])
+            self.assertEqual([m["match_id"] for m in view["ko_results"]], [fight["match_id"]])
+            self.assertEqual([m["match_id"] for m in view["robots"]["Bravo"]["matches"]], [fight["match_id"]])
+            self.assertEqual(view["robots"]["Bravo"]["stats"]["ko_losses"], 1)
+
+    def test_judge_state_answers_conditional_get_with_304(self):
+        first = self.client.get("/api/judge/state")
+        etag = first.headers.get("ETag")
+        self.assertTrue(etag)
+
+        cached = self.client.get("/api/judge/state", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers.get("ETag"), etag)
+
+        storage.update_judging_state(lambda s: dict(s, _test_counter=1))
+        changed = self.client.get("/api/judge/state", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers.get("ETag"), etag)
+
+    def test_judge_stream_emits_state_event(self):
+        response = self.client.get("/api/judge/stream", buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith("text/event-stream"))
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b"retry:"))
+        event = next(chunks).decode("utf-8")
+        response.close()
+        self.assertIn("event: state", event)
+        expected = storage.load_judging_state()["_meta"]["version"]
+        self.assertIn(f'"version": {expected}', event)
+
+    def test_judge_state_long_poll_waits_for_new_version(self):
+        version = self.client.get("/api/judge/state").get_json()["meta"]["version"]
+
+        timer = threading.Timer(0.1, storage.update_judging_state, args=(lambda s: dict(s, _test_counter=1),))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+        response = self.client.get(f"/api/judge/state?since={version}&wait=5")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.get_json()["meta"]["version"], version)
+        self.assertLess(time.monotonic() - started, 4)
+
+    def test_judge_state_long_poll_times_out_with_current_state(self):
+        version = self.client.get("/api/judge/state").get_json()["meta"]["version"]
+        response = self.client.get(f"/api/judge/state?since={version}&wait=0.05")
+        self.assertEqual(response.get_json()["meta"]["version"], version)
+
+
+    def test_judge_state_delta_returns_only_new_history(self):
+        wc = self._add_robots()
+        self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": "Red wins KO"})
+        first = self.client.get("/api/judge/state").get_json()
+        self.assertEqual(len(first["history"]), 1)
+        self.assertEqual(self.client.get("/api/judge/state").get_json()["revision"], first["revision"])
+
+        self.client.post("/submit_match", data={"wc": wc, "red": "Bravo", "white": "Alpha", "result": "White wins KO"})
+        delta = self.client.get(f"/api/judge/state?delta={first['revision']}").get_json()
+        self.assertTrue(delta["delta"])
+        self.assertEqual(len(delta["history"]), 1)
+        self.assertEqual(delta["history"][0]["red"], "Bravo")
+
+        unknown = self.client.get("/api/judge/state?delta=stale").get_json()
+        self.assertFalse(unknown["delta"])
+        self.assertEqual(len(unknown["history"]), 2)
+
+    def test_judge_feed_merges_all_ko_results_with_judged_history(self):
+        wc = self._add_robots()
+        db = storage.load_db(wc)
+        for match_id in range(1, 201):
+            result = "Red wins KO" if match_id % 2 else "White wins JD"
+            storage.apply_db_record(db, {"op": "match", "entry": {
+                "match_id": match_id, "timestamp": 1000 + match_id, "red_corner": "Alpha", "white_corner": "Bravo",
+                "result": result, "old_rating_red": 1000, "old_rating_white": 1000,
+                "new_rating_red": 1000, "new_rating_white": 1000, "change_red": 0, "change_white": 0,
+            }})
+        storage.save_db(wc, db)
+        judged = {"match_id": "j1", "weight_class": wc, "red": "Alpha", "white": "Bravo",
+                  "created_at": 1100, "completed_at": 1100, "judges": {}}
+        storage.update_judging_state(lambda s: dict(s, history=[judged]))
+
+        history = self.client.get("/api/judge/state").get_json()["history"]
+        self.assertEqual(len(history), 101)
+        self.assertEqual(history[-1]["match_id"], f"elo_{wc}_1")
+        stamps = [entry["completed_at"] for entry in history]
+        self.assertEqual(stamps, sorted(stamps, reverse=True))
+        self.assertIn("j1", [entry["match_id"] for entry in history])
+
+        limited = self.client.get("/api/judge/state?history=3").get_json()["history"]
+        self.assertEqual([entry["match_id"] for entry in limited], [f"elo_{wc}_199", f"elo_{wc}_197", f"elo_{wc}_195"])
+
+    def test_robot_presence_repairs_schedule_in_place(self):
+        wc = self._add_robots("Alpha", "Bravo", "Charlie", "Delta", "Echo", absent={"Echo"})
+        self._schedule(wc, ("Alpha", "Bravo"), ("Charlie", "Delta"))
+
+        self.client.post("/robot/presence", data={"wc": wc, "name": "Echo", "present": "1"})
+        self.client.post("/robot/presence", data={"wc": wc, "name": "Bravo", "present": "0"})
+
+        cards = [(card["red"], card["white"]) for card in storage.load_schedule()["list"]]
+        self.assertEqual(cards[1], ("Charlie", "Delta"))
+        self.assertEqual(cards[0][0], "Alpha")
+        self.assertNotIn("Bravo", {name for card in cards for name in card})
+        self.assertIn("Echo", {name for card in cards for name in card})
+
+    def test_robot_presence_remarking_leaves_schedule_alone(self):
+        wc = self._add_robots("Alpha", "Bravo", "Charlie", "Delta", "Echo", absent={"Echo"})
+        self._schedule(wc, ("Alpha", "Bravo"))
+        before = storage.load_schedule()["list"]
+
+        self.client.post("/robot/presence", data={"wc": wc, "name": "Charlie", "present": "1"})
+        self.client.post("/robot/presence", data={"wc": wc, "name": "Echo", "present": "0"})
+
+        self.assertEqual(storage.load_schedule()["list"], before)
+        self.assertEqual(len(storage.view_db(wc)["history"]), 0)
+
+    def test_rolling_schedule_tops_up_when_a_card_is_fought(self):
+        wc = self._add_robots("Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot")
+
+        self.client.post("/schedule/stream", data={"lookahead": "2"})
+        queue = storage.load_schedule()
+        self.assertEqual(queue["lookahead"], 2)
+        self.assertEqual(len(queue["list"]), 2)
+
+        top = queue["list"][0]
+        self.client.post("/submit_match", data={
+            "wc": wc, "red": top["red"], "white": top["white"], "result": "Draw", "popFromSchedule": "1",
+        })
+        refilled = storage.load_schedule()["list"]
+        self.assertEqual(len(refilled), 2)
+        self.assertEqual(refilled[0], queue["list"][1])
+        fought = {top["red"], top["white"]}
+        self.assertFalse(fought & {refilled[1]["red"], refilled[1]["white"]})
+
+    def test_rolling_schedule_tops_up_after_presence_delete_and_undo(self):
+        wc = self._add_robots("Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf", "Hotel")
+        self.client.post("/schedule/stream", data={"lookahead": "3"})
+
+        def queue():
+            return [(card["red"], card["white"]) for card in storage.load_schedule()["list"]]
+
+        absent = queue()[1][0]
+        self.client.post("/robot/presence", data={"wc": wc, "name": absent, "present": "0"})
+        self.assertEqual(len(queue()), 3)
+        self.assertNotIn(absent, {name for card in queue() for name in card})
+
+        deleted = queue()[2][1]
+        self.client.post("/robot/delete", data={"wc": wc, "name": deleted})
+        self.assertEqual(len(queue()), 3)
+        self.assertNotIn(deleted, {name for card in queue() for name in card})
+
+        red, white = queue()[0]
+        self.client.post("/submit_match", data={"wc": wc, "red": red, "white": white, "result": "Draw", "popFromSchedule": "1"})
+        self.client.post("/undo", data={"wc": wc})
+        self.assertEqual(len(queue()), 3)
+
+    def test_save_settings_can_replay_history_with_new_k(self):
+        wc = self._add_robots()
+        for result in ("Red wins JD", "White wins KO", "Red wins KO"):
+            self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": result})
+        before = storage.view_db(wc)
+        self.assertEqual(bot_app.replay_db(before, 32, 1.10, dry_run=True)["matches"], [])
+
+        preview = self.client.get(f"/api/replay/{wc}?k=64").get_json()
+        self.assertTrue(preview["dry_run"])
+        self.assertEqual(len(preview["matches"]), 3)
+        self.assertEqual(preview["matches"][0]["after"]["change_red"], 32)
+        self.assertEqual(storage.view_db(wc)["history"][0]["change_red"], 16)
+
+        self.client.post("/save_settings", data={"wc": wc, "k": "64", "ko": "1.1", "replay": "1"})
+        after = storage.view_db(wc)
+        self.assertEqual([m["change_red"] for m in after["history"]], [m["after"]["change_red"] for m in preview["matches"]])
+        self.assertEqual(after["robots"]["Alpha"]["rating"], after["history"][-1]["new_rating_red"])
+        self.assertEqual(after["robots"]["Bravo"]["matches"][0]["change_white"], -32)
+
+    def test_schedule_what_if_covers_every_result_and_is_cached(self):
+        wc = self._add_robots(ratings={"Alpha": 1100})
+        self._schedule(wc, ("Alpha", "Bravo"), ("Alpha", "Ghost"))
+
+        response = self.client.get("/api/schedule/what_if")
+        cards = response.get_json()["cards"]
+        self.assertIsNone(cards[1])
+        swing = cards[0]
+        self.assertAlmostEqual(swing["expected_red"], bot_app.what_if(1100, 1000, 0, 0)["expected_red"])
+        self.assertEqual(set(swing["results"]), bot_app.VALID_RESULTS)
+        red_ko = swing["results"]["Red wins KO"]
+        self.assertEqual((red_ko["new_rating_red"], red_ko["new_rating_white"]), bot_app.match_ratings(1100, 1000, "Red wins KO", 0, 0))
+        self.assertIs(bot_app.schedule_what_if(), bot_app.schedule_what_if())
+        self.assertEqual(self.client.get("/api/schedule/what_if", headers={"If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+        self.client.post("/submit_match", data={"wc": wc, "red": "Alpha", "white": "Bravo", "result": "Draw"})
+        self.assertNotEqual(bot_app.schedule_what_if()[0]["rating_red"], 1100)
+        self.assertEqual(self.client.get("/overlay").get_json()["what_if"]["red"], "Alpha")
+
+    def test_judge_history_pages_reach_into_the_archive(self):
+        wc = bot_app.WEIGHT_CLASSES[0]
+        total = storage.JUDGING_HISTORY_WINDOW + 10
+        history = [
+            {"match_id": f"j{i}", "weight_class": wc, "red": "Alpha", "white": "Bravo",
+             "created_at": 1000 + i, "completed_at": 1000 + i, "judges": {}}
+            for i in range(total, 0, -1)
+        ]
+        storage.update_judging_state(lambda s: dict(s, history=history))
+        self.assertEqual(len(storage.load_judging_state()["history"]), storage.JUDGING_HISTORY_WINDOW)
+
+        pages = [self.client.get(f"/api/judge/history?page={n}&per_page=20").get_json() for n in (1, 2)]
+        self.assertTrue(pages[0]["has_more"])
+        self.assertFalse(pages[1]["has_more"])
+        ids = [entry["match_id"] for page in pages for entry in page["history"]]
+        self.assertEqual(ids, [f"j{i}" for i in range(total, 0, -1)])
+
+        response = self.client.post("/schedule/judge_history/update", data={
+            "match_id": "j1", "judge_id": "1", "judge_name": "Late", "damage": "5", "aggression": "3", "control": "3",
+        })
+        self.assertEqual(response.status_code, 302)
+        oldest = self.client.get("/api/judge/history?page=2&per_page=20").get_json()["history"][-1]
+        self.assertEqual(oldest["match_id"], "j1")
+        self.assertEqual([card["judge_name"] for card in oldest["judges"]], ["Late"])
+        self.assertIn(b"Older fights", self.client.get("/judge/1").data)
+
+    def test_stamped_matches_skip_renormalization_unless_forced(self):
+        wc = bot_app.WEIGHT_CLASSES[0]
+        legacy = {"match_id": "old", "weight_class": wc, "red": "Alpha", "white": "Bravo", "completed_at": 1000,
+                  "judges": {"1": {"judge_id": 1, "sliders": {"damage": 8, "aggression": 5, "control": 6}}}}
+        storage.update_judging_state(lambda s: dict(s, history=[legacy]))
+
+        self.assertEqual(judging.migrate_judging_state()["history"], 1)
+        entry = storage.load_judging_state()["history"][0]
+        self.assertTrue(judging.is_normalized(entry))
+        self.assertEqual(entry["summary"]["winner"], "red")
+        self.assertEqual(judging.migrate_judging_state(), {"current": 0, "history": 0, "archive": 0})
+
+        with mock.patch.object(judging, "create_judge_record", side_effect=AssertionError("re-normalized")):
+            self.assertEqual(judging.normalize_match(entry), (entry, False))
+            self.client.get("/overlay")
+
+        # Hand edits keep the stamp; migrate --force rebuilds records and summaries from the sliders.
+        def hand_edit(state):
+            state["history"][0]["judges"]["1"]["sliders"] = {"damage": 0, "aggression": 0, "control": 0}
+            state["history"][0]["summary"]["headline"] = "edited"
+        storage.update_judging_state(hand_edit)
+        self.assertEqual(judging.migrate_judging_state()["history"], 0)
+        self.assertEqual(judging.migrate_judging_state(force=True)["history"], 1)
+        entry = storage.load_judging_state()["history"][0]
+        self.assertEqual(entry["summary"]["winner"], "white")
+        self.assertNotEqual(entry["summary"]["headline"], "edited")
+
+    def test_overlay_serves_a_snapshot_until_its_documents_change(self):
+        wc, other = self._add_robots(), bot_app.WEIGHT_CLASSES[1]
+        self._schedule(wc, ("Alpha", "Bravo"))
+
+        first = self.client.get("/overlay")
+        self.assertEqual(first.get_json()["red"]["name"], "Alpha")
+        etag = first.headers["ETag"]
+        with mock.patch.object(bot_app, "build_overlay_payload", side_effect=AssertionError("rebuilt")):
+            self.assertEqual(self.client.get("/overlay", headers={"If-None-Match": etag}).status_code, 304)
+            # Another class's records are not part of this overlay.
+            other_db = storage.load_db(other)
+            other_db["robots"]["Zulu"] = {"rating": 1000, "matches": []}
+            storage.save_db(other, other_db)
+            self.assertEqual(self.client.get("/overlay").headers["ETag"], etag)
+            # A second worker picks the snapshot up from disk.
+            bot_app._overlay_snapshot.clear()
+            self.assertEqual(self.client.get("/overlay").headers["ETag"], etag)
+
+        db = storage.load_db(wc)
+        db["robots"]["Alpha"]["rating"] = 1200
+        storage.save_db(wc, db)
+        changed = self.client.get("/overlay", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()["red"]["rating"], 1200)
+
+class SQLiteAppRoutesTestCase(AppRoutesTestCase):
+    """Run the same route tests against the SQLite storage backend."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(storage, "STORAGE_BACKEND", "sqlite")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
 
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,9 @@
+import concurrent.futures.process
+import time
+
+import pytest
+
+import elo
 import schedule_engine
 
 
@@ -38,25 +44,25 @@ def test_has_unscheduled_fresh_opponent_recognizes_available_pair():
                 'Charlie': {'present': True, 'rating': 980},
                 'Delta': {'present': True, 'rating': 990},
             },
-            "history": [],
+            "history": [
+                {"red_corner": "Alpha", "white_corner": "Bravo"},
+                {"red_corner": "Alpha", "white_corner": "Charlie"},
+            ],
         }
     }
 
-    calls = {"count": 0}
+    present = schedule_engine.present_by_class(db)
+    hist = schedule_engine.build_history_counts(db)
+    tonight = {("feather", name): 0 for name in present["feather"]}
 
-    def fake_load_all():
-        calls["count"] += 1
-        return sample_db
+    assert schedule_engine.has_unscheduled_fresh_opponent(
+        "feather", "Alpha", present, hist, tonight, set(), 1
+    )
 
-    monkeypatch.setattr(schedule_engine, "_load_all_dbs", fake_load_all)
-
-    schedule = schedule_engine.generate(seed=1)
-
-    assert calls["count"] == 1
-    assert len(schedule) == 1
-    match = schedule[0]
-    assert match["weight_class"] == "feather"
-    assert {match["red"], match["white"]} == {"Alpha", "Bravo"}
+    tonight[("feather", "Delta")] = 1
+    assert not schedule_engine.has_unscheduled_fresh_opponent(
+        "feather", "Alpha", present, hist, tonight, set(), 1
+    )
 
 
 def test_generate_avoids_history_and_repeats():
@@ -110,3 +116,338 @@ def test_generate_enforces_cooldown_spacing():
 
     assert len({frozenset((m["red"], m["white"])) for m in schedule}) == len(schedule)
     assert len({m["red"] for m in schedule}.union({m["white"] for m in schedule})) == 8
+
+
+def test_generate_large_class_is_seeded_and_fills_every_robot():
+    db = {
+        "heavy": {
+            "robots": {f"Bot{i:02d}": {"present": True} for i in range(40)},
+            "history": [],
+        }
+    }
+
+    first = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=7)
+    second = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=7)
+
+    assert first == second
+    assert len(first) == 60
+    appearances = {}
+    for match in first:
+        for robot in (match["red"], match["white"]):
+            appearances[robot] = appearances.get(robot, 0) + 1
+    assert set(appearances.values()) == {3}
+
+
+def test_matching_strategy_covers_odd_roster():
+    db = {
+        "feather": {
+            "robots": {name: {"present": True, "rating": 1000 + 10 * i} for i, name in enumerate("ABCDE")},
+            "history": [],
+        }
+    }
+
+    schedule = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=1, strategy="matching")
+
+    appearances = {}
+    for match in schedule:
+        for robot in (match["red"], match["white"]):
+            appearances[robot] = appearances.get(robot, 0) + 1
+    assert appearances == {name: 2 for name in "ABCDE"}
+    assert len({frozenset((m["red"], m["white"])) for m in schedule}) == len(schedule)
+
+
+def test_matching_strategy_prefers_fresh_pairs_and_close_ratings():
+    db = {
+        "feather": {
+            "robots": {
+                "Alpha": {"present": True, "rating": 1000},
+                "Bravo": {"present": True, "rating": 1010},
+                "Charlie": {"present": True, "rating": 1400},
+                "Delta": {"present": True, "rating": 1390},
+            },
+            "history": [{"red_corner": "Charlie", "white_corner": "Delta"}],
+        }
+    }
+
+    schedule = schedule_engine.generate(db_by_class=db, seed=4, strategy="matching")
+    pairs = {frozenset((m["red"], m["white"])) for m in schedule}
+    assert len(pairs) == 2
+    assert frozenset({"Charlie", "Delta"}) not in pairs
+
+    db["feather"]["history"] = []
+    schedule = schedule_engine.generate(db_by_class=db, seed=4, strategy="matching")
+    pairs = {frozenset((m["red"], m["white"])) for m in schedule}
+    assert pairs == {frozenset({"Alpha", "Bravo"}), frozenset({"Charlie", "Delta"})}
+
+
+def test_generate_rejects_unknown_strategy():
+    with pytest.raises(ValueError):
+        schedule_engine.generate(db_by_class={}, strategy="bogus")
+
+
+def test_parallel_search_is_reproducible_across_worker_counts(monkeypatch):
+    db = {
+        "feather": {
+            "robots": {f"Bot{i:02d}": {"present": True} for i in range(9)},
+            "history": [{"red_corner": "Bot00", "white_corner": "Bot01"}],
+        }
+    }
+
+    pooled = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=11, workers=2)
+    inline = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=11, workers=1, time_budget=30)
+    assert pooled == inline
+
+    # With an unreachable ceiling every attempt runs, most of them in the pool.
+    monkeypatch.setattr(schedule_engine, "_max_schedule_length", lambda problem, desired: 10**6)
+    pooled = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=11, workers=2)
+    assert pooled == schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=11, workers=1, time_budget=30)
+    assert schedule_engine._shared_pool(2) is schedule_engine._shared_pool(1)  # one pool, reused
+
+
+def test_parallel_search_stops_at_the_first_full_length_attempt():
+    db = {"feather": {"robots": {f"Bot{i:02d}": {"present": True} for i in range(60)}, "history": []}}
+
+    started = time.monotonic()
+    serial = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=5, workers=1, time_budget=30)
+    serial_time = time.monotonic() - started
+    started = time.monotonic()
+    pooled = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=5, workers=4)
+    pooled_time = time.monotonic() - started
+    started = time.monotonic()
+    budgeted = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=5, workers=4, time_budget=5)
+    budgeted_time = time.monotonic() - started
+
+    assert len(serial) == 90
+    assert pooled == serial == budgeted
+    assert pooled_time < 2 * serial_time + 0.5
+    assert budgeted_time < 2 * serial_time + 0.5  # nowhere near the 5 s budget
+
+
+def test_broken_pool_falls_back_to_the_serial_search(monkeypatch):
+    db = {"feather": {"robots": {f"Bot{i:02d}": {"present": True} for i in range(9)}, "history": []}}
+    monkeypatch.setattr(schedule_engine, "_max_schedule_length", lambda problem, desired: 10**6)
+    expected = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=8, workers=1, time_budget=30)
+
+    class BrokenPool:
+        shut_down = False
+
+        def submit(self, *args, **kwargs):
+            raise concurrent.futures.process.BrokenProcessPool("worker died")
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            self.shut_down = True
+
+    pool = BrokenPool()
+    monkeypatch.setattr(schedule_engine, "_shared_pool", lambda workers: pool)
+
+    assert schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=8, workers=2) == expected
+    assert pool.shut_down
+
+
+def test_time_budget_is_a_hard_stop(monkeypatch):
+    db = {"feather": {"robots": {f"Bot{i:02d}": {"present": True} for i in range(12)}, "history": []}}
+    real_attempt = schedule_engine._run_single_attempt
+    calls = []
+
+    def slow_attempt(problem, desired_per_robot, deadline=None):
+        calls.append(1)
+        schedule = real_attempt(problem, desired_per_robot)
+        time.sleep(0.05)
+        return schedule
+
+    monkeypatch.setattr(schedule_engine, "_run_single_attempt", slow_attempt)
+    monkeypatch.setattr(schedule_engine, "_max_schedule_length", lambda problem, desired: 10**6)
+
+    for workers in (1, 2):
+        calls.clear()
+        started = time.monotonic()
+        schedule = schedule_engine.generate(desired_per_robot=2, db_by_class=db, seed=3, workers=workers, time_budget=0.01)
+        assert schedule
+        # Attempt 0 runs here; everything after it sees the spent budget and stops at once.
+        assert len(calls) == 1
+        assert time.monotonic() - started < 1.0
+    assert schedule_engine._run_attempt_chunk(None, 2, 0, 0, 5, deadline=time.monotonic()) is None
+
+
+def test_benchmark_case_is_seeded_and_reports_quality():
+    import bench_schedule
+
+    assert bench_schedule.synthetic_db(12, 0.4, seed=5) == bench_schedule.synthetic_db(12, 0.4, seed=5)
+
+    result = bench_schedule.run_case(12, 0.4, 2, "matching", seed=5, measure_memory=False)
+    again = bench_schedule.run_case(12, 0.4, 2, "matching", seed=5, measure_memory=False)
+
+    assert {k: v for k, v in result.items() if k != "wall_seconds"} == {k: v for k, v in again.items() if k != "wall_seconds"}
+    assert result["present_robots"] == 12
+    assert 0.0 <= result["coverage"] <= 1.0
+    assert result["matches"] <= 12
+
+
+def test_schedule_quality_counts_rematches_and_cooldown():
+    import bench_schedule
+
+    db = {
+        "feather": {
+            "robots": {name: {"present": True} for name in ("Alpha", "Bravo", "Charlie")},
+            "history": [{"red_corner": "Alpha", "white_corner": "Bravo"}],
+        }
+    }
+    schedule = [
+        {"weight_class": "feather", "red": "Bravo", "white": "Alpha"},
+        {"weight_class": "feather", "red": "Alpha", "white": "Charlie"},
+    ]
+
+    quality = bench_schedule.schedule_quality(schedule, db, desired_per_robot=1)
+
+    assert quality["rematches"] == 1
+    assert quality["cooldown_violations"] == 1
+    assert quality["coverage"] == 1.0
+
+
+def _repair_db(present):
+    names = ["Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf", "Hotel", "India", "Juliet"]
+    return {
+        "feather": {
+            "robots": {name: {"present": name in present, "rating": 1000} for name in names},
+            "history": [{"red_corner": "Alpha", "white_corner": "India"}],
+        }
+    }
+
+
+def test_repair_replaces_absent_robot_in_place():
+    schedule = [
+        {"weight_class": "feather", "red": "Alpha", "white": "Bravo", "note": "keep"},
+        {"weight_class": "feather", "red": "Charlie", "white": "Delta"},
+        {"weight_class": "feather", "red": "Echo", "white": "Foxtrot"},
+        {"weight_class": "feather", "red": "Golf", "white": "Hotel"},
+    ]
+    db = _repair_db({"Alpha", "Charlie", "Delta", "Echo", "Foxtrot", "Golf", "Hotel", "India", "Juliet"})
+
+    repaired = schedule_engine.repair(schedule, [("feather", "Bravo")], db_by_class=db)
+
+    assert len(schedule) == 4 and schedule[0]["white"] == "Bravo"
+    assert repaired[0] == {"weight_class": "feather", "red": "Alpha", "white": "Juliet"}
+    assert repaired[1:] == schedule[1:]
+    assert all(a is b for a, b in zip(repaired[1:], schedule[1:]))
+
+
+def test_repair_schedules_new_arrival_respecting_cooldown():
+    schedule = [
+        {"weight_class": "feather", "red": "Alpha", "white": "Bravo"},
+        {"weight_class": "feather", "red": "Charlie", "white": "Delta"},
+        {"weight_class": "feather", "red": "Echo", "white": "Foxtrot"},
+        {"weight_class": "feather", "red": "Golf", "white": "Hotel"},
+    ]
+    db = _repair_db({"Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf", "Hotel", "Juliet"})
+
+    repaired = schedule_engine.repair(schedule, [("feather", "Juliet")], db_by_class=db)
+
+    assert repaired[:4] == schedule
+    added = repaired[4:]
+    assert len(added) == 1 and "Juliet" in (added[0]["red"], added[0]["white"])
+    assert {added[0]["red"], added[0]["white"]} & {"Alpha", "Bravo"}
+
+
+def test_repair_introduces_no_cooldown_clashes():
+    names = [f"Bot{i:02d}" for i in range(16)]
+    db = {"feather": {"robots": {name: {"present": True, "rating": 1000 + 7 * i} for i, name in enumerate(names)}, "history": []}}
+    schedule = schedule_engine.generate(desired_per_robot=3, db_by_class=db, seed=1)
+    keys = lambda cards: [(card["weight_class"], card["red"], card["white"]) for card in cards]
+    assert schedule_engine._cooldown_clashes(keys(schedule)) == []
+
+    for gone in ("Bot03", "Bot05", "Bot11"):
+        db["feather"]["robots"][gone]["present"] = False
+        repaired = schedule_engine.repair(schedule, [("feather", gone)], db_by_class=db)
+        db["feather"]["robots"][gone]["present"] = True
+
+        assert schedule_engine._cooldown_clashes(keys(repaired)) == []
+        assert repaired[0] is schedule[0] or gone in (schedule[0]["red"], schedule[0]["white"])
+        assert gone not in {name for card in repaired for name in (card["red"], card["white"])}
+        kept = [card for card in schedule if gone not in (card["red"], card["white"])]
+        assert all(any(card is other for other in repaired) for card in kept)
+
+
+def test_repair_leaves_schedule_alone_when_nothing_relevant_changed():
+    schedule = [{"weight_class": "feather", "red": "Alpha", "white": "Bravo"}]
+    db = _repair_db({"Alpha", "Bravo"})
+
+    assert schedule_engine.repair(schedule, [("feather", "Charlie")], db_by_class=db) == schedule
+    assert schedule_engine.repair([], [], db_by_class=db) == []
+
+
+def test_stream_reads_live_db_for_each_card(monkeypatch):
+    db = {
+        "feather": {
+            "robots": {name: {"present": True, "rating": 1000} for name in ("Alpha", "Bravo", "Charlie", "Delta")},
+            "history": [{"match_id": 1, "timestamp": 50, "red_corner": "Alpha", "white_corner": "Bravo"}],
+        }
+    }
+    monkeypatch.setattr(schedule_engine, "_load_all_dbs", lambda: db)
+
+    cards = schedule_engine.stream(since=10)
+    first = next(cards)
+    assert {first["red"], first["white"]} == {"Charlie", "Delta"}
+
+    db["feather"]["robots"]["Charlie"]["present"] = False
+    db["feather"]["robots"]["Echo"] = {"present": True, "rating": 1000}
+    second = next(cards)
+    assert {second["red"], second["white"]} == {"Echo", "Alpha"}
+
+
+def test_next_cards_extends_queue_without_rematches():
+    import bench_schedule
+
+    db = {
+        "feather": {
+            "robots": {f"Bot{i}": {"present": True} for i in range(10)},
+            "history": [],
+        }
+    }
+    queue = schedule_engine.next_cards([], 3, db_by_class=db)
+    queue += schedule_engine.next_cards(queue, 12, db_by_class=db)
+
+    pairs = [frozenset((card["red"], card["white"])) for card in queue]
+    assert len(queue) == 15 and len(set(pairs)) == 15
+    assert bench_schedule.schedule_quality(queue, db, desired_per_robot=3)["cooldown_violations"] == 0
+
+
+def test_score_schedule_reports_weighted_terms():
+    db = {
+        "feather": {
+            "robots": {
+                "Alpha": {"present": True, "rating": 1000},
+                "Bravo": {"present": True, "rating": 1000},
+                "Charlie": {"present": True, "rating": 1400},
+            },
+            "history": [{"red_corner": "Alpha", "white_corner": "Bravo"}],
+            "settings": {"schedule_weights": {"rematch": 2}},
+        }
+    }
+    schedule = [
+        {"weight_class": "feather", "red": "Alpha", "white": "Bravo"},
+        {"weight_class": "feather", "red": "Charlie", "white": "Alpha"},
+    ]
+
+    score = schedule_engine.score_schedule(schedule, db)
+
+    assert score["terms"]["rematch"] == 2.0
+    assert score["terms"]["cooldown"] == 5.0 * 3  # Alpha back after one card: three slots short
+    assert score["terms"]["interleave"] == 0.5
+    assert score["terms"]["rating"] == pytest.approx(abs(2 * elo.get_expected(1400, 1000) - 1), abs=1e-4)
+    assert score["total"] == pytest.approx(sum(score["terms"].values()))
+    assert schedule_engine.score_schedule(schedule, db, weights={"rematch": 0})["terms"]["rematch"] == 0.0
+
+
+def test_greedy_prefers_close_ratings_when_weighted():
+    ratings = {"Alpha": 1000, "Bravo": 1600, "Charlie": 1010, "Delta": 1590}
+    db = {
+        "feather": {
+            "robots": {name: {"present": True, "rating": rating} for name, rating in ratings.items()},
+            "history": [],
+        }
+    }
+
+    for seed in range(5):
+        schedule = schedule_engine.generate(db_by_class=db, seed=seed, weights={"rating": 10})
+        pairs = {frozenset((card["red"], card["white"])) for card in schedule}
+        assert pairs == {frozenset({"Alpha", "Charlie"}), frozenset({"Bravo", "Delta"})}
@@ -0,0 +1,384 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import storage
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        # Create an isolated temp directory for all storage files.
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tempdir.cleanup)
+
+        patched_db_files = {
+            wc: os.path.join(self._tempdir.name, f"{wc.lower()}_elo.json")
+            for wc in storage.DB_FILES
+        }
+        self._patches = [
+            mock.patch.object(storage, "DATA_DIR", self._tempdir.name),
+            mock.patch.object(storage, "SCHEDULE_FP", os.path.join(self._tempdir.name, "schedule.json")),
+            mock.patch.object(storage, "JUDGING_FP", os.path.join(self._tempdir.name, "judging.json")),
+            mock.patch.object(storage, "JUDGING_LOCK_FP", os.path.join(self._tempdir.name, "judging.lock")),
+            mock.patch.object(storage, "DB_FILES", patched_db_files),
+        ]
+        for p in self._patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        storage.ensure_dirs()
+        self.wc = next(iter(storage.DB_FILES))
+
+    def _sample_db(self):
+        db = storage._blank_db()
+        db["robots"]["Alpha"] = {"rating": 1000, "matches": [], "present": True}
+        return db
+
+    def test_view_db_is_cached_and_read_only(self):
+        storage.save_db(self.wc, self._sample_db())
+        first = storage.view_db(self.wc)
+        second = storage.view_db(self.wc)
+        self.assertIs(first, second)
+        with self.assertRaises(TypeError):
+            first["robots"]["Beta"] = {}
+        with self.assertRaises(TypeError):
+            first["robots"]["Alpha"]["matches"].append({})
+
+    def test_load_db_returns_private_mutable_copy(self):
+        storage.save_db(self.wc, self._sample_db())
+        db = storage.load_db(self.wc)
+        db["robots"]["Alpha"]["rating"] = 1234
+        self.assertEqual(storage.view_db(self.wc)["robots"]["Alpha"]["rating"], 1000)
+
+    def test_view_db_picks_up_external_writes(self):
+        storage.save_db(self.wc, self._sample_db())
+        self.assertIn("Alpha", storage.view_db(self.wc)["robots"])
+
+        # Simulate another worker replacing the file behind this process's back.
+        external = self._sample_db()
+        external["robots"]["Beta"] = {"rating": 1100, "matches": []}
+        tmp = storage.DB_FILES[self.wc] + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(external, f)
+        os.replace(tmp, storage.DB_FILES[self.wc])
+
+        self.assertIn("Beta", storage.view_db(self.wc)["robots"])
+
+    def _match_entry(self, match_id, red="Alpha", white="Beta"):
+        return {
+            "match_id": match_id, "timestamp": 1700000000 + match_id,
+            "red_corner": red, "white_corner": white, "result": "Red wins KO",
+            "old_rating_red": 1000, "old_rating_white": 1000,
+            "new_rating_red": 1020, "new_rating_white": 980,
+            "change_red": 20, "change_white": -20,
+        }
+
+    def test_journal_mode_appends_and_replays(self):
+        with mock.patch.object(storage, "STORAGE_BACKEND", "journal"):
+            base = self._sample_db()
+            base["robots"]["Beta"] = {"rating": 1000, "matches": [], "present": False}
+            storage.save_db(self.wc, base)
+            snapshot_size = os.path.getsize(storage.DB_FILES[self.wc])
+
+            db = storage.load_db(self.wc)
+            storage.commit_db_change(self.wc, db, {"op": "match", "entry": self._match_entry(1)})
+            storage.commit_db_change(self.wc, db, {"op": "presence", "robot": "Beta", "present": True})
+
+            # The snapshot is untouched; the change lives in the journal only.
+            self.assertEqual(os.path.getsize(storage.DB_FILES[self.wc]), snapshot_size)
+            storage._DB_CACHE.clear()
+            replayed = storage.load_db(self.wc)
+            self.assertEqual(replayed["robots"]["Alpha"]["rating"], 1020)
+            self.assertEqual(len(replayed["robots"]["Beta"]["matches"]), 1)
+            self.assertTrue(replayed["robots"]["Beta"]["present"])
+            self.assertEqual(replayed["next_match_id"], 2)
+
+            removed = storage.commit_db_change(self.wc, replayed, {"op": "undo", "match_id": 1})
+            self.assertEqual(removed["match_id"], 1)
+            after_undo = storage.view_db(self.wc)
+            self.assertEqual(after_undo["history"], [])
+            self.assertEqual(after_undo["robots"]["Alpha"]["rating"], 1000)
+
+            storage.compact_journal(self.wc)
+            self.assertEqual(os.path.getsize(storage.DB_FILES[self.wc] + ".journal"), 0)
+            storage._DB_CACHE.clear()
+            compacted = storage.view_db(self.wc)
+            self.assertEqual(compacted["robots"]["Alpha"]["rating"], 1000)
+            self.assertTrue(compacted["robots"]["Beta"]["present"])
+
+    def test_format_1_db_is_migrated_to_match_ids(self):
+        entry = self._match_entry(1)
+        legacy = self._sample_db()
+        legacy.pop("format_version")
+        legacy["robots"]["Beta"] = {"rating": 980, "matches": [dict(entry)]}
+        legacy["robots"]["Alpha"]["matches"] = [dict(entry)]
+        legacy["history"] = [entry]
+        with open(storage.DB_FILES[self.wc], "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+
+        db = storage.load_db(self.wc)
+        self.assertIs(db["robots"]["Alpha"]["matches"][0], db["history"][0])
+        storage.save_db(self.wc, db)
+
+        with open(storage.DB_FILES[self.wc], "r", encoding="utf-8") as f:
+            on_disk = json.load(f)
+        self.assertEqual(on_disk["format_version"], storage.DB_FORMAT_VERSION)
+        self.assertEqual(on_disk["robots"]["Beta"]["match_ids"], [1])
+        self.assertNotIn("matches", on_disk["robots"]["Beta"])
+        storage._DB_CACHE.clear()
+        self.assertEqual(storage.view_db(self.wc)["robots"]["Beta"]["matches"][0]["result"], "Red wins KO")
+
+    def test_format_1_migration_keeps_fights_against_deleted_robots(self):
+        kept, orphan = self._match_entry(1), self._match_entry(2, red="Alpha", white="Gone")
+        legacy = self._sample_db()
+        legacy.pop("format_version")
+        legacy["robots"]["Beta"] = {"rating": 980, "matches": [dict(kept)]}
+        # Deleting "Gone" used to strip its fights from history but not from Alpha's copies.
+        legacy["robots"]["Alpha"]["matches"] = [dict(kept), dict(orphan)]
+        legacy["history"] = [kept]
+        with open(storage.DB_FILES[self.wc], "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+
+        db = storage.load_db(self.wc)
+        self.assertEqual([m["match_id"] for m in db["history"]], [1, 2])
+        alpha = db["robots"]["Alpha"]
+        self.assertEqual([m["match_id"] for m in alpha["matches"]], [1, 2])
+        self.assertEqual(alpha["stats"]["matches"], 2)
+        self.assertEqual(alpha["stats"]["ko_wins"], 2)
+
+        storage.save_db(self.wc, db)
+        storage._DB_CACHE.clear()
+        self.assertEqual(storage.view_db(self.wc)["robots"]["Alpha"]["stats"]["matches"], 2)
+
+    def test_sqlite_import_round_trips_documents(self):
+        entry = self._match_entry(1)
+        db = self._sample_db()
+        db["robots"]["Beta"] = {"rating": 980, "matches": []}
+        storage.apply_db_record(db, {"op": "match", "entry": entry})
+        storage.save_db(self.wc, db)
+        storage.save_schedule({"list": [{"weight_class": self.wc, "red": "Alpha", "white": "Beta"}]})
+        storage.update_judging_state(lambda s: dict(s, current={"match_id": "m1", "judges": {"1": {"winner": "red"}}}))
+
+        with mock.patch.object(storage, "STORAGE_BACKEND", "sqlite"):
+            storage.import_json_to_sqlite()
+            loaded = storage.load_db(self.wc)
+            self.assertEqual(loaded["robots"]["Alpha"]["rating"], 1020)
+            self.assertIs(loaded["robots"]["Beta"]["matches"][0], loaded["history"][0])
+            self.assertEqual(storage.load_schedule()["list"][0]["red"], "Alpha")
+            state = storage.load_judging_state()
+            self.assertEqual(state["current"]["judges"]["1"]["winner"], "red")
+
+            before = state["_meta"]["version"]
+            storage.update_judging_state(lambda s: s)
+            self.assertEqual(storage.load_judging_state()["_meta"]["version"], before)
+
+            removed = storage.commit_db_change(self.wc, loaded, {"op": "undo", "match_id": 1})
+            self.assertEqual(removed["match_id"], 1)
+            self.assertEqual(storage.view_db(self.wc)["history"], [])
+            self.assertEqual(storage.view_db(self.wc)["robots"]["Alpha"]["rating"], 1000)
+
+    def test_robot_stats_are_maintained_incrementally(self):
+        db = self._sample_db()
+        db["robots"]["Beta"] = {"rating": 1000, "matches": []}
+        storage.save_db(self.wc, db)
+        db = storage.load_db(self.wc)
+        storage.commit_db_change(self.wc, db, {"op": "match", "entry": self._match_entry(1)})
+        draw = dict(self._match_entry(2, red="Beta", white="Alpha"), result="Draw")
+        storage.commit_db_change(self.wc, db, {"op": "match", "entry": draw})
+
+        alpha = storage.view_db(self.wc)["robots"]["Alpha"]
+        self.assertEqual(alpha["stats"]["ko_wins"], 1)
+        self.assertEqual(alpha["stats"]["draws"], 1)
+        self.assertEqual(alpha["stats"]["matches"], 2)
+        self.assertEqual(alpha["stats"]["last_match_ts"], draw["timestamp"])
+
+        storage.commit_db_change(self.wc, db, {"op": "undo", "match_id": 2})
+        view = storage.view_db(self.wc)
+        rebuilt = storage.rebuild_robot_stats(storage.load_db(self.wc))
+        for name in ("Alpha", "Beta"):
+            self.assertEqual(view["robots"][name]["stats"], rebuilt["robots"][name]["stats"])
+        self.assertEqual(view["robots"]["Beta"]["stats"]["ko_losses"], 1)
+
+    def test_ko_index_tracks_submits_and_undo(self):
+        db = self._sample_db()
+        db["robots"]["Beta"] = {"rating": 1000, "matches": []}
+        storage.save_db(self.wc, db)
+        db = storage.load_db(self.wc)
+        storage.commit_db_change(self.wc, db, {"op": "match", "entry": self._match_entry(2)})
+        storage.commit_db_change(self.wc, db, {"op": "match", "entry": dict(self._match_entry(3), result="Draw")})
+        # Entered out of order: the index stays sorted by timestamp.
+        storage.commit_db_change(self.wc, db, {"op": "match", "entry": self._match_entry(1)})
+
+        view = storage.view_db(self.wc)
+        self.assertEqual([m["match_id"] for m in view["ko_results"]], [1, 2])
+        with open(storage.DB_FILES[self.wc], "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["ko_match_ids"], [1, 2])
+
+        storage.commit_db_change(self.wc, db, {"op": "undo", "match_id": 1})
+        self.assertEqual([m["match_id"] for m in storage.view_db(self.wc)["ko_results"]], [2])
+
+    def test_view_after_save_matches_a_fresh_reload(self):
+        db = self._sample_db()
+        db["robots"]["Beta"] = {"rating": 980, "matches": []}
+        del db["ko_results"]
+        entry = self._match_entry(1)
+        db["history"].append(entry)
+        for name in ("Alpha", "Beta"):
+            db["robots"][name]["matches"].append(entry)
+        storage.save_db(self.wc, db)
+
+        cached = storage.view_db(self.wc)
+        storage._DB_CACHE.clear()
+        self.assertEqual(cached, storage.view_db(self.wc))
+        self.assertEqual([m["match_id"] for m in cached["ko_results"]], [1])
+        self.assertEqual(cached["robots"]["Beta"]["stats"]["ko_losses"], 1)
+
+    def test_derive_from_view_builds_once_per_db_version(self):
+        storage.save_db(self.wc, self._sample_db())
+        builds = []
+
+        def build(view):
+            builds.append(view)
+            return sorted(view["robots"])
+
+        first = storage.derive_from_view(storage.view_db(self.wc), "test.names", build)
+        self.assertIs(storage.derive_from_view(storage.view_db(self.wc), "test.names", build), first)
+        self.assertEqual(len(builds), 1)
+
+        db = storage.load_db(self.wc)
+        db["robots"]["Beta"] = {"rating": 1000, "matches": []}
+        storage.save_db(self.wc, db)
+        self.assertEqual(storage.derive_from_view(storage.view_db(self.wc), "test.names", build), ["Alpha", "Beta"])
+        self.assertEqual(len(builds), 2)
+
+    def test_transaction_commits_every_document_at_the_end(self):
+        db = self._sample_db()
+        db["robots"]["Beta"] = {"rating": 1000, "matches": []}
+        storage.save_db(self.wc, db)
+        storage.save_schedule({"list": [{"weight_class": self.wc, "red": "Alpha", "white": "Beta"}]})
+
+        for backend in ("json", "journal"):
+            with mock.patch.object(storage, "STORAGE_BACKEND", backend):
+                with self.assertRaises(RuntimeError):
+                    with storage.transaction([self.wc], schedule=True, judging=True) as txn:
+                        txn.commit_db_change(self.wc, {"op": "match", "entry": self._match_entry(1)})
+                        txn.schedule()["list"].pop(0)
+                        txn.save_schedule()
+                        txn.archive_judging([{"match_id": "m1", "completed_at": 1700000000}])
+                        raise RuntimeError("abort")
+                self.assertEqual(storage.view_db(self.wc)["history"], [])
+                self.assertEqual(len(storage.load_schedule()["list"]), 1)
+                self.assertEqual(list(storage.iter_judging_archive()), [])
+
+        with mock.patch.object(storage, "STORAGE_BACKEND", "journal"):
+            with storage.transaction([self.wc], schedule=True, judging=True) as txn:
+                txn.commit_db_change(self.wc, {"op": "match", "entry": self._match_entry(1)})
+                txn.schedule()["list"].pop(0)
+                txn.save_schedule()
+                txn.judging()["current"] = None
+                txn.save_judging()
+                with self.assertRaises(ValueError):
+                    txn.db(next(wc for wc in storage.DB_FILES if wc != self.wc))
+                # Nothing is visible to other readers until the block exits.
+                self.assertEqual(storage.view_db(self.wc)["history"], [])
+            storage._DB_CACHE.clear()
+            self.assertEqual(storage.view_db(self.wc)["robots"]["Alpha"]["rating"], 1020)
+            self.assertEqual(storage.load_schedule()["list"], [])
+
+    def test_update_judging_state_detects_nested_changes_and_serializes_once(self):
+        judged = {"match_id": "m1", "judges": {"1": {"winner": "red", "scores": [3, 2]}}}
+        storage.update_judging_state(lambda s: dict(s, history=[judged]))
+        version = storage.load_judging_state()["_meta"]["version"]
+
+        def read_only(state):
+            for match in state["history"]:
+                self.assertEqual(match["judges"]["1"]["scores"][0], 3)
+            return dict(state)
+
+        with mock.patch.object(storage.json, "dump", wraps=json.dump) as dump:
+            storage.update_judging_state(read_only)
+            self.assertEqual(dump.call_count, 0)
+            self.assertEqual(storage.load_judging_state()["_meta"]["version"], version)
+
+            storage.update_judging_state(lambda s: s["history"][0]["judges"]["1"]["scores"].append(1))
+            self.assertEqual(dump.call_count, 1)
+        state = storage.load_judging_state()
+        self.assertEqual(state["_meta"]["version"], version + 1)
+        self.assertEqual(state["history"][0]["judges"]["1"]["scores"], [3, 2, 1])
+
+        # Edits reached through a copied or concatenated list still land in the stored state.
+        def edit_through_copy(state):
+            state["history"].copy()[0]["judges"]["2"] = {"winner": "white"}
+
+        def edit_through_concat(state):
+            for match in state["history"] + []:
+                match["completed_at"] = 1700000000
+
+        for mutator in (edit_through_copy, edit_through_concat):
+            before = storage.load_judging_state()["_meta"]["version"]
+            storage.update_judging_state(mutator)
+            self.assertEqual(storage.load_judging_state()["_meta"]["version"], before + 1)
+        entry = storage.load_judging_state()["history"][0]
+        self.assertEqual(entry["judges"]["2"], {"winner": "white"})
+        self.assertEqual(entry["completed_at"], 1700000000)
+
+        storage.update_judging_state(lambda s: {**s, "current": None} if s["history"].pop() else s)
+        self.assertEqual(storage.load_judging_state()["history"], [])
+
+    def test_update_judging_state_copies_only_the_sections_it_touches(self):
+        history = [{"match_id": f"m{i}", "judges": {"1": {"winner": "red"}}} for i in range(5)]
+        storage.update_judging_state(lambda s: dict(s, history=history))
+        version = storage.load_judging_state()["_meta"]["version"]
+
+        def set_current(state):
+            state["current"] = {"match_id": "m9"}
+
+        def read_current(state):
+            self.assertEqual(state.get("current"), {"match_id": "m9"})
+
+        with mock.patch.object(storage, "_thaw", wraps=storage._thaw) as thaw:
+            storage.update_judging_state(set_current)
+            storage.update_judging_state(read_current)
+        self.assertFalse([c for c in thaw.call_args_list if c.args and c.args[0] == history])
+        state = storage.load_judging_state()
+        self.assertEqual(state["_meta"]["version"], version + 1)
+        self.assertEqual(state["current"], {"match_id": "m9"})
+        self.assertEqual(state["history"], history)
+
+    def test_judged_history_beyond_the_window_moves_to_the_archive(self):
+        window = storage.JUDGING_HISTORY_WINDOW
+        history = [{"match_id": f"m{i}", "completed_at": 1700000000 + i, "judges": {}} for i in range(window + 5, 0, -1)]
+        storage.update_judging_state(lambda s: dict(s, history=history))
+
+        hot = storage.load_judging_state()["history"]
+        self.assertEqual([m["match_id"] for m in hot], [f"m{i}" for i in range(window + 5, 5, -1)])
+        archived = list(storage.iter_judging_archive())
+        self.assertEqual([m["match_id"] for m in archived], ["m5", "m4", "m3", "m2", "m1"])
+
+        # Append-only: an edited match is re-archived and the newer line wins.
+        storage.archive_judging_entries([dict(archived[2], judges={"1": {"winner": "red"}})])
+        archived = list(storage.iter_judging_archive())
+        self.assertEqual(len(archived), 5)
+        self.assertEqual(archived[2]["judges"], {"1": {"winner": "red"}})
+
+    def test_wait_for_change_wakes_on_local_write(self):
+        since = storage.document_versions()
+        timer = threading.Timer(0.05, storage.save_schedule, args=({"list": []},))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+        current = storage.wait_for_change(since, timeout=5)
+        self.assertNotEqual(current, since)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_wait_for_change_times_out_without_writes(self):
+        since = storage.document_versions()
+        self.assertEqual(storage.wait_for_change(since, timeout=0.05), since)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()